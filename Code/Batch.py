@@ -0,0 +1,118 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy
+from MNA import MNA, topology_text
+from Ordering import orderings
+from Solvers import solvers
+
+
+# Solve many independent netlists in parallel without any GUI
+def netlist_files(paths):
+    # Expand directories and glob patterns into a sorted list of netlist files
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if os.path.isfile(os.path.join(path, name))]
+        else:
+            files += sorted(glob.glob(path))
+    return files
+
+
+def solve_file(job):
+    # Parse and solve one netlist, runs in a worker process
+    file_name, optimised, solver, ordering, reduce = job
+    result = {'file': file_name}
+    try:
+        start_time = time.perf_counter()
+        circuit = MNA(file_name, optimised, solver, ordering=ordering, reduce=reduce)
+        circuit.Parse_netlist()
+        # Circuits which cannot be solved are found before the matrices are built
+        problems = circuit.Check_topology()
+        if problems:
+            result['error'] = 'Topology: ' + topology_text(problems).replace('\n', '; ')
+            result['topology'] = [{'problem': problem, 'components': names} for problem, names in problems]
+            return result
+        parse_time = time.perf_counter()
+        solution = circuit.Solution()
+        solve_time = time.perf_counter()
+
+        # Node voltages, currents through voltage sources and currents and power of every component
+        result.update(solution.as_dict())
+        result['seconds'] = {'parse': parse_time - start_time, 'solve': solve_time - parse_time}
+        result['solver'] = circuit.solver_name
+        # Fill and time taken to order and factorise A
+        result['factorisation'] = circuit.factor_statistics
+        # Time taken by every stage of the solver
+        result['stages'] = circuit.stage_statistics
+        if reduce:
+            # Size of the circuit left after series and parallel resistors were reduced
+            result['reduction'] = circuit.reduction_statistics
+    except (OSError, ValueError, IndexError, numpy.linalg.LinAlgError) as error:
+        result['error'] = type(error).__name__ + ': ' + str(error)
+
+    return result
+
+
+def solve_files(files, output_file_name, processes=None, optimised=None, progress=sys.stderr, solver=None,
+                ordering=None, reduce=False):
+    # Solve every file in a pool of worker processes
+    # Results are written to a JSON Lines file as soon as each file is solved, in order of completion
+    jobs = [(file_name, optimised, solver, ordering, reduce) for file_name in files]
+    failed = 0
+    start_time = time.perf_counter()
+
+    with multiprocessing.Pool(processes) as pool, open(output_file_name, 'w') as output:
+        # Send files to workers in small chunks to keep the overhead per file low
+        chunk_size = max(1, min(64, len(jobs) // (4 * (processes or os.cpu_count() or 1))))
+        for count, result in enumerate(pool.imap_unordered(solve_file, jobs, chunk_size), 1):
+            output.write(json.dumps(result) + '\n')
+
+            # Progress and timings of each file
+            if 'error' in result:
+                failed += 1
+                status = result['error']
+            else:
+                status = 'parse {:.1f} ms, solve {:.1f} ms'.format(1000 * result['seconds']['parse'],
+                                                                   1000 * result['seconds']['solve'])
+            if progress is not None:
+                progress.write('[{}/{}] {}: {}\n'.format(count, len(jobs), result['file'], status))
+
+    elapsed = time.perf_counter() - start_time
+    if progress is not None:
+        progress.write('Solved {} files ({} failed) in {:.2f} s, {:.1f} files/s\n'.format(
+            len(jobs), failed, elapsed, len(jobs) / elapsed if elapsed > 0 else 0.0))
+    return failed
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Solve netlists in parallel and write results as JSON Lines.')
+    parser.add_argument('paths', nargs='+', help='netlist files, directories or glob patterns')
+    parser.add_argument('-o', '--output', default='results.jsonl', help='output file (default: results.jsonl)')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--dense', action='store_true', help='use dense matrices instead of sparse')
+    parser.add_argument('-s', '--solver', choices=sorted(solvers), default=None,
+                        help='solver to use (default: chosen from the size of each circuit)')
+    parser.add_argument('--ordering', choices=sorted(orderings), default=None,
+                        help='node ordering used before factorising (default: chosen with the solver)')
+    parser.add_argument('--reduce', action='store_true',
+                        help='replace series and parallel resistors by equivalent resistors before solving')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not show progress')
+    arguments = parser.parse_args(arguments)
+
+    files = netlist_files(arguments.paths)
+    if not files:
+        parser.error('no netlist files found')
+    failed = solve_files(files, arguments.output, arguments.processes, False if arguments.dense else None,
+                         None if arguments.quiet else sys.stderr, arguments.solver, arguments.ordering,
+                         arguments.reduce)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy
+from MNA import MNA
+from Solvers import solvers
+
+
+# Time every stage of the solver on synthetic netlists of chosen sizes and topologies
+# Results are written as JSON so runs of different versions can be compared with --compare
+
+# Stages of the solver in the order they run, each is timed on its own
+# Node names are mapped to integers while the netlist is parsed, so that time is part of 'parse'
+# A is built once in 'A_matrix', 'factorise' and 'solve' use that matrix
+stages = ('parse', 'A_matrix', 'z_matrix', 'factorise', 'solve')
+# Circuits with more nodes than this are not solved with dense matrices, a dense A would not fit in memory
+dense_node_limit = 5000
+
+
+def write_netlist(file_name, lines):
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def resistor_lines(high, low, values, first=1):
+    # Lines of resistors between numbered nodes
+    return ['R{} {} {} {:.6g}'.format(count, a, b, value)
+            for count, (a, b, value) in enumerate(zip(high.tolist(), low.tolist(), values.tolist()), first)]
+
+
+def chain(file_name, size, generator):
+    # Resistors in series like dc_circuit.txt, from a voltage source around to ground
+    nodes = numpy.arange(1, size + 1)
+    high = numpy.append(nodes[:-1], nodes[-1])
+    low = numpy.append(nodes[1:], 0)
+    write_netlist(file_name, ['V1 1 0 9'] + resistor_lines(high, low, generator.uniform(1, 100, size)))
+
+
+def grid_edges(shape):
+    # Edges between neighbours of a grid of nodes, numbered from 1
+    numbers = numpy.arange(1, int(numpy.prod(shape)) + 1).reshape(shape)
+    high, low = [], []
+    for axis in range(len(shape)):
+        first = [slice(None)] * len(shape)
+        second = [slice(None)] * len(shape)
+        first[axis] = slice(None, -1)
+        second[axis] = slice(1, None)
+        high.append(numbers[tuple(first)].ravel())
+        low.append(numbers[tuple(second)].ravel())
+    return numpy.concatenate(high), numpy.concatenate(low)
+
+
+def grid(file_name, size, generator, dimensions):
+    # Resistor grid with a voltage source at one corner and ground at the other
+    side = max(2, int(round(size ** (1 / dimensions))))
+    high, low = grid_edges((side,) * dimensions)
+    count = side ** dimensions
+    lines = ['V1 1 0 1'] + resistor_lines(high, low, generator.uniform(1, 100, len(high)))
+    lines.append('R{} {} 0 1'.format(len(high) + 1, count))
+    write_netlist(file_name, lines)
+
+
+def grid_2d(file_name, size, generator):
+    grid(file_name, size, generator, 2)
+
+
+def grid_3d(file_name, size, generator):
+    grid(file_name, size, generator, 3)
+
+
+def random_graph(file_name, size, generator, degree=3):
+    # Random sparse circuit, a random tree keeps it connected and other resistors join random nodes
+    nodes = numpy.arange(1, size + 1)
+    tree_high = nodes[1:]
+    tree_low = generator.integers(0, nodes[1:])
+    extra = max(0, (degree * size) // 2 - size)
+    extra_high = generator.integers(0, size + 1, extra)
+    extra_low = generator.integers(0, size + 1, extra)
+    kept = extra_high != extra_low
+    high = numpy.concatenate([tree_high, extra_high[kept]])
+    low = numpy.concatenate([tree_low, extra_low[kept]])
+    write_netlist(file_name, ['V1 1 0 5'] + resistor_lines(high, low, generator.uniform(1, 100, len(high))))
+
+
+def many_sources(file_name, size, generator):
+    # Resistor grid with current sources at a tenth of the nodes and voltage sources at a hundredth
+    side = max(2, int(round(size ** 0.5)))
+    count = side * side
+    high, low = grid_edges((side, side))
+    lines = resistor_lines(high, low, generator.uniform(1, 100, len(high)))
+    sources = generator.permutation(count)[:max(1, count // 10)] + 1
+    voltage_sources = sources[:max(1, count // 100)]
+    current_sources = sources[max(1, count // 100):]
+    lines += ['V{} {} 0 {:.6g}'.format(number, node, value) for number, (node, value) in
+              enumerate(zip(voltage_sources.tolist(), generator.uniform(1, 10, len(voltage_sources)).tolist()), 1)]
+    lines += ['I{} 0 {} {:.6g}'.format(number, node, value) for number, (node, value) in
+              enumerate(zip(current_sources.tolist(), generator.uniform(-1, 1, len(current_sources)).tolist()), 1)]
+    write_netlist(file_name, lines)
+
+
+# Netlist generators by name, each writes a netlist with about the given number of nodes
+topologies = {'chain': chain,
+              'grid2d': grid_2d,
+              'grid3d': grid_3d,
+              'random': random_graph,
+              'sources': many_sources}
+
+
+def factorise(circuit, A):
+    # Factorise A the same way as MNA.Factorise, without building A again and without the factorisation cache
+    circuit.solver_name = circuit.Solver_name()
+    circuit.ordering_name = circuit.Ordering_name()
+    return circuit.Ordered_factorisation(solvers[circuit.solver_name], A)
+
+
+def stage_runs(circuit, optimised):
+    # Every stage as a function, in the order they run, results are passed on to later stages
+    results = {}
+
+    def A_matrix():
+        results['A'] = circuit.Optimised_A_matrix() if optimised else circuit.A_matrix()
+
+    def z_matrix():
+        results['z'] = circuit.z_matrix()
+
+    def factorisation():
+        results['factorisation'] = factorise(circuit, results.pop('A'))
+
+    def solve():
+        results['factorisation'].solve(results['z'])
+
+    return (('parse', circuit.Parse_netlist), ('A_matrix', A_matrix), ('z_matrix', z_matrix),
+            ('factorise', factorisation), ('solve', solve))
+
+
+def run_stages(file_name, optimised):
+    # Run every stage once, returns the time of each stage in seconds
+    times = {}
+    circuit = MNA(file_name, optimised)
+    for stage, run in stage_runs(circuit, optimised):
+        start_time = time.perf_counter()
+        run()
+        times[stage] = time.perf_counter() - start_time
+    return times, circuit
+
+
+def warm_up(directory, paths):
+    # Solve a small netlist first so modules imported on first use are not timed in the first benchmark
+    file_name = os.path.join(directory, 'warm_up.txt')
+    chain(file_name, 10, numpy.random.default_rng(0))
+    for path in paths:
+        run_stages(file_name, path == 'sparse')
+
+
+def peak_memory(file_name, optimised):
+    # Largest memory allocated in each stage in bytes, measured in a separate run because tracing
+    # allocations slows the stages down
+    peaks = {}
+    tracemalloc.start()
+    try:
+        circuit = MNA(file_name, optimised)
+        for stage, run in stage_runs(circuit, optimised):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            run()
+            peaks[stage] = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def benchmark(topology, size, path, directory, repeats=3, seed=0, memory=True):
+    # Time the stages of one netlist with dense (path 'dense') or sparse (path 'sparse') matrices
+    file_name = os.path.join(directory, '{}_{}_{}.txt'.format(topology, size, seed))
+    if not os.path.exists(file_name):
+        topologies[topology](file_name, size, numpy.random.default_rng(seed))
+
+    runs = []
+    for _ in range(repeats):
+        times, circuit = run_stages(file_name, path == 'sparse')
+        runs.append(times)
+    result = {'topology': topology, 'size': size, 'path': path, 'nodes': circuit.node_count,
+              'components': len(circuit.components), 'matrix_size': circuit.matrix_size,
+              'solver': circuit.solver_name, 'bytes': os.path.getsize(file_name),
+              # Best time of every stage, the least disturbed by other processes
+              'seconds': {stage: min(times[stage] for times in runs) for stage in stages}}
+    result['seconds']['total'] = sum(result['seconds'].values())
+    if memory:
+        result['peak_bytes'] = peak_memory(file_name, path == 'sparse')
+    return result
+
+
+def environment():
+    # Versions the results were measured with
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=directory, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import scipy
+        scipy_version = scipy.__version__
+    except ImportError:
+        scipy_version = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': numpy.__version__,
+            'scipy': scipy_version, 'machine': platform.machine(), 'processors': os.cpu_count(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def compare(old, new, stage='total'):
+    # Ratio of new to old times of the same benchmarks, above 1 is slower
+    old_results = {(result['topology'], result['size'], result['path']): result for result in old['results']}
+    ratios = []
+    for result in new['results']:
+        previous = old_results.get((result['topology'], result['size'], result['path']))
+        if previous is not None and previous['seconds'][stage] > 0:
+            ratios.append((result['topology'], result['size'], result['path'],
+                           result['seconds'][stage] / previous['seconds'][stage]))
+    return ratios
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Time every stage of the solver on synthetic netlists.')
+    parser.add_argument('-t', '--topologies', nargs='+', choices=sorted(topologies), default=sorted(topologies),
+                        help='netlist topologies (default: all)')
+    parser.add_argument('-s', '--sizes', nargs='+', type=int, default=[1000, 10000],
+                        help='approximate numbers of nodes (default: 1000 10000)')
+    parser.add_argument('-p', '--paths', nargs='+', choices=('dense', 'sparse'), default=['dense', 'sparse'],
+                        help='dense or sparse matrices (default: both, dense only up to {} nodes)'.format(
+                            dense_node_limit))
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='runs of every benchmark, best is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random netlists')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory')
+    parser.add_argument('-d', '--directory', default=None, help='keep generated netlists in this directory')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='output file (default: benchmark.json)')
+    parser.add_argument('-c', '--compare', default=None, help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slow-down reported as a regression with --compare (default: 1.2)')
+    arguments = parser.parse_args(arguments)
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = arguments.directory or temporary
+        os.makedirs(directory, exist_ok=True)
+        warm_up(directory, arguments.paths)
+        results = []
+        for topology in arguments.topologies:
+            for size in arguments.sizes:
+                for path in arguments.paths:
+                    if path == 'dense' and size > dense_node_limit:
+                        continue
+                    result = benchmark(topology, size, path, directory, arguments.repeats, arguments.seed,
+                                       not arguments.no_memory)
+                    results.append(result)
+                    print('{:8} {:>8} {:6} '.format(topology, size, path) +
+                          ' '.join('{} {:.4f}'.format(stage, result['seconds'][stage]) for stage in stages) +
+                          ' s, total {:.3f} s'.format(result['seconds']['total']) +
+                          (', peak {:.1f} MB'.format(max(result['peak_bytes'].values()) / 1e6)
+                           if 'peak_bytes' in result else ''))
+
+    report = {'environment': environment(), 'results': results}
+    with open(arguments.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    failed = False
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            old = json.load(f)
+        for topology, size, path, ratio in compare(old, report):
+            regression = ratio > arguments.threshold
+            failed |= regression
+            print('{:8} {:>8} {:6} {:.2f}x {}'.format(topology, size, path, ratio,
+                                                      'REGRESSION' if regression else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,339 @@
+import os
+import time
+import numpy
+
+# Domain decomposition solver for large circuits
+# Nodes are split into parts, the inside of every part is factorised on its own in a worker process
+# and the parts are joined by the Schur complement of the interface between them:
+#   S = A_gg - sum of A_gp A_pp^-1 A_pg      S x_g = z_g - sum of A_gp A_pp^-1 z_p
+#   x_p = A_pp^-1 (z_p - A_pg x_g)
+# p is the inside of one part and g the interface, made from nodes joined to other parts, voltage source rows
+# and nodes joined to voltage sources, so the inside of every part only has conductances and can be
+# factorised without pivoting
+# scipy and multiprocessing are only imported when a solver is made
+
+# Columns of A_pp^-1 A_pg solved together when a part makes its share of S, limits memory of large parts
+schur_batch_size = 256
+
+
+def partition(graph, parts):
+    from scipy.sparse.csgraph import dijkstra
+
+    # Split nodes of a graph (symmetric sparse matrix) into parts of about the same size
+    # The graph is cut in two by distance from a node at its edge, so parts are compact and
+    # have short boundaries, and both halves are split again until there are enough parts
+    # Returns the part of every node
+    labels = numpy.zeros(graph.shape[0], dtype=numpy.int64)
+
+    def bisect(nodes, subgraph, first, count):
+        if count == 1 or len(nodes) <= 1:
+            labels[nodes] = first
+            return
+        distance = dijkstra(subgraph, directed=False, indices=0, unweighted=True)
+        if numpy.all(numpy.isfinite(distance)):
+            distance = dijkstra(subgraph, directed=False, indices=int(numpy.argmax(distance)), unweighted=True)
+        # Parts which are not connected come last, in one block
+        order = numpy.argsort(numpy.where(numpy.isfinite(distance), distance, numpy.inf), kind='stable')
+        left = count // 2
+        split = len(nodes) * left // count
+        for positions, part, part_count in ((order[:split], first, left), (order[split:], first + left, count - left)):
+            positions = numpy.sort(positions)
+            bisect(nodes[positions], subgraph[positions][:, positions], part, part_count)
+
+    graph = graph.tocsr()
+    bisect(numpy.arange(graph.shape[0]), graph, 0, parts)
+    return labels
+
+
+class Part:
+    # Inside of one part with its coupling to the interface
+    #  - inside is A_pp, coupling A_pg and transpose A_gp, with only the interface rows next to the part
+    # The part is factorised with its interface rows as a border, ordered last:
+    #   B = [A_pp  A_pg]    the last block of L U is M - A_gp A_pp^-1 A_pg, so the share of the part in S
+    #       [A_gp  M   ]    comes from the factors instead of solving for every interface row
+    # M is diagonal and larger than the share, so the last block has no zero pivots
+    def __init__(self, inside, coupling, transpose):
+        import scipy.sparse as sparse
+        from scipy.sparse.linalg import splu
+
+        # Inside of a part is symmetric and only has conductances, its diagonal is kept as pivots
+        # Its columns are ordered by SuperLU first, the border keeps that order
+        options = {'diag_pivot_thresh': 0.0, 'options': {'SymmetricMode': True}}
+        # A part without interface, the whole circuit when there is one part, needs no border
+        try:
+            self.factorisation = splu(inside.tocsc(), permc_spec='MMD_AT_PLUS_A', **options)
+            self.order = numpy.arange(inside.shape[0])
+            M = sparse.diags(2 * abs(transpose).sum(axis=1).A1)
+            B = inside
+            if transpose.shape[0]:
+                self.order = numpy.argsort(self.factorisation.perm_c)
+                B = sparse.bmat([[inside[self.order][:, self.order], coupling[self.order]],
+                                 [transpose[:, self.order], M]]).tocsc()
+                self.factorisation = splu(B, permc_spec='NATURAL', **options)
+        except RuntimeError as error:
+            raise numpy.linalg.LinAlgError(str(error))
+        size = inside.shape[0]
+        self.size = size
+        # Last block of L U, the Schur complement of the inside in B
+        self.border = (self.factorisation.L[size:, size:] @ self.factorisation.U[size:, size:]).toarray()
+        self.M = M.diagonal()
+        self.nonzeros = self.factorisation.L.nnz + self.factorisation.U.nnz - B.shape[0]
+        self.z = None
+        self.forward = None
+
+    def Schur(self):
+        # Share of the part in S, A_gp A_pp^-1 A_pg as a dense matrix
+        return numpy.diag(self.M) - self.border
+
+    def Forward(self, z):
+        # Share of the part in the z matrix of the interface, A_gp A_pp^-1 z_p
+        # B [y, w] = [z_p, 0] gives w = -(M - A_gp A_pp^-1 A_pg)^-1 A_gp A_pp^-1 z_p
+        self.z = z[self.order]
+        w = self.factorisation.solve(numpy.concatenate([self.z, numpy.zeros((len(self.M),) + z.shape[1:])]))
+        self.forward = -self.border @ w[self.size:]
+        return self.forward
+
+    def Backward(self, x):
+        # Solution inside the part from the solution of the interface
+        # B [y, x_g] = [z_p, r] when r = A_gp A_pp^-1 z_p + (M - A_gp A_pp^-1 A_pg) x_g, y is then the solution
+        y = self.factorisation.solve(numpy.concatenate([self.z, self.forward + self.border @ x]))
+        x = numpy.empty_like(y[:self.size])
+        x[self.order] = y[:self.size]
+        return x
+
+
+def worker(connection):
+    # Worker process keeping one part, runs methods of the part sent through the connection
+    # Errors are sent back to be raised in the main process
+    part = None
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        method, arguments = message
+        try:
+            if method == 'Part':
+                part = Part(*arguments)
+                result = part.nonzeros
+            else:
+                result = getattr(part, method)(*arguments)
+        except Exception as error:
+            connection.send(('error', error))
+        else:
+            connection.send(('result', result))
+    connection.close()
+
+
+class LocalPart:
+    # Part solved in the main process, used with a single part
+    def __init__(self, *arguments):
+        self.part = Part(*arguments)
+        self.nonzeros = self.part.nonzeros
+        self.result = None
+
+    def Send(self, method, *arguments):
+        self.result = getattr(self.part, method)(*arguments)
+
+    def Receive(self):
+        return self.result
+
+    def Close(self):
+        pass
+
+
+class WorkerPart:
+    # Part kept in a worker process, methods are sent to all parts before any result is received,
+    # so parts are solved in parallel
+    def __init__(self, context, *arguments):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=worker, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.connection.send(('Part', arguments))
+
+    def Send(self, method, *arguments):
+        self.connection.send((method, arguments))
+
+    def Receive(self):
+        kind, result = self.connection.recv()
+        if kind == 'error':
+            raise result
+        return result
+
+    def Close(self):
+        try:
+            self.connection.send(None)
+            self.connection.close()
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class DecompositionSolver:
+    # Solver made from the A matrix like the solvers in Solvers.py
+    # Options:
+    #  - 'parts' number of parts, each in its own worker process (default: number of processors)
+    #  - 'partition' part of every row of A, instead of partitioning the node graph
+    dense = False
+
+    def __init__(self, A, options):
+        import multiprocessing
+        import scipy.sparse as sparse
+        from scipy.sparse.linalg import splu
+
+        start_time = time.perf_counter()
+        A = sparse.csr_matrix(A)
+        size = A.shape[0]
+        parts = max(1, int(options.get('parts') or os.cpu_count() or 1))
+
+        # Voltage source rows have nothing on the diagonal, they and the rows joined to them are interface
+        diagonal = A.diagonal() != 0
+        pattern = (A != 0).astype(numpy.int8)
+        interface = ~diagonal | (pattern @ (~diagonal).astype(numpy.int64) != 0)
+
+        # Partition the rest of the node graph, nodes joined to a node of a later part are interface
+        inside = numpy.flatnonzero(~interface)
+        labels = numpy.full(size, -1, dtype=numpy.int64)
+        if 'partition' in options:
+            labels[inside] = numpy.asarray(options['partition'])[inside]
+        else:
+            labels[inside] = partition(pattern[inside][:, inside], parts)
+        edges = pattern.tocoo()
+        boundary = (labels[edges.row] >= 0) & (labels[edges.row] < labels[edges.col])
+        interface[edges.row[boundary]] = True
+        labels[interface] = -1
+
+        self.interface = numpy.flatnonzero(interface)
+        self.parts = [numpy.flatnonzero(labels == part) for part in range(parts)]
+        self.parts = [rows for rows in self.parts if len(rows)]
+        self.partition_time = time.perf_counter() - start_time
+
+        # Interface rows next to every part and its blocks of A
+        start_time = time.perf_counter()
+        interface_position = numpy.full(size, -1, dtype=numpy.int64)
+        interface_position[self.interface] = numpy.arange(len(self.interface))
+        self.neighbours = []
+        blocks = []
+        for rows in self.parts:
+            neighbours = numpy.unique(pattern[rows].indices)
+            neighbours = neighbours[interface[neighbours]]
+            self.neighbours.append(interface_position[neighbours])
+            blocks.append((A[rows][:, rows], A[rows][:, neighbours], A[neighbours][:, rows]))
+
+        # Parts are factorised in parallel, in the main process when there is only one
+        if len(self.parts) > 1:
+            context = multiprocessing.get_context()
+            self.workers = [WorkerPart(context, *block) for block in blocks]
+        else:
+            self.workers = [LocalPart(*block) for block in blocks]
+        try:
+            self.nonzeros = sum(worker.Receive() if isinstance(worker, WorkerPart) else worker.nonzeros
+                                for worker in self.workers)
+            for worker in self.workers:
+                worker.Send('Schur')
+            schur = [worker.Receive() for worker in self.workers]
+        except BaseException:
+            self.Close()
+            raise
+        self.factor_time = time.perf_counter() - start_time
+
+        # Schur complement of the interface, joined from the shares of all parts
+        start_time = time.perf_counter()
+        S = A[self.interface][:, self.interface].tocoo()
+        rows = [S.row] + [numpy.repeat(neighbours, len(neighbours)) for neighbours in self.neighbours]
+        cols = [S.col] + [numpy.tile(neighbours, len(neighbours)) for neighbours in self.neighbours]
+        data = [S.data] + [-share.ravel() for share in schur]
+        S = sparse.coo_matrix((numpy.concatenate(data), (numpy.concatenate(rows), numpy.concatenate(cols))),
+                              shape=(len(self.interface), len(self.interface))).tocsc()
+        try:
+            self.schur = splu(S) if S.shape[0] else None
+        except RuntimeError as error:
+            self.Close()
+            raise numpy.linalg.LinAlgError(str(error))
+        if self.schur is not None:
+            self.nonzeros += self.schur.L.nnz + self.schur.U.nnz - S.shape[0]
+        self.interface_time = time.perf_counter() - start_time
+
+    def solve(self, z):
+        z = numpy.asarray(z, dtype=float)
+        columns = z.reshape(z.shape[0], -1)
+
+        # Interface first, then the inside of every part from the interface
+        for worker, rows in zip(self.workers, self.parts):
+            worker.Send('Forward', columns[rows])
+        g = columns[self.interface].copy()
+        for worker, neighbours in zip(self.workers, self.neighbours):
+            numpy.subtract.at(g, neighbours, worker.Receive())
+        x = numpy.empty_like(columns)
+        x_interface = self.schur.solve(g) if self.schur is not None else g
+        x[self.interface] = x_interface
+        for worker, neighbours in zip(self.workers, self.neighbours):
+            worker.Send('Backward', x_interface[neighbours])
+        for worker, rows in zip(self.workers, self.parts):
+            x[rows] = worker.Receive()
+        return x.reshape(z.shape)
+
+    def Close(self):
+        # Stop worker processes
+        for worker in getattr(self, 'workers', ()):
+            worker.Close()
+        self.workers = []
+
+    def __del__(self):
+        self.Close()
+
+
+def scaling(file_name, processes, repeats=1):
+    from MNA import MNA
+    from Solvers import SuperLUSolver
+
+    # Time of solving a netlist with 1 to the given number of worker processes, compared with the direct solve
+    # A is stamped once and every solver is made from it, so every time includes the factorisation and the solve only
+    circuit = MNA(file_name, solver='superlu')
+    circuit.Parse_netlist()
+    A = circuit.Optimised_A_matrix()
+    z = circuit.z_matrix()
+    start_time = time.perf_counter()
+    expected = SuperLUSolver(A, {}).solve(z)
+    results = [{'parts': 'direct', 'time': time.perf_counter() - start_time, 'difference': 0.0}]
+
+    parts = 1
+    while True:
+        times = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            solver = DecompositionSolver(A, {'parts': parts})
+            x = solver.solve(z)
+            times.append(time.perf_counter() - start_time)
+            solver.Close()
+        results.append({'parts': parts, 'time': min(times), 'interface': len(solver.interface),
+                        'difference': float(numpy.abs(x - expected).max() / max(numpy.abs(expected).max(), 1e-300))})
+        if parts >= processes:
+            break
+        parts = min(parts * 2, processes)
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Wall time of the domain decomposition solver from 1 to N processes.')
+    parser.add_argument('netlist', help='netlist file')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(),
+                        help='largest number of worker processes (default: number of processors)')
+    parser.add_argument('-r', '--repeats', type=int, default=1, help='best time of this many solves')
+    args = parser.parse_args()
+
+    results = scaling(args.netlist, args.processes, args.repeats)
+    direct = results[0]['time']
+    single = results[1]['time']
+    print(f'direct solve: {direct:.3f} s')
+    for result in results[1:]:
+        print(f"{result['parts']:3d} processes: {result['time']:.3f} s, speed-up {single / result['time']:.2f}, "
+              f"interface {result['interface']}, difference {result['difference']:.1e}")
+
+
+if __name__ == '__main__':
+    main()
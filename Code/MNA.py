@@ -1,9 +1,66 @@
+from array import array
+from collections import OrderedDict
+import hashlib
+import csv
+import functools
+import itertools
+import json
+import mmap
+import re
+import struct
+import threading
 import numpy
-import scipy.sparse as sparse
-from scipy.sparse.linalg.dsolve import linsolve
-from tkinter import *
-from tkinter import messagebox
 import time
+from Solvers import solvers, choose_solver, ReorderedSolver
+from Ordering import orderings, bandwidth
+
+# scipy is only imported when sparse matrices are used and tkinter only when results are displayed
+# so the solver can be imported quickly and without a GUI
+
+# Compiled (binary) netlist format
+# Header: magic bytes followed by number of components, number of nodes,
+# size of component names and size of node names in bytes
+binary_magic = b'MNANET01'
+binary_header = struct.Struct('<8s4Q')
+# Header is padded so every column starts on an 8 byte boundary
+binary_header_size = 64
+
+# Factorisations of A matrices shared by all circuits, most recently used last
+# Keys are made from the circuit's topology, resistor values and solver
+factorisation_cache = OrderedDict()
+factorisation_cache_size = 8
+# Caches are shared by circuits solved in different threads (e.g. by the solver service)
+cache_lock = threading.Lock()
+# Largest number of changed resistors which are handled by a low-rank update instead of a new factorisation
+incremental_rank_limit = 32
+
+# Series and parallel reduction stops after a pass which removes less than this fraction of the nodes left
+reduction_pass_limit = 0.01
+
+# Graphs with fewer edges than this are split into connected parts with a disjoint-set instead of scipy,
+# building sparse matrices takes longer than the whole check for small circuits
+small_graph_limit = 256
+
+# Instrumentation of the solver's stages, see MNA.Run_stage
+# None records nothing, 'time' records wall time of every stage and statistics of A and its factorisation,
+# 'full' also records memory allocated in every stage (with tracemalloc) and estimates the condition number of A
+default_instrumentation = 'time'
+# Functions called with (circuit, stage name, record) after every stage, added with add_stage_hook
+# Hooks are added and removed by other threads while stages run, so the tuple is replaced instead of changed
+stage_hooks = ()
+stage_hook_lock = threading.Lock()
+
+# Reduced subcircuits shared by all circuits, most recently used last
+# Keys are made from the lines of each subcircuit definition and of the subcircuits used inside it
+subcircuit_cache = OrderedDict()
+subcircuit_cache_size = 64
+# Lines which start or end a subcircuit definition or add an instance of a subcircuit
+subcircuit_line = re.compile(r'^[ \t]*[.Xx]', re.MULTILINE)
+
+# Problems found by MNA.Check_topology, each makes the A matrix singular
+topology_problems = {'floating': 'Components not connected to ground',
+                     'current cut-set': 'Current sources are the only connection to ground',
+                     'voltage loop': 'Voltage sources form a loop'}
 
 
 # Parent class
@@ -21,29 +78,633 @@ class circuit_component:  # circuit component structure
         self.value = value
 
 
+class NameTable:
+    def __init__(self):
+        # All names joined together in one block of bytes
+        self.data = bytearray()
+        # Position where each name starts, followed by the end of the last name
+        self.offsets = array('q', [0])
+        # Dictionary mapping each name to its position, only built when needed
+        self.index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return bytes(self.data[self.offsets[position]:self.offsets[position + 1]]).decode()
+
+    def names(self):
+        # List of all names in the table
+        text = bytes(self.data).decode()
+        if len(text) != len(self.data):
+            return [self[position] for position in range(len(self))]
+        offsets = numpy.asarray(self.offsets).tolist()
+        return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def writable(self):
+        # Names loaded from a compiled netlist are read from the file until a new name is added
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+            self.offsets = array('q', self.offsets.tobytes())
+
+    def add(self, name):
+        # Add a name to the end of the table and return its position
+        self.writable()
+        position = len(self)
+        self.data += name.encode()
+        self.offsets.append(len(self.data))
+        if self.index is not None:
+            self.index[name] = position
+        return position
+
+    def extend(self, names):
+        # Add many names at once
+        self.writable()
+        text = ''.join(names)
+        data = text.encode()
+        # Length of each name in bytes, names with only ASCII characters have one byte per character
+        if len(data) == len(text):
+            lengths = numpy.fromiter(map(len, names), dtype=numpy.int64, count=len(names))
+        else:
+            lengths = numpy.array([len(name.encode()) for name in names], dtype=numpy.int64)
+        if self.index is not None:
+            self.index.update(zip(names, range(len(self), len(self) + len(names))))
+        self.offsets.frombytes((numpy.cumsum(lengths) + len(self.data)).tobytes())
+        self.data += data
+
+    def subset(self, positions):
+        # New table with the names at the given positions, bytes are copied without making strings
+        offsets = numpy.frombuffer(self.offsets, dtype=numpy.int64)
+        starts = offsets[positions]
+        lengths = offsets[numpy.asarray(positions) + 1] - starts
+        new_offsets = numpy.concatenate([[0], numpy.cumsum(lengths)]).astype(numpy.int64)
+        data = numpy.frombuffer(self.data, dtype=numpy.uint8)
+        table = NameTable()
+        table.data = bytearray(data[numpy.repeat(starts - new_offsets[:-1], lengths) +
+                                    numpy.arange(new_offsets[-1])].tobytes())
+        table.offsets = array('q', new_offsets.tobytes())
+        return table
+
+    def intern(self, name):
+        # Return the position of a name, adding it only the first time it is seen
+        position = self.mapping().get(name)
+        if position is None:
+            position = self.add(name)
+        return position
+
+    def mapping(self):
+        # Build the name dictionary the first time it is needed
+        if self.index is None:
+            self.index = {self[position]: position for position in range(len(self))}
+        return self.index
+
+
+class ComponentTable:
+    def __init__(self, capacity=1024):
+        # Number of components stored in the table
+        self.count = 0
+        # Columns of the table, each component is one row
+        # Component type is stored as the character code of 'V', 'I' or 'R'
+        self.type_column = numpy.zeros(capacity, dtype=numpy.uint8)
+        # High and low nodes as positions in the node name table
+        self.high_column = numpy.zeros(capacity, dtype=numpy.int32)
+        self.low_column = numpy.zeros(capacity, dtype=numpy.int32)
+        # Component's value
+        self.value_column = numpy.zeros(capacity)
+        # Component names (e.g. 'R1')
+        self.names = NameTable()
+        # Node names, ground is always node 0 so node positions are also the mapped nodes
+        self.nodes = NameTable()
+        self.nodes.intern('0')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        # Single component as a circuit_component object
+        component = circuit_component(chr(self.type_column[position]), self.nodes[self.high_column[position]],
+                                      self.nodes[self.low_column[position]], float(self.value_column[position]))
+        component.high = int(self.high_column[position])
+        component.low = int(self.low_column[position])
+        return component
+
+    def __iter__(self):
+        for position in range(self.count):
+            yield self[position]
+
+    # Views of the filled part of each column
+    @property
+    def types(self):
+        return self.type_column[:self.count]
+
+    @property
+    def high(self):
+        return self.high_column[:self.count]
+
+    @property
+    def low(self):
+        return self.low_column[:self.count]
+
+    @property
+    def values(self):
+        return self.value_column[:self.count]
+
+    @property
+    def nbytes(self):
+        # Memory used by the table in bytes
+        columns = self.type_column.nbytes + self.high_column.nbytes + self.low_column.nbytes + \
+                  self.value_column.nbytes
+        names = len(self.names.data) + len(self.names.offsets) * self.names.offsets.itemsize
+        nodes = len(self.nodes.data) + len(self.nodes.offsets) * self.nodes.offsets.itemsize
+        return columns + names + nodes
+
+    def reserve(self, count):
+        # Make sure there is space for the given number of extra components
+        capacity = len(self.type_column)
+        if self.count + count <= capacity:
+            return
+        # Grow the columns to at least double size so appending stays fast
+        capacity = max(2 * capacity, self.count + count)
+        for column in ('type_column', 'high_column', 'low_column', 'value_column'):
+            old = getattr(self, column)
+            new = numpy.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, column, new)
+
+    def append(self, name, comp_type, high_str, low_str, value):
+        # Add a single component
+        self.reserve(1)
+        position = self.count
+        self.type_column[position] = ord(comp_type)
+        self.high_column[position] = self.nodes.intern(high_str)
+        self.low_column[position] = self.nodes.intern(low_str)
+        self.value_column[position] = value
+        self.names.add(name)
+        self.count += 1
+
+    def extend(self, names, types, high, low, values):
+        # Add a batch of components, nodes must already be positions in the node name table
+        count = len(names)
+        self.reserve(count)
+        self.type_column[self.count:self.count + count] = types
+        self.high_column[self.count:self.count + count] = high
+        self.low_column[self.count:self.count + count] = low
+        self.value_column[self.count:self.count + count] = values
+        self.names.extend(names)
+        self.count += count
+
+    def subset(self, positions):
+        # New table with the components at the given positions, nodes keep their positions
+        table = ComponentTable(max(len(positions), 1))
+        table.count = len(positions)
+        for column in ('type_column', 'high_column', 'low_column', 'value_column'):
+            getattr(table, column)[:table.count] = getattr(self, column)[:self.count][positions]
+        table.names = self.names.subset(positions)
+        table.nodes = self.nodes
+        return table
+
+    def select(self, comp_type):
+        # Boolean mask of the components of one type
+        return self.types == ord(comp_type)
+
+    def write_binary(self, file_name):
+        # Save the table as a compiled netlist
+        header = binary_header.pack(binary_magic, self.count, len(self.nodes), len(self.names.data),
+                                    len(self.nodes.data))
+        with open(file_name, 'wb') as f:
+            f.write(header.ljust(binary_header_size, b'\0'))
+            # 8 byte columns first, then 4 byte columns and finally single bytes
+            f.write(self.values.astype('<f8', copy=False))
+            f.write(numpy.asarray(self.names.offsets, dtype='<i8'))
+            f.write(numpy.asarray(self.nodes.offsets, dtype='<i8'))
+            f.write(self.high.astype('<i4', copy=False))
+            f.write(self.low.astype('<i4', copy=False))
+            f.write(self.types)
+            f.write(self.names.data)
+            f.write(self.nodes.data)
+
+    @classmethod
+    def from_binary(cls, file_name):
+        # Load a compiled netlist
+        # The file is memory-mapped and columns are views into it, so nothing is copied or converted
+        # Pages are copy-on-write so values can still be changed without changing the file
+        with open(file_name, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, count, node_count, name_size, node_size = binary_header.unpack_from(buffer)
+        if magic != binary_magic:
+            raise ValueError(file_name + ' is not a compiled netlist')
+
+        # Read each column in the order it was written
+        position = binary_header_size
+
+        def column(dtype, length):
+            nonlocal position
+            view = numpy.frombuffer(buffer, dtype=dtype, count=length, offset=position)
+            position += view.nbytes
+            return view
+
+        table = cls(capacity=0)
+        table.count = count
+        table.value_column = column('<f8', count)
+        table.names.offsets = column('<i8', count + 1)
+        table.nodes.offsets = column('<i8', node_count + 1)
+        table.high_column = column('<i4', count)
+        table.low_column = column('<i4', count)
+        table.type_column = column(numpy.uint8, count)
+        table.names.data = column(numpy.uint8, name_size)
+        table.nodes.data = column(numpy.uint8, node_size)
+        table.names.index = None
+        table.nodes.index = None
+        return table
+
+
 class CSC:
     def __init__(self):
+        # Blocks of row indices, column indices and values
         self.rows = []
         self.columns = []
         self.data = []
 
     def insert(self, row, column, data):
-        self.data.append(data)
-        self.rows.append(row)
-        self.columns.append(column)
+        self.data.append([data])
+        self.rows.append([row])
+        self.columns.append([column])
+
+    def insert_many(self, rows, columns, data):
+        # Insert a whole block of entries at once
+        # A single value is repeated for every entry of the block
+        self.data.append(numpy.broadcast_to(numpy.asarray(data, dtype=float), numpy.shape(rows)))
+        self.rows.append(rows)
+        self.columns.append(columns)
+
+    def triplets(self):
+        # Join all blocks into three arrays (COO format)
+        if len(self.data) == 0:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int), numpy.zeros(0)
+        rows = numpy.concatenate(self.rows).astype(int, copy=False)
+        columns = numpy.concatenate(self.columns).astype(int, copy=False)
+        data = numpy.concatenate(self.data).astype(float, copy=False)
+        return rows, columns, data
+
+
+class SparsityPattern:
+    def __init__(self, rows, columns, size):
+        # Positions of non-zero entries of a square CSC matrix built from COO entries
+        # Entries are sorted by column and then by row, which is the order of CSC data
+        key = columns.astype(numpy.int64) * size + rows
+        unique, self.positions = numpy.unique(key, return_inverse=True)
+        # Row index of every non-zero entry
+        self.indices = (unique % size).astype(numpy.int32)
+        # Where each column starts in the data
+        self.indptr = numpy.searchsorted(unique // size, numpy.arange(size + 1)).astype(numpy.int32)
+        self.size = size
+
+    def matrix(self, data):
+        import scipy.sparse as sparse
+
+        # CSC matrix with COO values added into their positions, repeated positions are summed
+        values = numpy.bincount(self.positions.ravel(), weights=data, minlength=len(self.indices))
+        return sparse.csc_matrix((values, self.indices, self.indptr), shape=(self.size, self.size))
+
+
+# Disjoint-set (union-find) of elements numbered from 0
+# Used to group connected terminals into nodes
+class DisjointSet:
+    def __init__(self, count=0):
+        # Parent of every element, roots are their own parents
+        self.parent = list(range(count))
+        # Upper bound of the height of every root's tree
+        self.rank = [0] * count
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self):
+        # New element in its own set
+        self.parent.append(len(self.parent))
+        self.rank.append(0)
+        return len(self.parent) - 1
+
+    def find(self, element):
+        # Root of the element's set, path is halved on the way up
+        parent = self.parent
+        while parent[element] != element:
+            parent[element] = parent[parent[element]]
+            element = parent[element]
+        return element
+
+    def union(self, first, second):
+        # Join the sets of two elements, returns False if they were already in the same set
+        first = self.find(first)
+        second = self.find(second)
+        if first == second:
+            return False
+        if self.rank[first] < self.rank[second]:
+            first, second = second, first
+        self.parent[second] = first
+        if self.rank[first] == self.rank[second]:
+            self.rank[first] += 1
+        return True
+
+    def roots(self):
+        # Root of every element
+        return [self.find(element) for element in range(len(self.parent))]
+
+
+# Subcircuit defined between '.subckt name port1 port2 ...' and '.ends' lines
+# Instances are added with 'Xname node1 node2 ... name', one node for every port
+# Resistors, current sources and instances of other subcircuits can be inside a subcircuit, node '0' is ground
+class Subcircuit:
+    def __init__(self, name, ports):
+        self.name = name
+        self.ports = ports
+        # Lines of the definition split into words
+        self.lines = []
+        self.key = None
+
+    def Key(self, definitions, using=()):
+        # Key which is the same for subcircuits with the same lines, including the subcircuits they use
+        if self.name in using:
+            raise ValueError('Subcircuit ' + self.name + ' uses itself')
+        if self.key is None:
+            key = hashlib.blake2b(repr((self.ports, self.lines)).encode())
+            for words in self.lines:
+                if words[0][0] in 'Xx':
+                    key.update(self.Definition(definitions, words[-1]).Key(definitions, using + (self.name,)).encode())
+            self.key = key.hexdigest()
+        return self.key
+
+    def Definition(self, definitions, name):
+        if name not in definitions:
+            raise ValueError('Subcircuit ' + name + ' used in ' + self.name + ' is not defined')
+        return definitions[name]
+
+    def Reduce(self, definitions, value):
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.linalg import splu
+
+        # Conductance matrix and currents seen from the ports, made once for every different subcircuit
+        # Internal nodes are removed with the Schur complement of the subcircuit's conductance matrix G:
+        #   conductance = G_pp - G_pi G_ii^-1 G_ip      current = J_p - G_pi G_ii^-1 J_i
+        # p are ports and i internal nodes, J are currents of current sources the same way as in the z matrix
+        key = self.Key(definitions)
+        with cache_lock:
+            if key in subcircuit_cache:
+                subcircuit_cache.move_to_end(key)
+                return subcircuit_cache[key]
+
+        # Local node numbers, ports first and internal nodes in order of appearance, ground has no number
+        nodes = {'0': -1}
+        for port in self.ports:
+            if port in nodes:
+                raise ValueError('Subcircuit ' + self.name + ' has port ' + port + ' more than once or as ground')
+            nodes[port] = len(nodes) - 1
+        rows, columns, data, currents = [], [], [], {}
+
+        for words in self.lines:
+            kind = words[0][0].upper()
+            if kind == 'X':
+                # Instance of another subcircuit adds its own reduction
+                inner = self.Definition(definitions, words[-1])
+                if len(words) - 2 != len(inner.ports):
+                    raise ValueError('Instance ' + words[0] + ' needs ' + str(len(inner.ports)) + ' nodes')
+                reduction = inner.Reduce(definitions, value)
+                ports = [nodes.setdefault(node, len(nodes) - 1) for node in words[1:-1]]
+                rows += [row for row in ports for column in ports]
+                columns += ports * len(ports)
+                data += reduction['conductance'].ravel().tolist()
+                for port, current in zip(ports, reduction['current']):
+                    currents[port] = currents.get(port, 0.0) + current
+            elif kind in 'RI' and len(words) == 4:
+                high = nodes.setdefault(words[1], len(nodes) - 1)
+                low = nodes.setdefault(words[2], len(nodes) - 1)
+                if kind == 'R':
+                    conductance = 1 / value(words[3])
+                    rows += [high, low, high, low]
+                    columns += [high, low, low, high]
+                    data += [conductance, conductance, -conductance, -conductance]
+                else:
+                    currents[high] = currents.get(high, 0.0) - value(words[3])
+                    currents[low] = currents.get(low, 0.0) + value(words[3])
+            else:
+                raise ValueError('Only resistors, current sources and subcircuits can be inside subcircuit ' +
+                                 self.name + ': ' + ' '.join(words))
+
+        # Conductance matrix and currents of the whole subcircuit, without ground
+        size = len(nodes) - 1
+        rows = numpy.array(rows, dtype=numpy.int64)
+        columns = numpy.array(columns, dtype=numpy.int64)
+        data = numpy.array(data, dtype=float)
+        grounded = (rows >= 0) & (columns >= 0)
+        G = coo_matrix((data[grounded], (rows[grounded], columns[grounded])), shape=(size, size)).tocsc()
+        J = numpy.zeros(size)
+        for node, current in currents.items():
+            if node >= 0:
+                J[node] += current
+
+        ports = len(self.ports)
+        reduction = {'conductance': G[:ports, :ports].toarray(), 'current': J[:ports],
+                     'internal_nodes': list(nodes)[ports + 1:], 'factorisation': None,
+                     'coupling': G[ports:, :ports], 'internal_current': J[ports:]}
+        if size > ports:
+            try:
+                factorisation = splu(G[ports:, ports:].tocsc())
+            except RuntimeError:
+                raise numpy.linalg.LinAlgError('Subcircuit ' + self.name + ' has nodes not connected to its ports')
+            solved = factorisation.solve(numpy.column_stack([G[ports:, :ports].toarray(), J[ports:]]))
+            reduction['conductance'] -= G[:ports, ports:] @ solved[:, :ports]
+            reduction['current'] = J[:ports] - G[:ports, ports:] @ solved[:, ports]
+            reduction['factorisation'] = factorisation
+
+        with cache_lock:
+            subcircuit_cache[key] = reduction
+            if len(subcircuit_cache) > subcircuit_cache_size:
+                subcircuit_cache.popitem(last=False)
+        return reduction
+
+
+# Results of a solved circuit
+class Solution:
+    def __init__(self, circuit, x):
+        # Solution of the matrix equation (node voltages followed by currents through voltage sources)
+        self.x = numpy.asarray(x)
+        components = circuit.components
+        node_count = circuit.node_count
+
+        # Voltage of every node in order of node numbers, ground is 0 V
+        self.voltages = numpy.concatenate(([0.0], self.x[:node_count - 1]))
+        # Names of nodes and components
+        self.node_names = components.nodes.names()[:node_count]
+        self.component_names = components.names.names()
+        self.types = numpy.array([chr(code) for code in components.types]) if len(components) else numpy.array([])
+        self.high = components.high.copy()
+        self.low = components.low.copy()
+
+        # Voltage across every component, from high node to low node
+        self.component_voltages = self.voltages[self.high] - self.voltages[self.low]
+        # Current flowing through every component from its high node to its low node
+        self.currents = numpy.zeros(len(components))
+        resistors = components.select('R')
+        self.currents[resistors] = self.component_voltages[resistors] / components.values[resistors]
+        current_sources = components.select('I')
+        self.currents[current_sources] = components.values[current_sources]
+        self.voltage_sources = numpy.flatnonzero(components.select('V'))
+        self.currents[self.voltage_sources] = self.x[node_count - 1:node_count - 1 + len(self.voltage_sources)]
+        # Power absorbed by every component, sources delivering power have negative values
+        self.power = self.component_voltages * self.currents
+
+    @property
+    def node_voltages(self):
+        # Voltage of each node keyed by node name, ground is not included
+        return dict(zip(self.node_names[1:], self.voltages[1:].tolist()))
+
+    @property
+    def source_currents(self):
+        # Current through each independent voltage source keyed by component name
+        return {self.component_names[position]: float(self.currents[position]) for position in self.voltage_sources}
+
+    def as_dict(self):
+        # Results as a dictionary which can be saved as JSON
+        return {'nodes': self.node_voltages,
+                'sources': self.source_currents,
+                'currents': dict(zip(self.component_names, self.currents.tolist())),
+                'power': dict(zip(self.component_names, self.power.tolist()))}
+
+    def to_csv(self, file_name):
+        # One row for every node and every component
+        with open(file_name, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name', 'voltage', 'current', 'power'])
+            writer.writerows(zip(itertools.repeat('node'), self.node_names, self.voltages.tolist()))
+            writer.writerows(zip(itertools.repeat('component'), self.component_names,
+                                 self.component_voltages.tolist(), self.currents.tolist(), self.power.tolist()))
+
+    def to_jsonl(self, output, **fields):
+        # Add results as one line of a JSON Lines file, extra fields (e.g. file name) are added to the line
+        line = json.dumps(dict(fields, **self.as_dict())) + '\n'
+        if isinstance(output, str):
+            with open(output, 'a') as f:
+                f.write(line)
+        else:
+            output.write(line)
+
+    def to_npz(self, file_name):
+        # All results as NumPy arrays
+        numpy.savez(file_name, x=self.x, node_names=numpy.array(self.node_names), voltages=self.voltages,
+                    component_names=numpy.array(self.component_names), types=self.types, high=self.high,
+                    low=self.low, component_voltages=self.component_voltages, currents=self.currents,
+                    power=self.power)
+
+    def text(self):
+        # Create text with calculated values which gets displayed to the user
+        node_voltages_text = 'Voltage potential on each node:\n'
+
+        # Loop through nodes to allocate appropriate nodal voltages
+        for node in range(1, len(self.node_names)):
+            node_voltages_text += 'node' + str(node) + ': '
+
+            #  Display calculated nodal voltages
+            if self.voltages[node] > 0:
+                # Format value to three decimal places
+                node_voltages_text += str('{:.3f}'.format(self.voltages[node])) + ' V\n'
+
+            # If the value is negative, multiply by -1 to get positive value
+            else:
+                node_voltages_text += str(float('{:.3f}'.format(self.voltages[node])) * (-1)) + ' V\n'
+
+        # Check how many voltages sources there in the circuit
+        if len(self.voltage_sources) > 1:
+            current_of_voltage_source_text = '\nCurrents flowing through independent voltage sources:\n'
+        else:
+            current_of_voltage_source_text = '\nCurrent flowing through independent voltage source:\n'
+
+        # Loop through independent voltage sources to allocate appropriate current values
+        for v, position in enumerate(self.voltage_sources):
+            current_of_voltage_source_text += 'Current through V' + str(v + 1) + ': '
+
+            # Display currents flowing through independent voltage sources
+            if self.currents[position] > 0:
+                # Format value to three decimal places
+                current_of_voltage_source_text += str('{:.3f}'.format(self.currents[position])) + ' A\n'
+
+            # If the value is negative, multiply by -1 to get positive value
+            else:
+                current_of_voltage_source_text += str('{:.3f}'.format(self.currents[position] * (-1))) + ' A\n'
+
+        # Create the final message
+        return node_voltages_text + current_of_voltage_source_text
+
+
+def add_stage_hook(hook):
+    # Call a function after every stage of every circuit, e.g. to forward statistics to telemetry
+    global stage_hooks
+    with stage_hook_lock:
+        stage_hooks = stage_hooks + (hook,)
+
+
+def remove_stage_hook(hook):
+    global stage_hooks
+    with stage_hook_lock:
+        hooks = list(stage_hooks)
+        hooks.remove(hook)
+        stage_hooks = tuple(hooks)
+
+
+def parse_details(circuit, result):
+    return {'bytes': getattr(circuit, 'bytes_parsed', None), 'components': len(circuit.components)}
+
+
+def matrix_details(circuit, A):
+    return {'size': A.shape[0], 'nonzeros': int(A.nnz) if hasattr(A, 'nnz') else int(numpy.count_nonzero(A))}
+
+
+def factorisation_details(circuit, factorisation):
+    return dict(circuit.factor_statistics or {})
+
+
+def stage(name, details=None):
+    # Record a method of MNA as a stage of the solver, details gives statistics from the circuit and the result
+    # With instrumentation off the method is called directly, which only costs checking one attribute
+    def decorator(method):
+        @functools.wraps(method)
+        def instrumented(self, *args, **kwargs):
+            if self.instrumentation is None:
+                return method(self, *args, **kwargs)
+            return self.Run_stage(name, details, method, args, kwargs)
+        return instrumented
+    return decorator
 
 
 # Main class
 class MNA:
-    def __init__(self, file_name, optimised):
+    def __init__(self, file_name, optimised=None, solver=None, solver_options=None, ordering=None, reduce=False):
         # Netlist text file
         self.file_name = file_name
         # Choose whether to use optimisation technique or not
+        # True uses sparse matrices, False dense matrices and None chooses a solver from the size of the circuit
         self.optimised = optimised
-        # List of components
-        self.components = []
-        # Table for hashed nodes
-        self.hash_table = {}
+        # Name of the solver in Solvers.solvers, overrides optimised, and options passed to it
+        self.solver = solver
+        self.solver_options = solver_options or {}
+        # Name of the node ordering in Ordering.orderings used before factorising, None keeps the netlist order
+        # unless the solver is chosen automatically
+        self.ordering = ordering
+        # Reduce series and parallel resistors before solving with x_matrix
+        self.reduce = reduce
+        # What is recorded about every stage (None, 'time' or 'full') and the records by stage name
+        self.instrumentation = default_instrumentation
+        self.stage_statistics = {}
+        # Memory in use when each running stage started and the largest peak of the stages inside it
+        self.stage_memory = []
+        # Subcircuit definitions by name and the definition being read
+        self.subcircuits = {}
+        self.subcircuit = None
+        # Subcircuit instances as (name, subcircuit name, list of nodes)
+        self.instances = []
+        # Nodes of all instances of each subcircuit, one row per instance
+        self.instance_groups = {}
+        # Table of components
+        self.components = ComponentTable()
         # Number of voltages sources
         self.voltage_count = 0
         # Number of nodes
@@ -54,127 +715,439 @@ class MNA:
         self.unit_prefixes = {'f': 'e-15', 'p': 'e-12', 'n': 'e-9', 'u': 'e-6', 'm': 'e-3', 'k': 'e3',
                               'M': 'e6', 'G': 'e9', 'T': 'e12'}
 
-    def Parse_netlist(self):
-        nodes = []
-        lines = []
-
-        # Open a netlist text file
-        f = open(self.file_name, 'r')
-        # Cycle through each netlist lines
-        for line in f:
-            # Add each line to a list
-            lines.append(line.split())
-        # Close the file
-        f.close()
-
-        # Cycle through component list
-        for line in lines:
-            # Add component's nodes
-            nodes.append(line[1:3])
-            # Convert component's unit prefix into a float value
-            for prefix, prefix_value in self.unit_prefixes.items():
-                # Find component's unit prefix in unit prefix dictionary
-                if prefix in line[3]:
-                    # Replace string with float value
-                    line[3] = line[3].replace(prefix, prefix_value)
+    @classmethod
+    def from_binary(cls, file_name, optimised=None, solver=None, solver_options=None, ordering=None,
+                    reduce=False):
+        # Create MNA from a compiled netlist
+        circuit = cls(file_name, optimised, solver, solver_options, ordering, reduce)
+        circuit.Load_binary()
+        return circuit
+
+    @staticmethod
+    def is_binary(file_name):
+        # Check if a file is a compiled netlist
+        with open(file_name, 'rb') as f:
+            return f.read(len(binary_magic)) == binary_magic
+
+    def Load_binary(self):
+        # Memory-map a compiled netlist instead of parsing text
+        self.components = ComponentTable.from_binary(self.file_name)
+        # Count number of independent voltage sources
+        self.voltage_count = int(numpy.count_nonzero(self.components.select('V')))
+        # Nodes were already mapped when the netlist was compiled
+        self.Nodes()
+
+    def Compile_netlist(self, binary_file_name):
+        # Save parsed netlist as a compiled netlist which can be loaded with Load_binary
+        if self.instances:
+            raise ValueError('Netlists with subcircuits cannot be compiled')
+        self.components.write_binary(binary_file_name)
+
+    @stage('parse', parse_details)
+    def Parse_netlist(self, chunk_size=1 << 20):
+        # Compiled netlists do not need to be parsed
+        if self.is_binary(self.file_name):
+            self.Load_binary()
+            return
+
+        # Netlist is read in chunks of fixed size so memory use does not depend on file size
+        start_time = time.perf_counter()
+        # Number of bytes read from the file
+        self.bytes_parsed = 0
+        # Part of the last line which continues in the next chunk
+        remainder = b''
+
+        # Open a netlist file
+        with open(self.file_name, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
                     break
+                self.bytes_parsed += len(chunk)
+                chunk = remainder + chunk
+                # Only complete lines are parsed, the rest is kept for the next chunk
+                end = chunk.rfind(b'\n') + 1
+                remainder = chunk[end:]
+                self.Parse_lines(chunk[:end].decode())
+            # Last line might not end with a new line
+            self.Parse_lines(remainder.decode())
+        self.Parsed(start_time)
+
+    @stage('parse', parse_details)
+    def Parse_text(self, text):
+        # Parse a netlist given as text instead of a file, e.g. a netlist sent to the solver service
+        start_time = time.perf_counter()
+        self.bytes_parsed = len(text)
+        self.Parse_lines(text)
+        self.Parsed(start_time)
 
-            # Create components
-            self.components.append(circuit_component(line[0][0].upper(), line[1], line[2], float(line[3])))
+    def Parsed(self, start_time):
+        # Finish parsing once all lines are read
+        self.Instances()
 
-            # Count number of independent voltage sources
-            if line[0][0] == 'V':
-                self.voltage_count += 1
+        # Count number of independent voltage sources
+        self.voltage_count = int(numpy.count_nonzero(self.components.select('V')))
+
+        # Time taken and throughput in megabytes per second
+        self.parse_time = time.perf_counter() - start_time
+        self.parse_throughput = self.bytes_parsed / 1e6 / self.parse_time if self.parse_time > 0 else 0.0
 
         # Map string nodes to integer nodes
         self.Nodes()
 
+    def Parse_lines(self, text):
+        # Subcircuit definitions and instances are read line by line
+        if self.subcircuit is not None or subcircuit_line.search(text):
+            self.Parse_hierarchy(text)
+            return
+
+        # Split text into words, each component line has four: name, high node, low node and value
+        words = text.split()
+        if not words:
+            return
+        lines = text.splitlines()
+
+        # Every non-empty line has exactly four words, comparing only the total number of words lets
+        # lines with too many and too few words cancel out
+        if not set(map(len, map(str.split, lines))) <= {0, 4}:
+            for line in lines:
+                if line.strip() and len(line.split()) != 4:
+                    raise ValueError('Netlist line does not have four parts: ' + line.strip())
+
+        # Turn words into columns
+        names = words[0::4]
+        high_str = words[1::4]
+        low_str = words[2::4]
+        value_str = words[3::4]
+
+        # Component type is the first letter of its name
+        types = numpy.frombuffer(''.join([name[0] for name in names]).upper().encode('ascii', 'replace'),
+                                 dtype=numpy.uint8)
+        # Only independent voltage sources, current sources and resistors can be solved
+        unknown = numpy.flatnonzero(~numpy.isin(types, numpy.frombuffer(b'VIR', dtype=numpy.uint8)))
+        if len(unknown):
+            raise ValueError('Unknown component type: ' + ' '.join(words[4 * unknown[0]:4 * unknown[0] + 4]))
+
+        # Map string nodes to integer nodes
+        # Nodes are taken in the same order as they appear in the file (high node, then low node)
+        node_str = [None] * (2 * len(names))
+        node_str[0::2] = high_str
+        node_str[1::2] = low_str
+        hash_table = self.components.nodes.mapping()
+        # String nodes which are not yet mapped get the next free integers, in order of appearance
+        new_nodes = list(itertools.filterfalse(hash_table.__contains__, dict.fromkeys(node_str)))
+        hash_table.update(zip(new_nodes, range(len(hash_table), len(hash_table) + len(new_nodes))))
+        self.components.nodes.extend(new_nodes)
+        node_int = list(map(hash_table.__getitem__, node_str))
+
+        # Convert values into floats
+        try:
+            values = numpy.array(value_str, dtype=float)
+        except ValueError:
+            # Replace unit prefixes at the end of values with exponents for the whole block at once
+            text = '\n'.join(value_str) + '\n'
+            for prefix, prefix_value in self.unit_prefixes.items():
+                text = text.replace(prefix + '\n', prefix_value + '\n')
+            try:
+                values = numpy.array(text.split(), dtype=float)
+            except ValueError:
+                # Unit prefixes in other places are converted one by one
+                values = numpy.array(list(map(self.Value, value_str)))
+
+        # Add components to the table
+        self.components.extend(names, types, node_int[0::2], node_int[1::2], values)
+
+    def Parse_hierarchy(self, text):
+        # Lines of subcircuit definitions are kept in the definition until it is reduced
+        # Other component lines are collected and parsed together as before
+        # They are parsed before every definition and instance, so nodes keep their order of appearance
+        block = []
+
+        def parse_block():
+            if block:
+                self.Parse_lines('\n'.join(block))
+                block.clear()
+
+        for line in text.splitlines():
+            words = line.split()
+            if not words:
+                continue
+            keyword = words[0].lower()
+
+            if self.subcircuit is not None:
+                if keyword == '.ends':
+                    self.subcircuit = None
+                elif keyword == '.subckt':
+                    raise ValueError('Subcircuit definitions cannot be nested: ' + line.strip())
+                else:
+                    self.subcircuit.lines.append(words)
+            elif keyword == '.subckt':
+                if len(words) < 3:
+                    raise ValueError('Subcircuit needs a name and at least one port: ' + line.strip())
+                if words[1] in self.subcircuits:
+                    raise ValueError('Subcircuit ' + words[1] + ' is defined more than once')
+                parse_block()
+                self.subcircuit = self.subcircuits[words[1]] = Subcircuit(words[1], words[2:])
+            elif keyword == '.ends':
+                raise ValueError('.ends without .subckt: ' + line.strip())
+            elif keyword[0] == 'x':
+                if len(words) < 3:
+                    raise ValueError('Subcircuit instance needs nodes and a subcircuit name: ' + line.strip())
+                parse_block()
+                self.instances.append((words[0], words[-1], [self.components.nodes.intern(node)
+                                                             for node in words[1:-1]]))
+            else:
+                block.append(line)
+        parse_block()
+
+    def Instances(self):
+        # Check subcircuit instances once the whole netlist is read and group them by subcircuit
+        if self.subcircuit is not None:
+            raise ValueError('Subcircuit ' + self.subcircuit.name + ' has no .ends line')
+        groups = {}
+        for name, subcircuit, nodes in self.instances:
+            if subcircuit not in self.subcircuits:
+                raise ValueError('Subcircuit ' + subcircuit + ' used by ' + name + ' is not defined')
+            if len(nodes) != len(self.subcircuits[subcircuit].ports):
+                raise ValueError('Instance ' + name + ' needs ' + str(len(self.subcircuits[subcircuit].ports)) +
+                                 ' nodes')
+            groups.setdefault(subcircuit, []).append(nodes)
+        self.instance_groups = {subcircuit: numpy.array(nodes, dtype=numpy.int64)
+                                for subcircuit, nodes in groups.items()}
+
+    def Reduction(self, subcircuit):
+        # Conductance matrix and currents seen from the ports of a subcircuit
+        return self.subcircuits[subcircuit].Reduce(self.subcircuits, self.Value)
+
+    def Instance_voltages(self, name, x):
+        # Voltages of the nodes inside a subcircuit instance, found from the voltages of its ports
+        # Nodes inside subcircuits used by the instance are not included, only their ports
+        for instance, subcircuit, nodes in self.instances:
+            if instance == name:
+                break
+        else:
+            raise KeyError('Subcircuit instance ' + name + ' is not in the netlist')
+        reduction = self.Reduction(subcircuit)
+        ports = numpy.concatenate([[0.0], x[:self.node_count - 1]])[nodes]
+        voltages = dict(zip(self.subcircuits[subcircuit].ports, ports.tolist()))
+        if reduction['factorisation'] is not None:
+            internal = reduction['factorisation'].solve(reduction['internal_current'] - reduction['coupling'] @ ports)
+            voltages.update(zip(reduction['internal_nodes'], internal.tolist()))
+        return voltages
+
+    def Value(self, text):
+        # Convert component's value with optional unit prefix into a float value
+        # Unit prefix is normally the last character
+        exponent = self.unit_prefixes.get(text[-1])
+        if exponent is not None:
+            return float(text[:-1] + exponent)
+
+        # Find component's unit prefix anywhere in the value
+        for prefix, prefix_value in self.unit_prefixes.items():
+            if prefix in text:
+                # Replace string with float value
+                return float(text.replace(prefix, prefix_value))
+
+        return float(text)
+
+    @stage('nodes')
     def Nodes(self):
-        # Add zero to the hash table
-        self.hash_table['0'] = self.node_count
+        # Node names are mapped to integers while components are added to the table
+        # Ground ('0') is always mapped to 0 and other nodes are numbered in order of appearance
         # Count number of nodes in the hash table
-        self.node_count += 1
-
-        # Loop through components
-        for component in self.components:
-            # If string node is not yet mapped
-            if component.high_str not in self.hash_table:
-                # String node gets mapped to integer node
-                self.hash_table[component.high_str] = self.node_count
-                # Count nodes
-                self.node_count += 1
-            # Repeat for low string nodes
-            if component.low_str not in self.hash_table:
-                self.hash_table[component.low_str] = self.node_count
-                self.node_count += 1
-
-            # Add high and low integer nodes to instance attributes
-            component.high = self.hash_table[component.high_str]
-            component.low = self.hash_table[component.low_str]
+        self.node_count = len(self.components.nodes)
 
-    def A_matrix(self):
+    @property
+    def hash_table(self):
+        # Table for hashed nodes, only built when it is needed
+        return self.components.nodes.mapping()
+
+    def Component_groups(self, values=None):
+        # Group components by type into arrays of high nodes, low nodes and values
+        # Values of all components can be given to use instead of the values in the netlist
+        if values is None:
+            values = self.components.values
+        groups = {}
+        for comp_type in ('V', 'I', 'R'):
+            selected = self.components.select(comp_type)
+            groups[comp_type] = (self.components.high[selected].astype(int), self.components.low[selected].astype(int),
+                                 values[selected])
+
+        return groups
+
+    def Connected_nodes(self, selected):
+        # Label of the connected part of every node in the graph made from the selected components
+        # and subcircuit instances
+        instance_high, instance_low = self.Instance_edges()
+        high = numpy.concatenate([self.components.high[selected], instance_high])
+        low = numpy.concatenate([self.components.low[selected], instance_low])
+        if len(high) < small_graph_limit:
+            parts = DisjointSet(self.node_count)
+            for first, second in zip(high.tolist(), low.tolist()):
+                parts.union(first, second)
+            return numpy.array(parts.roots(), dtype=int)
+
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        graph = coo_matrix((numpy.ones(len(high), dtype=numpy.int8), (high, low)),
+                           shape=(self.node_count, self.node_count))
+        return connected_components(graph, directed=False)[1]
+
+    def Instance_edges(self):
+        # Pairs of nodes joined through subcircuit instances, as high and low nodes
+        # Ports are joined when their entry in the reduced conductance matrix is not zero, and to ground
+        # when the subcircuit connects them to ground inside
+        high, low = [numpy.zeros(0, dtype=numpy.int64)], [numpy.zeros(0, dtype=numpy.int64)]
+        for subcircuit, nodes in self.instance_groups.items():
+            conductance = self.Reduction(subcircuit)['conductance']
+            first, second = numpy.nonzero(numpy.triu(conductance, 1))
+            grounded = numpy.flatnonzero(numpy.abs(conductance.sum(axis=1)) > 1e-9 * numpy.abs(conductance.diagonal()))
+            high += [nodes[:, first].ravel(), nodes[:, grounded].ravel()]
+            low += [nodes[:, second].ravel(), numpy.zeros(len(nodes) * len(grounded), dtype=numpy.int64)]
+        return numpy.concatenate(high), numpy.concatenate(low)
+
+    @stage('topology')
+    def Check_topology(self):
+        # Find problems which make the A matrix singular before trying to solve the circuit
+        # Returns a list of (problem, names of components), problem is one of topology_problems
+        problems = []
+        components = self.components
+        if self.node_count == 0:
+            return problems
+        high = components.high.astype(int)
+        low = components.low.astype(int)
+        names = components.names
+
+        # Parts of the circuit not connected to ground through any component
+        parts = self.Connected_nodes(numpy.ones(len(components), dtype=bool))
+        floating = parts[high] != parts[0]
+        # Subcircuit instances are named by the part of their first port
+        instance_parts = numpy.array([parts[nodes[0]] for name, subcircuit, nodes in self.instances], dtype=int)
+        for part in numpy.unique(numpy.concatenate([parts[high][floating],
+                                                    instance_parts[instance_parts != parts[0]]])):
+            problems.append(('floating', [names[position] for position in
+                                          numpy.flatnonzero(floating & (parts[high] == part))] +
+                             [self.instances[position][0] for position in numpy.flatnonzero(instance_parts == part)]))
+
+        # Parts of the circuit connected to the rest only through current sources
+        # Current sources between two such parts set the current, but no voltage between them
+        conducting = self.Connected_nodes(components.select('R') | components.select('V'))
+        cut_sets = {}
+        for position in numpy.flatnonzero(components.select('I') & ~floating):
+            for part in {conducting[high[position]], conducting[low[position]]} - {conducting[0]}:
+                cut_sets.setdefault(part, []).append(names[position])
+        problems += [('current cut-set', cut_set) for cut_set in cut_sets.values()]
+
+        # Loops made only from voltage sources, a source is in a loop when its nodes are already joined by others
+        nodes = DisjointSet(self.node_count)
+        # Voltage sources already joining nodes, kept as a forest to find the rest of each loop
+        forest = {}
+        for position in numpy.flatnonzero(components.select('V')):
+            first, second = int(high[position]), int(low[position])
+            if nodes.union(first, second):
+                forest.setdefault(first, []).append((second, position))
+                forest.setdefault(second, []).append((first, position))
+                continue
+
+            # Path between the source's nodes through the forest, found by breadth-first search
+            previous = {first: None}
+            queue = [first]
+            for node in queue:
+                if node == second:
+                    break
+                for neighbour, source in forest.get(node, ()):
+                    if neighbour not in previous:
+                        previous[neighbour] = (node, source)
+                        queue.append(neighbour)
+            loop = [names[position]]
+            node = second
+            while previous[node] is not None:
+                node, source = previous[node]
+                loop.append(names[source])
+            problems.append(('voltage loop', loop))
+
+        return problems
+
+    def Stamp(self, values=None):
         # Calculate matrix size
         self.matrix_size = self.node_count + self.voltage_count - 1
         # Get voltage index
         voltage_index = self.matrix_size - self.voltage_count
+
+        # Entries of the A matrix in COO format
+        Sparse = CSC()
+        groups = self.Component_groups(values)
+
+        # Resistors affect G matrix
+        # G matrix rules:
+        #  - each line and row corresponds to a specific node
+        #  - diagonal is positive and contains total self conductance of each node
+        #  - non-diagonal are negative and containing the mutual conductance between nodes
+        high, low, value = groups['R']
+        conductance = 1 / value
+        # Ground (node 0) has no row or column so indices are shifted by one
+        high = high - 1
+        low = low - 1
+        high_connected = high >= 0
+        low_connected = low >= 0
+        both_connected = high_connected & low_connected
+
+        # Diagonal self-conductance of nodes
+        Sparse.insert_many(high[high_connected], high[high_connected], conductance[high_connected])
+        Sparse.insert_many(low[low_connected], low[low_connected], conductance[low_connected])
+        # Mutual conductance between nodes
+        Sparse.insert_many(high[both_connected], low[both_connected], -conductance[both_connected])
+        Sparse.insert_many(low[both_connected], high[both_connected], -conductance[both_connected])
+
+        # Subcircuit instances add the conductance matrix seen from their ports to G matrix
+        for subcircuit, nodes in self.instance_groups.items():
+            conductance = self.Reduction(subcircuit)['conductance']
+            ports = nodes.shape[1]
+            # Entry (i, j) of the conductance matrix goes to the row of port i and the column of port j
+            rows = numpy.repeat(nodes - 1, ports, axis=1)
+            columns = numpy.tile(nodes - 1, ports)
+            data = numpy.broadcast_to(conductance.ravel(), rows.shape)
+            kept = (rows >= 0) & (columns >= 0) & (data != 0)
+            Sparse.insert_many(rows[kept], columns[kept], data[kept])
+
+        # Independent voltage sources affect B and C matrices
+        # Rules for B matrix:
+        #  - each column corresponds to a independent voltage source
+        #  - 1 is written when node is connected to positive terminal
+        #  - negative 1 is written when node is connected to negative terminal
+        #  - 0 is written when it is not incident
+        # C matrix is a transpose of B
+        # D matrix consists entirely of zero values so it does not need to be filled
+        high, low, value = groups['V']
+        # Each voltage source gets its own row and column after the nodes
+        source = voltage_index + numpy.arange(len(value))
+        high = high - 1
+        low = low - 1
+        high_connected = high >= 0
+        low_connected = low >= 0
+
+        # B matrix
+        Sparse.insert_many(high[high_connected], source[high_connected], 1)
+        Sparse.insert_many(low[low_connected], source[low_connected], -1)
+        # C matrix
+        Sparse.insert_many(source[high_connected], high[high_connected], 1)
+        Sparse.insert_many(source[low_connected], low[low_connected], -1)
+
+        return Sparse
+
+    @stage('A_matrix', matrix_details)
+    def A_matrix(self):
+        # Get entries of the A matrix
+        rows, columns, data = self.Stamp().triplets()
         # Create two dimensional A  matrix filled with zeros
         A = numpy.zeros((self.matrix_size, self.matrix_size))
-
-        # Loop though components and fill the matrix accordingly
-        for component in self.components:
-            # Only independent voltage sources and resistors affect A matrix
-            # A matrix is made up of four sub-matrices: G, B, C and D
-            # D matrix consists entirely of zero values so it does not need to be filled
-
-            # Independent voltage source
-            if component.comp_type == 'V':
-                # Affects B and C matrices
-                # Rules for B matrix:
-                #  - each column corresponds to a independent voltage source
-                #  - 1 is written when node is connected to positive terminal
-                #  - negative 1 is written when node is connected to negative terminal
-                #  - 0 is written when it is not incident
-                # C matrix is a transpose of B
-                if component.high != 0:
-                    # B matrix
-                    A[component.high - 1][voltage_index] = A[component.high - 1][voltage_index] + 1
-                    # C matrix
-                    A[voltage_index][component.high - 1] = A[voltage_index][component.high - 1] + 1
-                if component.low != 0:
-                    # B matrix
-                    A[component.low - 1][voltage_index] = A[component.low - 1][voltage_index] - 1
-                    # C matrix
-                    A[voltage_index][component.low - 1] = A[voltage_index][component.low - 1] - 1
-
-                # Increase index
-                voltage_index += 1
-
-            # Resistor
-            elif component.comp_type == 'R':
-                # Affects G matrix
-                # G matrix rules:
-                #  - each line and row corresponds to a specific node
-                #  - diagonal is positive and contains total self conductance of each node
-                #  - non-diagonal are negative and containing the mutual conductance between nodes
-
-                # Diagonal self-conductance of node
-                if component.high != 0:
-                    A[component.high - 1][component.high - 1] = A[component.high - 1][
-                                                                    component.high - 1] + 1 / component.value
-                if component.low != 0:
-                    A[component.low - 1][component.low - 1] = A[component.low - 1][
-                                                                  component.low - 1] + 1 / component.value
-
-                # Mutual conductance between nodes
-                if component.high != 0 and component.low != 0:
-                    A[component.high - 1][component.low - 1] = A[component.high - 1][
-                                                                   component.low - 1] - 1 / component.value
-                    A[component.low - 1][component.high - 1] = A[component.low - 1][
-                                                                   component.high - 1] - 1 / component.value
+        # Add every entry, entries with the same position are summed
+        numpy.add.at(A, (rows, columns), data)
 
         return A
 
-    def z_matrix(self):
+    @stage('z_matrix')
+    def z_matrix(self, values=None):
         # Calculate matrix size
         self.matrix_size = self.node_count + self.voltage_count - 1
 
@@ -187,159 +1160,578 @@ class MNA:
         else:
             voltage_index = self.matrix_size - self.voltage_count
 
-        # Create one dimensional z matrix filled with zeros
-        z = numpy.zeros(self.matrix_size)
-
-        # Loop though components and fill the matrix accordingly
-        for component in self.components:
-            # z matrix holds values of independent voltage and current sources
-            # It consists of i and e sub-matrices
-
-            # Independent voltage source
-            if component.comp_type == 'V':
-                # Affects e matrix
-                # Rules for e matrix:
-                #  - its size corresponds to number of independent voltage sources
-                #  - holds the values of corresponding independent voltage sources
-
-                # Voltage vale gets added to matrix
-                z[voltage_index] = component.value
-
-                # Increase index
-                voltage_index += 1
-
-            # Independent current source
-            elif component.comp_type == 'I':
-                # Affects i matrix
-                # Rules for i matrix:
-                #  - each element in the matrix corresponds to a particular node
-                #  - consists of the sum of the currents flowing through the passive components
-                #  - if there are no current sources connected to the node, the current value is 0
-                if component.high != 0:
-                    # Negative current value gets added to matrix
-                    z[component.high - 1] = z[component.high - 1] - component.value
-                if component.low != 0:
-                    # Positive current value gets added to matrix
-                    z[component.low - 1] = z[component.low - 1] + component.value
-
-        return z
+        # Values of all components, given as one row per z matrix when a batch of z matrices is needed
+        if values is None:
+            values = self.components.values
+        values = numpy.asarray(values, dtype=float).T
+
+        # Create z matrix filled with zeros
+        # Each column holds one z matrix when a batch of z matrices is created
+        z = numpy.zeros((self.matrix_size,) + values.shape[1:])
+
+        # z matrix holds values of independent voltage and current sources
+        # It consists of i and e sub-matrices
+
+        # Independent voltage sources affect e matrix
+        # Rules for e matrix:
+        #  - its size corresponds to number of independent voltage sources
+        #  - holds the values of corresponding independent voltage sources
+        selected = self.components.select('V')
+        z[voltage_index:voltage_index + self.voltage_count] = values[selected]
 
+        # Independent current sources affect i matrix
+        # Rules for i matrix:
+        #  - each element in the matrix corresponds to a particular node
+        #  - consists of the sum of the currents flowing through the passive components
+        #  - if there are no current sources connected to the node, the current value is 0
+        selected = self.components.select('I')
+        high = self.components.high[selected].astype(int)
+        low = self.components.low[selected].astype(int)
+        value = values[selected]
+        # Negative current value gets added to high node
+        numpy.subtract.at(z, high[high != 0] - 1, value[high != 0])
+        # Positive current value gets added to low node
+        numpy.add.at(z, low[low != 0] - 1, value[low != 0])
+
+        # Current sources inside subcircuit instances add currents at their ports
+        for subcircuit, nodes in self.instance_groups.items():
+            current = numpy.broadcast_to(self.Reduction(subcircuit)['current'], nodes.shape)
+            kept = (nodes != 0) & (current != 0)
+            numpy.add.at(z, nodes[kept] - 1, current[kept].reshape((-1,) + (1,) * (z.ndim - 1)))
+
+        return z.T
+
+    @stage('A_matrix', matrix_details)
     def Optimised_A_matrix(self):
-        # Calculate matrix size
-        self.matrix_size = self.node_count + self.voltage_count - 1
+        import scipy.sparse as sparse
 
-        # Create lists for constructing CSC
-        Sparse = CSC()
+        # Get entries of the A matrix
+        rows, columns, data = self.Stamp().triplets()
 
-        # Get voltage index
-        if self.voltage_count > 0:
-            voltage_index = self.matrix_size - self.voltage_count
-        else:
-            voltage_index = 0
-
-        # loop through all components
-        for component in self.components:
-
-            if component.comp_type == 'R':
-                # affects G matrix
-                # diagonal self-conductance of node
-                if component.high != 0:
-                    Sparse.insert(component.high - 1, component.high - 1, 1 / component.value)
-                if component.low != 0:
-                    Sparse.insert(component.low - 1, component.low - 1, 1 / component.value)
-
-                # mutual conductance between nodes
-                if component.high != 0 and component.low != 0:
-                    Sparse.insert(component.high - 1, component.low - 1, 1 / component.value)
-                    Sparse.insert(component.low - 1, component.high - 1, 1 / component.value)
-
-            elif component.comp_type == 'V':
-                # affects the B and C
-                if component.high != 0:
-                    Sparse.insert(component.high - 1, voltage_index, 1)
-                    Sparse.insert(voltage_index, component.high - 1, 1)
-                if component.low != 0:
-                    Sparse.insert(component.low - 1, voltage_index, 1)
-                    Sparse.insert(voltage_index, component.low - 1, 1)
-
-                # Increase index
-                voltage_index = voltage_index + 1
-
-        # Setup sparse A matrix
-        matrix = sparse.coo_matrix((Sparse.data, (Sparse.rows, Sparse.columns)),
-                                   shape=(self.matrix_size, self.matrix_size))
+        # Setup sparse A matrix, entries with the same position are summed
+        matrix = sparse.coo_matrix((data, (rows, columns)), shape=(self.matrix_size, self.matrix_size))
 
         # convert to CSC matrix format
         A = matrix.tocsc()
 
         return A
 
-    def x_matrix(self):
-        # Get z matrix
-        z = self.z_matrix()
-        # Get A
-        # Choose whether to use sparse optimisation or not
-        if self.optimised:
-            A = self.Optimised_A_matrix()
-            # Solve linear matrix equation
-            x = linsolve.spsolve(A, z)
-        else:
-            A = self.A_matrix()
-            # Solve linear matrix equation
-            x = numpy.linalg.solve(A, z)
+    def Pattern(self):
+        # Sparsity pattern of A matrix, it only depends on how components are connected
+        rows, columns, data = self.Stamp().triplets()
+        self.pattern = SparsityPattern(rows, columns, self.matrix_size)
+        return self.pattern
 
-        return x
+    def Restamp(self, values):
+        # Sparse A matrix for new component values, reusing the sparsity pattern
+        if getattr(self, 'pattern', None) is None:
+            self.Pattern()
+        rows, columns, data = self.Stamp(values).triplets()
+        return self.pattern.matrix(data)
 
-    def print_results(self, x):
-        # Create text with calculated values which gets displayed to the user
-        node_voltages_text = 'Voltage potential on each node:\n'
-        # Count x matrix index
-        count = 0
+    def Solver_name(self):
+        # Solver given by the user is always used
+        if self.solver is not None:
+            if self.solver not in solvers:
+                raise ValueError('Unknown solver ' + str(self.solver) + ', choose from: ' + ', '.join(solvers))
+            return self.solver
+        if self.optimised is not None:
+            return 'superlu' if self.optimised else 'dense'
 
-        # Loop through nodes to allocate appropriate nodal voltages
-        for node in self.hash_table:
-            if node != '0':
-                node_voltages_text += 'node' + str(self.hash_table[node]) + ': '
+        # Otherwise the solver is chosen from the size of A and the number of its non-zero entries
+        # Each resistor fills at most four entries and each voltage source four
+        self.matrix_size = self.node_count + self.voltage_count - 1
+        nonzeros = 4 * len(self.components) - 4 * int(numpy.count_nonzero(self.components.select('I')))
+        return choose_solver(self.matrix_size, nonzeros, self.voltage_count)
 
-                #  Display calculated nodal voltages
-                if x[count] > 0:
-                    # Format value to three decimal places
-                    node_voltages_text += str('{:.3f}'.format(x[count])) + ' V\n'
+    def Ordering_name(self):
+        # Ordering given by the user is always used
+        if self.ordering is not None or self.solver is not None or self.optimised is not None:
+            return self.ordering
+        # Automatically chosen sparse LU orders nodes by minimum degree, which halves the fill of grids
+        # compared to SuperLU's own column ordering (1000 x 1000 resistor grid: 11.6 s instead of 20 s)
+        return 'amd' if self.solver_name == 'superlu' else None
 
-                # If the value is negative, multiply by -1 to get positive value
-                else:
-                    node_voltages_text += str(float('{:.3f}'.format(x[count])) * (-1)) + ' V\n'
+    def Topology_key(self):
+        # Key which is the same for circuits with the same A matrix
+        # A matrix depends on how resistors and voltage sources are connected and on resistor values only
+        key = hashlib.blake2b(struct.pack('<2Q', self.node_count, self.voltage_count))
+        # Each solver and ordering keeps its own factorisation
+        key.update(repr((self.solver_name, sorted(self.solver_options.items()), self.ordering_name)).encode())
+        selected = ~self.components.select('I')
+        key.update(self.components.types[selected].tobytes())
+        key.update(self.components.high[selected].tobytes())
+        key.update(self.components.low[selected].tobytes())
+        key.update(self.components.values[self.components.select('R')].tobytes())
+        for subcircuit, nodes in sorted(self.instance_groups.items()):
+            key.update(self.subcircuits[subcircuit].Key(self.subcircuits).encode())
+            key.update(nodes.tobytes())
+        return key.hexdigest()
 
-                # Count x matrix index
-                count += 1
+    @stage('factorise', factorisation_details)
+    def Factorise(self):
+        # Factorisation of A matrix made by the chosen solver, reused while topology and resistor values do not change
+        self.solver_name = self.Solver_name()
+        self.ordering_name = self.Ordering_name()
+        key = self.Topology_key()
+        # Values the factorisation was made with, used for incremental updates
+        self.factorised_values = self.components.values.copy()
+        with cache_lock:
+            factorisation = factorisation_cache.get(key)
+            if factorisation is not None:
+                factorisation_cache.move_to_end(key)
+        if factorisation is not None:
+            self.matrix_size = self.node_count + self.voltage_count - 1
+            self.Use_factorisation(factorisation)
+            return factorisation
 
-        # Check how many voltages sources there in the circuit
-        if self.voltage_count > 1:
-            current_of_voltage_source_text = '\nCurrents flowing through independent voltage sources:\n'
+        solver = solvers[self.solver_name]
+        A = self.A_matrix() if solver.dense else self.Optimised_A_matrix()
+        factorisation = self.Ordered_factorisation(solver, A)
+        if self.instrumentation == 'full':
+            factorisation.statistics['condition'] = condition_estimate(A, factorisation)
+
+        # Store factorisation and forget the least recently used one when the cache is full
+        with cache_lock:
+            factorisation_cache[key] = factorisation
+            if len(factorisation_cache) > factorisation_cache_size:
+                factorisation_cache.popitem(last=False)
+        self.Use_factorisation(factorisation)
+        return factorisation
+
+    def Node_graph(self):
+        import scipy.sparse as sparse
+
+        # Graph of nodes joined by resistors or voltage sources, ground (node 0) is left out
+        # Current sources do not change A so they are not part of the graph
+        selected = ~self.components.select('I')
+        instance_high, instance_low = self.Instance_edges()
+        high = numpy.concatenate([self.components.high[selected], instance_high]).astype(numpy.int64) - 1
+        low = numpy.concatenate([self.components.low[selected], instance_low]).astype(numpy.int64) - 1
+        connected = (high >= 0) & (low >= 0) & (high != low)
+        size = self.node_count - 1
+        graph = sparse.coo_matrix((numpy.ones(numpy.count_nonzero(connected), dtype=numpy.int8),
+                                   (high[connected], low[connected])), shape=(size, size)).tocsr()
+        return graph + graph.T
+
+    def Reorder(self):
+        # New order of the unknowns of x, the nodes are reordered and voltage source currents stay last
+        # Returns None when the nodes keep their order or the solver orders them itself
+        if self.ordering_name is None:
+            return None
+        if self.ordering_name not in orderings:
+            raise ValueError('Unknown ordering ' + str(self.ordering_name) + ', choose from: ' + ', '.join(orderings))
+        order = orderings[self.ordering_name](self.Node_graph())
+        if order is None:
+            return None
+        return numpy.concatenate([order, numpy.arange(self.node_count - 1, self.matrix_size)])
+
+    def Ordered_factorisation(self, solver, A):
+        # Factorise A with its rows and columns in the order of the node ordering
+        start_time = time.perf_counter()
+        permutation = self.Reorder()
+        ordering_time = time.perf_counter() - start_time
+
+        # SuperLU keeps the ordering: rows are ordered like columns and a diagonal pivot is kept unless it is
+        # much smaller than the rest of its column, which only happens for nodes joined to ground through
+        # voltage sources alone, those are swapped with voltage source rows so the system stays solvable
+        options = dict(self.solver_options)
+        if self.ordering_name is not None and solver is solvers['superlu']:
+            options.setdefault('permc_spec', 'NATURAL' if permutation is not None else 'MMD_AT_PLUS_A')
+            options.setdefault('symmetric', True)
+            options.setdefault('diag_pivot_thresh', 0.01)
+
+        start_time = time.perf_counter()
+        if permutation is None:
+            factorisation = solver(A, options)
+            ordered = A
         else:
-            current_of_voltage_source_text = '\nCurrent flowing through independent voltage source:\n'
+            ordered = A[numpy.ix_(permutation, permutation)] if solver.dense else \
+                A[permutation][:, permutation].tocsc()
+            factorisation = ReorderedSolver(solver(ordered, options), permutation)
+        factor_time = time.perf_counter() - start_time
 
-        # Loop through independent nodal voltages to allocate appropriate current values
-        for v in range(self.voltage_count):
-            current_of_voltage_source_text += 'Current through V' + str(v + 1) + ': '
+        # Size of A and its factors and time taken to order and factorise it
+        # Bandwidth is only measured for the node rows, voltage source rows are always last
+        nonzeros = int(numpy.count_nonzero(A)) if solver.dense else int(A.nnz)
+        factor_nonzeros = getattr(factorisation, 'nonzeros', None)
+        nodes = self.node_count - 1
+        factorisation.statistics = {
+            'solver': self.solver_name, 'ordering': self.ordering_name, 'size': self.matrix_size,
+            'ordering_time': ordering_time, 'factor_time': factor_time,
+            'nonzeros': nonzeros, 'factor_nonzeros': factor_nonzeros,
+            'fill': factor_nonzeros / nonzeros if factor_nonzeros is not None and nonzeros else None,
+            'bandwidth': None if solver.dense else bandwidth(A[:nodes, :nodes]),
+            'ordered_bandwidth': None if solver.dense else bandwidth(ordered[:nodes, :nodes])}
+        return factorisation
 
-            # Display currents flowing through independent voltage sources
-            if x[count] > 0:
-                # Format value to three decimal places
-                current_of_voltage_source_text += str('{:.3f}'.format(x[count])) + ' A\n'
+    def Run_stage(self, name, details, method, arguments, keywords):
+        # Run a method as a stage and add its record to stage_statistics, then call the stage hooks
+        # Stages can run inside other stages (e.g. z_matrix inside x_matrix), each is recorded on its own
+        full = self.instrumentation == 'full'
+        if full:
+            import tracemalloc
 
-            # If the value is negative, multiply by -1 to get positive value
-            else:
-                current_of_voltage_source_text += str('{:.3f}'.format(x[count] * (-1))) + ' A\n'
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            self.stage_memory.append([tracemalloc.get_traced_memory()[0], 0])
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        try:
+            result = method(self, *arguments, **keywords)
+        finally:
+            seconds = time.perf_counter() - start_time
+            if full:
+                current, peak = tracemalloc.get_traced_memory()
+                before, inner_peak = self.stage_memory.pop()
+                peak = max(peak, inner_peak)
+                if self.stage_memory:
+                    self.stage_memory[-1][1] = max(self.stage_memory[-1][1], peak)
+                if started:
+                    tracemalloc.stop()
 
-            # Count x matrix index
-            count += 1
+        record = {'seconds': seconds}
+        if full:
+            record['allocated_bytes'] = current - before
+            record['peak_bytes'] = peak - before
+        if details is not None:
+            record.update(details(self, result))
 
-        # Create the final message
-        text = node_voltages_text + current_of_voltage_source_text
+        # Totals of all runs of the stage with statistics of the last run
+        total = self.stage_statistics.setdefault(name, {'calls': 0, 'total_seconds': 0.0})
+        total['calls'] += 1
+        total['total_seconds'] += seconds
+        total.update(record)
+        # Hooks added or removed while they are called take effect from the next stage
+        for hook in stage_hooks:
+            hook(self, name, record)
+        return result
+
+    def Use_factorisation(self, factorisation):
+        # Solutions made with an older factorisation cannot be reused for incremental updates
+        if factorisation is not getattr(self, 'factorisation', None):
+            # z matrix and solution with the factorised A matrix
+            self.update_z = None
+            self.update_y = None
+            # Columns of A^-1 U for each changed resistor, keyed by its position in the component table
+            self.update_columns = {}
+        self.factorisation = factorisation
+        # Fill and timings of the factorisation
+        self.factor_statistics = getattr(factorisation, 'statistics', None)
+
+    def Node_difference(self, high, low, M):
+        # Rows of M for high nodes minus rows for low nodes, ground (node 0) has no row
+        difference = numpy.zeros((len(high),) + M.shape[1:])
+        difference[high != 0] += M[high[high != 0] - 1]
+        difference[low != 0] -= M[low[low != 0] - 1]
+        return difference
+
+    @stage('update')
+    def Update_values(self, changes):
+        # Change values of some components and solve the circuit again without a new factorisation
+        # changes is a dictionary from component name to its new value (a number or a string such as '2.2k')
+        names = self.components.names.mapping()
+        for name, value in changes.items():
+            if name not in names:
+                raise KeyError('Component ' + name + ' is not in the netlist')
+            self.components.values[names[name]] = self.Value(value) if isinstance(value, str) else value
+
+        # Factorise the first time, later only the difference to the factorised A matrix is needed
+        if getattr(self, 'factorisation', None) is None:
+            self.Factorise()
+        z = self.z_matrix()
+
+        # Resistors whose value differs from the factorised A matrix
+        resistors = self.components.select('R') & (self.components.values != self.factorised_values)
+        changed = numpy.flatnonzero(resistors)
+        if len(changed) > incremental_rank_limit:
+            # Too many changes for a low-rank update, factorise again
+            self.Factorise()
+            return self.factorisation.solve(z)
+
+        # Each changed resistor adds conductance_change * u * u.T to A, where u is +1 on its high node
+        # and -1 on its low node (ground has no row)
+        # Sherman-Morrison-Woodbury formula gives the new solution from the old factorisation:
+        # x = y - Y (C^-1 + U.T Y)^-1 U.T y   with   y = A^-1 z,  Y = A^-1 U,  C = diag(conductance changes)
+        conductance_change = 1 / self.components.values[changed] - 1 / self.factorised_values[changed]
+        high = self.components.high[changed].astype(int)
+        low = self.components.low[changed].astype(int)
+
+        # y only changes when source values change
+        if self.update_z is None or not numpy.array_equal(z, self.update_z):
+            self.update_z = z
+            self.update_y = self.factorisation.solve(z)
+        y = self.update_y
+        if len(changed) == 0:
+            return y.copy()
+
+        # Columns of Y are kept, so editing the same resistors again needs no triangular solves
+        missing = [count for count, position in enumerate(changed) if position not in self.update_columns]
+        if len(self.update_columns) + len(missing) > incremental_rank_limit:
+            # Forget columns of resistors which are back to their factorised values
+            self.update_columns = {position: self.update_columns[position] for position in changed
+                                   if position in self.update_columns}
+        if missing:
+            U = numpy.zeros((self.matrix_size, len(missing)))
+            for column, count in enumerate(missing):
+                if high[count] != 0:
+                    U[high[count] - 1, column] += 1
+                if low[count] != 0:
+                    U[low[count] - 1, column] -= 1
+            for column, values in zip(missing, self.factorisation.solve(U).T):
+                self.update_columns[changed[column]] = values
+        Y = numpy.column_stack([self.update_columns[position] for position in changed])
+
+        capacitance = numpy.diag(1 / conductance_change) + self.Node_difference(high, low, Y)
+        try:
+            return y - Y @ numpy.linalg.solve(capacitance, self.Node_difference(high, low, y))
+        except numpy.linalg.LinAlgError:
+            # Update cannot be done this way (e.g. a resistor removed from a loop), factorise again
+            self.Factorise()
+            return self.factorisation.solve(z)
+
+    @stage('solve')
+    def Solve(self, z):
+        # Solve A x = z for one z matrix or a batch of z matrices given as rows of a 2D array
+        # Only triangular solves are needed once A is factorised
+        factorisation = self.Factorise()
+        z = numpy.asarray(z, dtype=float)
+        return factorisation.solve(numpy.ascontiguousarray(z.T)).T
+
+    def x_matrix(self):
+        # Solve linear matrix equation with the chosen solver, using cached factorisation of A
+        if self.reduce:
+            return self.Reduced_solve()
+        return self.Solve(self.z_matrix())
+
+    @stage('reduce')
+    def Reduce_network(self):
+        # Circuit with series and parallel resistors replaced by equivalent resistors
+        # Nodes joined to exactly two resistors and nothing else are removed, and so are nodes at the end of
+        # a single resistor, which carries no current
+        # Returns the reduced circuit, the new number of every kept node (-1 for removed nodes) and the
+        # steps needed to find voltages of removed nodes, see Expand_solution
+        start_time = time.perf_counter()
+        components = self.components
+        resistors = components.select('R')
+        high = components.high[resistors].astype(numpy.int64)
+        low = components.low[resistors].astype(numpy.int64)
+        conductance = 1 / components.values[resistors]
+
+        # Ground and nodes of sources and subcircuit instances are never removed
+        fixed = numpy.zeros(self.node_count, dtype=bool)
+        fixed[0] = True
+        fixed[components.high[~resistors]] = True
+        fixed[components.low[~resistors]] = True
+        for nodes in self.instance_groups.values():
+            fixed[nodes.ravel()] = True
+
+        # Chains are replaced until no node can be removed, removing a chain can make new parallel resistors
+        # whose nodes can then be removed as well
+        # Passes stop once they remove too few nodes, e.g. a ladder loses one rung in every pass
+        steps = []
+        remaining = self.node_count
+        while True:
+            high, low, conductance = parallel_resistors(high, low, conductance, self.node_count)
+            degree = numpy.bincount(high, minlength=self.node_count) + numpy.bincount(low, minlength=self.node_count)
+            removable = (degree <= 2) & (degree > 0) & ~fixed
+            if not numpy.any(removable):
+                break
+            high, low, conductance, step = series_resistors(high, low, conductance, removable)
+            if not len(step[0]):
+                break
+            steps.append(step)
+            if len(step[0]) < reduction_pass_limit * remaining:
+                break
+            remaining -= len(step[0])
+
+        # Nodes left are numbered again in the same order, ground stays node 0
+        kept = numpy.ones(self.node_count, dtype=bool)
+        for step in steps:
+            kept[step[0]] = False
+        number = numpy.cumsum(kept) - 1
+        number[~kept] = -1
+
+        reduced = MNA(self.file_name, self.optimised, self.solver, self.solver_options, self.ordering)
+        # Sources keep their order so the currents through voltage sources are in the same order in x
+        table = reduced.components = components.subset(numpy.flatnonzero(~resistors))
+        table.nodes = components.nodes.subset(numpy.flatnonzero(kept))
+        table.high[:] = number[table.high]
+        table.low[:] = number[table.low]
+        table.extend(['R' + str(count) for count in range(1, len(high) + 1)], ord('R'), number[high], number[low],
+                     1 / conductance)
+        reduced.subcircuits = self.subcircuits
+        reduced.instances = [(name, subcircuit, number[nodes].tolist()) for name, subcircuit, nodes in self.instances]
+        reduced.instance_groups = {subcircuit: number[nodes] for subcircuit, nodes in self.instance_groups.items()}
+        reduced.voltage_count = self.voltage_count
+        reduced.Nodes()
+
+        # Size of the circuit before and after the reduction
+        self.reduction_statistics = {'nodes': self.node_count, 'reduced_nodes': reduced.node_count,
+                                     'resistors': int(numpy.count_nonzero(resistors)), 'reduced_resistors': len(high),
+                                     'passes': len(steps), 'time': time.perf_counter() - start_time}
+        return reduced, number, steps
+
+    def Expand_solution(self, reduced_x, number, steps):
+        # Solution of the whole circuit from the solution of the reduced circuit
+        # Voltages of removed nodes are found from the nodes at both ends of their chain, in reverse order of
+        # removal because the ends of a chain may have been removed later
+        voltages = numpy.zeros((self.node_count,) + reduced_x.shape[1:])
+        kept = numpy.flatnonzero(number > 0)
+        voltages[kept] = reduced_x[number[kept] - 1]
+        for nodes, first, second, fraction in reversed(steps):
+            fraction = fraction.reshape((-1,) + (1,) * (voltages.ndim - 1))
+            voltages[nodes] = voltages[first] + (voltages[second] - voltages[first]) * fraction
+        node_count = len(kept) + 1
+        return numpy.concatenate([voltages[1:], reduced_x[node_count - 1:]])
+
+    def Reduced_solve(self):
+        # Solve the reduced circuit and find voltages of the removed nodes
+        # Currents through removed resistors follow from the voltages, see Solution
+        reduced, number, steps = self.Reduce_network()
+        reduced_x = reduced.x_matrix()
+        self.solver_name = reduced.solver_name
+        self.factor_statistics = reduced.factor_statistics
+        return self.Expand_solution(reduced_x, number, steps)
+
+    def Solution(self, x=None):
+        # Results of the circuit, solving it first if x is not given
+        if x is None:
+            x = self.x_matrix()
+        return Solution(self, x)
+
+    @stage('output')
+    def Results_text(self, x):
+        # Text with calculated values which gets displayed to the user
+        return self.Solution(x).text()
+
+    def print_results(self, x):
+        from tkinter import Tk, messagebox
+
+        # Text with calculated values which gets displayed to the user
+        text = self.Results_text(x)
 
         # Display the message using tkinter message box
         title = "MNA results"
         root = Tk()
         root.withdraw()
         messagebox.showinfo(title, text)
+
+
+def parallel_resistors(high, low, conductance, node_count):
+    # Resistors between the same two nodes joined into one, resistors from a node to itself are left out
+    first = numpy.minimum(high, low)
+    second = numpy.maximum(high, low)
+    kept = first != second
+    pairs, inverse = numpy.unique(first[kept] * node_count + second[kept], return_inverse=True)
+    return pairs // node_count, pairs % node_count, numpy.bincount(inverse.ravel(), weights=conductance[kept])
+
+
+def series_resistors(high, low, conductance, removable):
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import depth_first_order
+
+    # Chains of resistors through removable nodes (nodes with one or two resistors) replaced by one resistor
+    # between the nodes at the ends of the chain
+    # Returns the new resistors and (removed nodes, first end, second end, fraction), the voltage of a removed
+    # node is the voltage of the first end plus the fraction of the voltage between the ends
+    node_count = len(removable)
+    source = numpy.concatenate([high, low])
+    target = numpy.concatenate([low, high])
+    resistance = numpy.tile(1 / conductance, 2)
+
+    # Neighbours of every removable node and resistances to them, -1 when a node has one resistor
+    order = numpy.argsort(source, kind='stable')
+    start = numpy.searchsorted(source[order], numpy.arange(node_count))
+    count = numpy.searchsorted(source[order], numpy.arange(node_count), side='right') - start
+    nodes = numpy.flatnonzero(removable)
+    first = order[start[nodes]]
+    second = numpy.where(count[nodes] == 2, order[numpy.minimum(start[nodes] + 1, len(order) - 1)], -1)
+    neighbours = numpy.full((node_count, 2), -1, dtype=numpy.int64)
+    resistances = numpy.full((node_count, 2), numpy.inf)
+    neighbours[nodes, 0] = target[first]
+    resistances[nodes, 0] = resistance[first]
+    neighbours[nodes[second >= 0], 1] = target[second[second >= 0]]
+    resistances[nodes[second >= 0], 1] = resistance[second[second >= 0]]
+
+    # Depth first search from an extra node joined to every removable node next to a kept node walks
+    # through every chain from one end to the other, so nodes of each chain are together and in order
+    # Loops made only of removable nodes are not reached and are left as they are
+    root = node_count
+    inner = removable[high] & removable[low]
+    entry = nodes[numpy.any((neighbours[nodes] >= 0) & ~removable[neighbours[nodes]], axis=1)]
+    graph = coo_matrix((numpy.ones(numpy.count_nonzero(inner) + len(entry), dtype=numpy.int8),
+                        (numpy.concatenate([high[inner], numpy.full(len(entry), root)]),
+                         numpy.concatenate([low[inner], entry]))), shape=(root + 1, root + 1)).tocsr()
+    visited, previous = depth_first_order(graph, root, directed=False, return_predecessors=True)
+    visited = visited[1:]
+    # No chain has a kept node at its end, e.g. all removable nodes are in floating parts of the circuit
+    if not len(visited):
+        return high, low, conductance, (visited, visited, visited, numpy.zeros(0))
+    parent = previous[visited]
+
+    # Resistance from the first end of the chain to every node, the first end is the kept neighbour of the
+    # node where the search enters the chain
+    chain_start = parent == root
+    from_parent = numpy.where(neighbours[visited, 0] == parent, 0, 1)
+    from_parent[chain_start] = numpy.where(removable[numpy.maximum(neighbours[visited[chain_start], 0], 0)] |
+                                           (neighbours[visited[chain_start], 0] < 0), 1, 0)
+    step = resistances[visited, from_parent]
+    chain = numpy.cumsum(chain_start) - 1
+    total = numpy.cumsum(step)
+    chain_first = numpy.flatnonzero(chain_start)
+    distance = total - (total - step)[chain_first][chain]
+    first_end = neighbours[visited[chain_start], from_parent[chain_start]][chain]
+
+    # Second end of every chain is the other neighbour of its last node, a dead end when there is none
+    chain_last = numpy.append(chain_first[1:], len(visited)) - 1
+    last = visited[chain_last]
+    other = neighbours[last, 1 - from_parent[chain_last]]
+    other_resistance = resistances[last, 1 - from_parent[chain_last]]
+    dead_end = (other < 0) | ((other >= 0) & removable[numpy.maximum(other, 0)])
+    second_end = numpy.where(dead_end, first_end[chain_last], other)
+    length = numpy.where(dead_end, numpy.inf, distance[chain_last] + other_resistance)
+
+    # Nodes on a dead end branch have the voltage of the node where the branch starts
+    fraction = numpy.where(dead_end[chain], 0.0, distance / numpy.where(dead_end, 1.0, length)[chain])
+    step = (visited, first_end, second_end[chain], fraction)
+
+    # Resistors not on a chain stay, each chain becomes one resistor, chains which are dead ends or loops
+    # back to the same node carry no current and are left out
+    on_chain = numpy.zeros(node_count, dtype=bool)
+    on_chain[visited] = True
+    stays = ~on_chain[high] & ~on_chain[low]
+    joins = ~dead_end & (first_end[chain_first] != second_end)
+    return (numpy.concatenate([high[stays], first_end[chain_first][joins]]),
+            numpy.concatenate([low[stays], second_end[joins]]),
+            numpy.concatenate([conductance[stays], 1 / length[joins]]), step)
+
+
+def condition_estimate(A, factorisation):
+    from scipy.sparse.linalg import LinearOperator, onenormest
+
+    # Estimate of the 1-norm condition number ||A|| ||A^-1||, only needs a few solves with the factorisation
+    # A of a circuit is symmetric, so A^-1 is its own transpose
+    inverse = LinearOperator(A.shape, matvec=factorisation.solve, rmatvec=factorisation.solve, dtype=float)
+    return float(abs(A).sum(axis=0).max() * onenormest(inverse))
+
+
+def compile_netlist(file_name, binary_file_name):
+    # Convert a text netlist into a compiled netlist
+    circuit = MNA(file_name, True)
+    circuit.Parse_netlist()
+    circuit.Compile_netlist(binary_file_name)
+    return circuit
+
+
+def topology_text(problems, limit=10):
+    # Describe problems found by MNA.Check_topology, one line per problem
+    # Only the first few components of each problem are named
+    lines = []
+    for problem, names in problems:
+        shown = ', '.join(names[:limit])
+        if len(names) > limit:
+            shown += ' and ' + str(len(names) - limit) + ' more'
+        lines.append(topology_problems[problem] + ': ' + shown)
+    return '\n'.join(lines)
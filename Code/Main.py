@@ -2,21 +2,13 @@ import pygame
 from pygame.locals import *
 from tkinter import *
 from tkinter import messagebox
-import numpy
 import os
-from MNA import circuit_component, CSC, MNA
+import threading
+import time
+from collections import OrderedDict, deque
+from MNA import DisjointSet, MNA, Solution, topology_text, add_stage_hook, remove_stage_hook
 
 
-# Initialise pygame
-pygame.init()
-
-# Define constants
-# Get screen width and screen height
-infoObject = pygame.display.Info()
-# Width of the screen
-WIDTH = infoObject.current_w - 380
-# Height of the screen
-HEIGHT = infoObject.current_h - 280
 # Define colours
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -27,6 +19,21 @@ fps = 60
 value_box = pygame.Rect(20, 520, 150, 40)
 unit_prefix_box = pygame.Rect(20, 560, 60, 40)
 
+# Fonts used by the GUI, loaded once by size because looking up a system font is slow
+font_name = 'Calibre'
+fonts = {}
+# Rendered text surfaces keyed by (font size, text, colour), most recently used last
+# Labels are only rendered again when their text changes, e.g. a component's value or unit prefix
+text_cache = OrderedDict()
+text_cache_size = 256
+
+# Part of the component tab where characteristics of the selected component are displayed
+characteristics_box = pygame.Rect(0, 440, 185, 370)
+# Frames with more changed regions than this update the whole screen at once
+dirty_rect_limit = 64
+# Toolbar area showing how far a build running in the background got, next to its 'Cancel' button
+progress_box = pygame.Rect(500, 5, 250, 50)
+
 # Define variables
 # Counts independent voltage sources in the main tab
 independent_voltage_source_count = 0
@@ -40,32 +47,27 @@ unit_prefix_box_active = False
 # Program will run until 'done' becomes True
 done = False
 
-# Used to manage how fast the screen updates
-clock = pygame.time.Clock()
-# Opening the program's window
-screen = pygame.display.set_mode((WIDTH, HEIGHT), RESIZABLE)
-# Title of the program's window
-pygame.display.set_caption('DC Circuit Simulator')
-
-# Load component's images
-independent_voltage_source = pygame.image.load("images/independent_voltage_source.png").convert_alpha()
-independent_voltage_source_selected = pygame.image.load(
-    "images/independent_voltage_source_selected.png").convert_alpha()
-independent_voltage_source_left_side = pygame.image.load(
-    "images/independent_voltage_source_left_side.png").convert_alpha()
-independent_voltage_source_right_side = pygame.image.load(
-    "images/independent_voltage_source_right_side.png").convert_alpha()
-independent_current_source = pygame.image.load("images/independent_current_source.png").convert_alpha()
-independent_current_source_selected = pygame.image.load(
-    "images/independent_current_source_selected.png").convert_alpha()
-independent_current_source_left_side = pygame.image.load(
-    "images/independent_current_source_left_side.png").convert_alpha()
-independent_current_source_right_side = pygame.image.load(
-    "images/independent_current_source_right_side.png").convert_alpha()
-resistor = pygame.image.load("images/resistor.png").convert_alpha()
-resistor_selected = pygame.image.load("images/resistor_selected.png").convert_alpha()
-resistor_left_side = pygame.image.load("images/resistor_left_side.png").convert_alpha()
-resistor_right_side = pygame.image.load("images/resistor_right_side.png").convert_alpha()
+
+# Font of the given size, loaded the first time it is used
+def font(size):
+    if size not in fonts:
+        fonts[size] = pygame.font.SysFont(font_name, size)
+    return fonts[size]
+
+
+# Surface with the text rendered in the font of the given size, taken from text_cache when rendered before
+def render_text(text, size, colour=BLACK):
+    key = (size, text, colour)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = font(size).render(text, 1, colour)
+        text_cache[key] = surface
+        # Least recently used surfaces are dropped
+        if len(text_cache) > text_cache_size:
+            text_cache.popitem(last=False)
+    else:
+        text_cache.move_to_end(key)
+    return surface
 
 
 # Sprite class which creates components in the main tab
@@ -126,22 +128,17 @@ class Component(pygame.sprite.Sprite):
 
     #  When a component is selected, its characteristics get displayed in the component tab
     def display_characteristics(self):
-        # Define fonts
-        name_font = pygame.font.SysFont('Calibre', 100)
-        font = pygame.font.SysFont('Calibre', 45)
-        description_font = pygame.font.SysFont('Calibre', 24)
-
         # Name label
-        text_name = name_font.render(self.type + str(self.name_id), 1, BLACK)
+        text_name = render_text(self.type + str(self.name_id), 100)
         # Label's position is such that no matter it's width, it will always be centered
         text_name_rect = text_name.get_rect(center=(95, 487))
 
         # Value label
-        text_value = font.render(self.value, 1, BLACK)
+        text_value = render_text(self.value, 45)
         # Unit prefix label
-        text_unit_prefix = font.render(self.unit_prefix, 1, BLACK)
+        text_unit_prefix = render_text(self.unit_prefix, 45)
         # Unit label
-        text_unit = font.render(self.unit, 1, BLACK)
+        text_unit = render_text(self.unit, 45)
 
         # Add labels to the screen
         screen.blit(text_name, text_name_rect)
@@ -165,14 +162,14 @@ class Component(pygame.sprite.Sprite):
         # Description labels
         # Each component type has different description label
         if self.type == 'V':
-            description1 = description_font.render('A component', 1, BLACK)
-            description2 = description_font.render('with two distinct', 1, BLACK)
-            description3 = description_font.render('terminals that', 1, BLACK)
-            description4 = description_font.render('provides', 1, BLACK)
-            description5 = description_font.render('constant voltage', 1, BLACK)
-            description6 = description_font.render('independent of', 1, BLACK)
-            description7 = description_font.render('current drawn', 1, BLACK)
-            description8 = description_font.render('from it.', 1, BLACK)
+            description1 = render_text('A component', 24)
+            description2 = render_text('with two distinct', 24)
+            description3 = render_text('terminals that', 24)
+            description4 = render_text('provides', 24)
+            description5 = render_text('constant voltage', 24)
+            description6 = render_text('independent of', 24)
+            description7 = render_text('current drawn', 24)
+            description8 = render_text('from it.', 24)
 
             screen.blit(description1, (28, 602))
             screen.blit(description2, (28, 621))
@@ -184,15 +181,15 @@ class Component(pygame.sprite.Sprite):
             screen.blit(description8, (28, 735))
 
         if self.type == 'I':
-            description1 = description_font.render('A component', 1, BLACK)
-            description2 = description_font.render('with two distinct', 1, BLACK)
-            description3 = description_font.render('terminals that', 1, BLACK)
-            description4 = description_font.render('supplies the', 1, BLACK)
-            description5 = description_font.render('same current to', 1, BLACK)
-            description6 = description_font.render('any load', 1, BLACK)
-            description7 = description_font.render('connected', 1, BLACK)
-            description8 = description_font.render('across', 1, BLACK)
-            description9 = description_font.render('its terminals.', 1, BLACK)
+            description1 = render_text('A component', 24)
+            description2 = render_text('with two distinct', 24)
+            description3 = render_text('terminals that', 24)
+            description4 = render_text('supplies the', 24)
+            description5 = render_text('same current to', 24)
+            description6 = render_text('any load', 24)
+            description7 = render_text('connected', 24)
+            description8 = render_text('across', 24)
+            description9 = render_text('its terminals.', 24)
 
             screen.blit(description1, (28, 602))
             screen.blit(description2, (28, 621))
@@ -205,13 +202,13 @@ class Component(pygame.sprite.Sprite):
             screen.blit(description9, (28, 754))
 
         if self.type == 'R':
-            description1 = description_font.render('A component', 1, BLACK)
-            description2 = description_font.render('used to reduce', 1, BLACK)
-            description3 = description_font.render('current flow and', 1, BLACK)
-            description4 = description_font.render('drop voltage', 1, BLACK)
-            description5 = description_font.render('potentials by', 1, BLACK)
-            description6 = description_font.render('absorbing', 1, BLACK)
-            description7 = description_font.render('electric energy.', 1, BLACK)
+            description1 = render_text('A component', 24)
+            description2 = render_text('used to reduce', 24)
+            description3 = render_text('current flow and', 24)
+            description4 = render_text('drop voltage', 24)
+            description5 = render_text('potentials by', 24)
+            description6 = render_text('absorbing', 24)
+            description7 = render_text('electric energy.', 24)
 
             screen.blit(description1, (28, 602))
             screen.blit(description2, (28, 621))
@@ -237,9 +234,11 @@ class button:
         #   
         self.surface = surface
 
-    # Draw a button
-    def draw_button(self):
-        pygame.draw.rect(self.surface, self.color, (self.x, self.y, self.width, self.height))
+    # Draw a button, on the given surface instead of the button's surface if there is one
+    def draw_button(self, surface=None):
+        if surface is None:
+            surface = self.surface
+        pygame.draw.rect(surface, self.color, (self.x, self.y, self.width, self.height))
 
     # Check if button is pressed
     def is_pressed(self):
@@ -289,12 +288,315 @@ def message_box():
         messagebox.showinfo(title, text)
 
 
+# Wires between components, each wire joins two component sides given as (component id, 'right' or 'left')
+# Every wire is kept once, no matter which of its sides was clicked first
+class Wires:
+    def __init__(self):
+        # Wires in the order they were added, as a dictionary used as an ordered set
+        self.wires = {}
+        # Wires connected to each component, by component id
+        self.component_wires = {}
+
+    def __len__(self):
+        return len(self.wires)
+
+    def __iter__(self):
+        return iter(self.wires)
+
+    def add(self, first, second):
+        # Add a wire, returns False if the two sides were already joined by a wire
+        wire = tuple(sorted((first, second)))
+        if wire in self.wires:
+            return False
+        self.wires[wire] = None
+        for component_id, side in wire:
+            self.component_wires.setdefault(component_id, set()).add(wire)
+        return True
+
+    def connected(self, component_id):
+        # Wires connected to a component
+        return self.component_wires.get(component_id, set())
+
+    def remove_component(self, component_id):
+        # Delete wires connected to a component
+        for wire in self.component_wires.pop(component_id, set()):
+            del self.wires[wire]
+            for other_id, side in wire:
+                if other_id != component_id:
+                    self.component_wires[other_id].discard(wire)
+
+    def clear(self):
+        self.wires.clear()
+        self.component_wires.clear()
+
+
+# Uniform grid of square cells used to find components at a point or in an area without checking every component
+# Every cell keeps the components whose rectangles overlap it, components are moved in the grid when dragged
+class SpatialGrid:
+    def __init__(self, cell_size=150):
+        self.cell_size = cell_size
+        # Components overlapping each cell, by (column, row)
+        self.cells = {}
+        # Cells overlapped by each component when it was last added or moved
+        self.component_cells = {}
+
+    def __len__(self):
+        return len(self.component_cells)
+
+    def cells_of(self, rect):
+        # Cells overlapped by a rectangle
+        size = self.cell_size
+        return [(column, row) for column in range(rect.left // size, (rect.right - 1) // size + 1)
+                for row in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+
+    def add(self, component):
+        cells = self.cells_of(component.rect)
+        self.component_cells[component] = cells
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(component)
+
+    def remove(self, component):
+        for cell in self.component_cells.pop(component, ()):
+            self.cells[cell].discard(component)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def move(self, component):
+        # Update the cells of a component after its rectangle changed
+        if self.cells_of(component.rect) != self.component_cells.get(component):
+            self.remove(component)
+            self.add(component)
+
+    def point(self, position):
+        # Components at a point, in the order they were added
+        size = self.cell_size
+        found = self.cells.get((position[0] // size, position[1] // size), ())
+        return sorted((component for component in found if component.rect.collidepoint(position)),
+                      key=lambda component: component.id)
+
+    def area(self, rect):
+        # Components overlapping a rectangle, in the order they were added
+        found = set()
+        for cell in self.cells_of(rect):
+            found.update(self.cells.get(cell, ()))
+        return sorted((component for component in found if component.rect.colliderect(rect)),
+                      key=lambda component: component.id)
+
+    def clear(self):
+        self.cells.clear()
+        self.component_cells.clear()
+
+
+# Raised by a solve's stage hook to stop the solve after it was cancelled
+class SolveCancelled(Exception):
+    pass
+
+
+# Circuit built and solved in a thread, so the GUI keeps drawing and handling events during long solves
+# The GUI checks the job every frame, shows its progress and takes its results when it is done
+# A cancelled solve stops when its current stage ends, numpy and scipy cannot be interrupted inside a stage
+class SolveJob:
+    def __init__(self, netlist_file, netlist, circuit=None, changes=None):
+        # Netlist lines, written to the file by the thread
+        self.netlist_file = netlist_file
+        self.netlist = netlist
+        # Circuit from the last build and new values of its components when only values changed
+        self.circuit = circuit
+        self.changes = changes
+        # Stages of MNA the solve goes through, used to show how far it got
+        if changes is None:
+            self.stages = ('parse', 'topology', 'A_matrix', 'factorise', 'solve')
+        else:
+            self.stages = ('update',)
+        self.finished_stages = set()
+        self.start_time = time.perf_counter()
+        self.cancelled = False
+        # Solution of the circuit, problems found by Check_topology or the error which stopped the solve
+        # Solution stays None unless the solve finished
+        self.solution = None
+        self.problems = None
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        add_stage_hook(self.hook)
+        try:
+            # Create a netlist text file
+            with open(self.netlist_file, 'w') as f:
+                f.write('\n'.join(self.netlist) + '\n')
+            if self.changes is not None:
+                # Solve again using the factorisation from the last build
+                x_matrix = self.circuit.Update_values(self.changes)
+            else:
+                # Initialise MNA, solver is chosen from the size of the circuit
+                self.circuit = MNA(self.netlist_file)
+                self.circuit.Parse_netlist()
+                # Find floating parts, loops of voltage sources and current source cut-sets before solving
+                self.problems = self.circuit.Check_topology()
+                if self.problems:
+                    return
+                # Solve matrix equation for unknown nodal voltages and current going through voltage sources
+                x_matrix = self.circuit.x_matrix()
+            self.solution = Solution(self.circuit, x_matrix)
+        except SolveCancelled:
+            pass
+        # There is an error in the circuit so its results cannot be calculated
+        # Any error is kept for the GUI, an error ending the thread would leave the job without a solution
+        except Exception as error:
+            self.error = error
+        finally:
+            remove_stage_hook(self.hook)
+
+    def hook(self, circuit, name, record):
+        # Called by MNA after every stage, of this and other circuits
+        if circuit is not self.circuit:
+            return
+        self.finished_stages.add(name)
+        if self.cancelled:
+            raise SolveCancelled()
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def progress(self):
+        # Fraction of the solve's stages which are finished
+        return len(self.finished_stages.intersection(self.stages)) / len(self.stages)
+
+    def seconds(self):
+        return time.perf_counter() - self.start_time
+
+
+# Labels with the voltage across and the current through every component, by component name, as (text, size)
+# Values are shown without their sign, same as in the results text of MNA
+# Sizes are measured once, labels are only rendered when they are drawn
+def result_labels(solution):
+    labels = {}
+    for name, voltage, current in zip(solution.component_names, solution.component_voltages.tolist(),
+                                      solution.currents.tolist()):
+        text = '{:.3f} V  {:.3f} A'.format(abs(voltage), abs(current))
+        labels[name] = (text, font(24).size(text))
+    return labels
+
+
+# Sides whose links lists the netlist was numbered by before nodes were found with a disjoint-set,
+# in the order of that list of nodes
+# Links lists were listed right side first for every component, then all but the last copy of every list
+# was removed while walking the same list, so some copies were skipped and kept,
+# and at last lists which were part of another list were removed
+def kept_links(links):
+    # Equal lists get the same key, lists are only hashed here because long lists are slow to hash
+    numbering = {}
+    keys = [numbering.setdefault(tuple(side_links), len(numbering)) for side_links in links]
+    count = len(keys)
+    # Binary indexed tree counting sides still in the list, to find the side at a position after removals
+    tree = [0] * (count + 1)
+    for index in range(1, count + 1):
+        tree[index] += 1
+        parent = index + (index & -index)
+        if parent <= count:
+            tree[parent] += tree[index]
+    step = 1
+    while step * 2 <= count:
+        step *= 2
+
+    def side_at(position):
+        index = 0
+        remaining = position + 1
+        size = step
+        while size:
+            if index + size <= count and tree[index + size] < remaining:
+                index += size
+                remaining -= tree[index]
+            size //= 2
+        return index
+
+    copies = [deque() for _ in numbering]
+    for side, key in enumerate(keys):
+        copies[key].append(side)
+    removed = [False] * count
+    position = 0
+    length = count
+    while position < length:
+        key_copies = copies[keys[side_at(position)]]
+        # First copies are removed until one is left
+        while len(key_copies) > 1:
+            side = key_copies.popleft()
+            removed[side] = True
+            length -= 1
+            index = side + 1
+            while index <= count:
+                tree[index] -= 1
+                index += index & -index
+        position += 1
+    kept = [side for side in range(count) if not removed[side]]
+
+    # Lists which are part of another kept list, found from the lists every component id is in
+    lists = list(numbering)
+    distinct = set(keys[side] for side in kept)
+    containing = {}
+    for key in distinct:
+        for link in lists[key]:
+            containing.setdefault(link, set()).add(key)
+    part = set()
+    for key in distinct:
+        keys_of_links = sorted((containing[link] for link in lists[key]), key=len)
+        # Empty list is part of every other list
+        larger = set(keys_of_links[0]) if keys_of_links else set(distinct)
+        for keys_of_link in keys_of_links[1:]:
+            larger &= keys_of_link
+        larger.discard(key)
+        if larger:
+            part.add(key)
+    return [side for side in kept if keys[side] not in part]
+
+
+# Find which nodes components are connected to
+# Every wire joins two component sides, sides joined by wires are merged into nodes with a disjoint-set
+# Every node is numbered by the position of its first side in kept_links, same as the numbering
+# from the links lists, so node 0 (ground) and the netlist do not change
+# Nodes with no side there are numbered after them
+def find_nodes(components, wires):
+    # Number of every component side, right side first
+    sides = {}
+    links = []
+    for component in components:
+        sides[(component.id, 'right')] = len(links)
+        links.append(component.right_links)
+        sides[(component.id, 'left')] = len(links)
+        links.append(component.left_links)
+
+    # Join both sides of every wire
+    nodes = DisjointSet(len(links))
+    for first, second in wires:
+        nodes.union(sides[first], sides[second])
+
+    kept = kept_links(links)
+    node_numbers = {}
+    for position, side in enumerate(kept):
+        node_numbers.setdefault(nodes.find(side), position)
+    number = len(kept)
+    for root in nodes.roots():
+        if root not in node_numbers:
+            node_numbers[root] = number
+            number += 1
+
+    # Right side is component's low node and left side is component's high node
+    for component in components:
+        component.low_node = node_numbers[nodes.find(sides[(component.id, 'right')])]
+        component.high_node = node_numbers[nodes.find(sides[(component.id, 'left')])]
+
+
 # Draw GUI
+# Parts of the GUI which do not change are drawn once on the background, see draw_background
 # Draw main tab
 # Place on the screen for building a circuit
-def main_tab():
+def main_tab(surface):
     # First draw a white rectangle, then add black lines to create grid like structure
-    pygame.draw.rect(screen, WHITE, (0, 60, WIDTH, HEIGHT))
+    pygame.draw.rect(surface, WHITE, (0, 60, WIDTH, HEIGHT))
 
     # Dimensions of each grid
     width = 185
@@ -303,13 +605,13 @@ def main_tab():
     while width < WIDTH or height < HEIGHT:
         width += 150
         height += 150
-        pygame.draw.line(screen, BLACK, (width, 60), (width, HEIGHT), 2)
-        pygame.draw.line(screen, BLACK, (185, height), (WIDTH, height), 2)
+        pygame.draw.line(surface, BLACK, (width, 60), (width, HEIGHT), 2)
+        pygame.draw.line(surface, BLACK, (185, height), (WIDTH, height), 2)
 
 
 # Draw toolbar
 # Top part of the screen where all the buttons are placed
-def toolbar():
+def toolbar(surface):
     # Dimensions of the buttons
     width = 120
     height = 50
@@ -323,14 +625,11 @@ def toolbar():
     build_x = 3 * (width + 5)
     build_y = 5
 
-    # Font for every button
-    button_font = pygame.font.SysFont('Calibre', 50)
-
     # Button labels
-    clear_text = button_font.render('Clear', 1, BLACK)
-    undo_text = button_font.render('Undo', 1, BLACK)
-    help_text = button_font.render('Help', 1, BLACK)
-    build_text = button_font.render('Build', 1, BLACK)
+    clear_text = render_text('Clear', 50)
+    undo_text = render_text('Undo', 50)
+    help_text = render_text('Help', 50)
+    build_text = render_text('Build', 50)
 
     # Each label is centered in their button
     clear_text_rect = clear_text.get_rect(center=(clear_x + width // 2, clear_y + height // 2))
@@ -339,512 +638,630 @@ def toolbar():
     build_text_rect = build_text.get_rect(center=(build_x + width // 2, build_y + height // 2))
 
     # Draw each button using Button class methode
-    clear_button.draw_button()
-    undo_button.draw_button()
-    help_button.draw_button()
-    build_button.draw_button()
+    clear_button.draw_button(surface)
+    undo_button.draw_button(surface)
+    help_button.draw_button(surface)
+    build_button.draw_button(surface)
 
     # Add labels to the screen
-    screen.blit(clear_text, clear_text_rect)
-    screen.blit(undo_text, undo_text_rect)
-    screen.blit(help_text, help_text_rect)
-    screen.blit(build_text, build_text_rect)
+    surface.blit(clear_text, clear_text_rect)
+    surface.blit(undo_text, undo_text_rect)
+    surface.blit(help_text, help_text_rect)
+    surface.blit(build_text, build_text_rect)
 
 
 # Draw component tab
 # A grey area on the left side of the screen
 # A place where user can add component's to main tab and check their their characteristics
-def component_tab():
+def component_tab(surface):
     # Draw a grey 3 rectangles
     # Draw the big grey rectangle which covers whole component tab
-    pygame.draw.rect(screen, GREY, (0, 60, 185, 750))
+    pygame.draw.rect(surface, GREY, (0, 60, 185, 750))
     # Draw a smaller black rectangle and a grey rectangle for displaying component's characteristics
-    pygame.draw.rect(screen, BLACK, (17, 440, 150, 345))
-    pygame.draw.rect(screen, GREY, (26, 450, 132, 325))
+    pygame.draw.rect(surface, BLACK, (17, 440, 150, 345))
+    pygame.draw.rect(surface, GREY, (26, 450, 132, 325))
 
     # Add component images to the screen
-    screen.blit(independent_voltage_source_selected, (17, 70))
-    screen.blit(independent_current_source_selected, (17, 190))
-    screen.blit(resistor_selected, (17, 310))
-
-
-# Create buttons in the toolbar
-clear_button = button(0, 5, 120, 50, WHITE, screen)
-undo_button = button(125, 5, 120, 50, WHITE, screen)
-help_button = button(250, 5, 120, 50, WHITE, screen)
-build_button = button(375, 5, 120, 50, WHITE, screen)
-
-# List containing all components which are currently in the main tab
-component_list = pygame.sprite.Group()
-
-# Main program loop
-while not done:
-    # Main event loop
-    for event in pygame.event.get():
-        # If the user presses down a key on the keyboard
-        if event.type == pygame.KEYDOWN:
-            # Escape key
-            if event.key == pygame.K_ESCAPE:
-                # Exit the loop
-                done = True
-
-            # Loop through components to check for value or unit prefix  input from the user
-            for component in component_list:
-                # Check for only selected component (component whose characteristics are displayed)
-                if component.selected:
-                    # Value ready for input
-                    if value_box_active:
-
-                        # Return key
-                        if event.key == pygame.K_RETURN:
-                            # Validation
-                            # Presence check
-                            if len(component.value) == 0 or component.value == '.':
-                                # Display warning message to the user with tkinter messagebox
-                                text = "No value entered. Please enter component's value."
-                                message_type = 'warning'
-                                message_box()
-                            # Range check
-                            elif float(component.value) == 0:
-                                # Display warning tkinter message
-                                text = "Component's value cannot be zero. Please enter a valid value."
-                                message_type = 'warning'
-                                message_box()
-                            # Value is valid
+    surface.blit(independent_voltage_source_selected, (17, 70))
+    surface.blit(independent_current_source_selected, (17, 190))
+    surface.blit(resistor_selected, (17, 310))
+
+
+# Surface of the window's size with the toolbar, main tab and component tab
+# Copied to the screen under everything which changes, drawn again when the window is resized
+def draw_background(size):
+    surface = pygame.Surface(size).convert()
+    toolbar(surface)
+    main_tab(surface)
+    component_tab(surface)
+    return surface
+
+
+# Lines joining connected components, as (start position, end position), one for every wire
+def wire_lines(components, wires):
+    rects = {component.id: component.rect for component in components}
+    lines = []
+    for wire in wires:
+        # Right side of a component is its middle right point, left side its middle left point
+        start_pos, end_pos = [rects[component_id].midright if side == 'right' else rects[component_id].midleft
+                              for component_id, side in wire]
+        lines.append((start_pos, end_pos))
+    return lines
+
+
+# Area of the screen covered by a line 7 pixels wide
+def line_rect(start_pos, end_pos):
+    rect = pygame.Rect(min(start_pos[0], end_pos[0]), min(start_pos[1], end_pos[1]),
+                       abs(start_pos[0] - end_pos[0]) + 1, abs(start_pos[1] - end_pos[1]) + 1)
+    return rect.inflate(8, 8)
+
+
+# Everything drawn over the background, keyed by what it is, with its state and the area it covers
+# An item is drawn again when its state changes
+def scene(components, selected, lines, line_rects, labels, job):
+    items = {}
+    for component in components:
+        items[('component', component.id)] = ((tuple(component.rect), component.image), component.rect.copy())
+    for component_id, (label, rect) in labels.items():
+        items[('result', component_id)] = ((label, tuple(rect)), rect)
+    for line, rect in zip(lines, line_rects):
+        items[('line',) + line] = (None, rect)
+    # Characteristics of selected components, with the box being edited
+    if selected:
+        characteristics = [(component.id, component.value, component.unit_prefix) for component in selected]
+        items['characteristics'] = ((characteristics, value_box_active, unit_prefix_box_active), characteristics_box)
+    if job is not None:
+        items['progress'] = progress_item(job)
+    return items
+
+
+# Progress of a build, changing in steps of a percent and a tenth of a second, and the area it covers
+def progress_item(job):
+    return (int(job.progress() * 100), int(job.seconds() * 10)), progress_box.union(cancel_button_rect())
+
+
+# Area of the 'Cancel' button, next to the progress of a build
+def cancel_button_rect():
+    return pygame.Rect(progress_box.right + 5, progress_box.y, 120, progress_box.height)
+
+
+# Labels with results of the last build under every component, by component id, as (text, area)
+def result_positions(components, results):
+    labels = {}
+    for component in components:
+        result = results.get(component.type + str(component.name_id))
+        if result is not None:
+            text, size = result
+            rect = pygame.Rect((0, 0), size)
+            rect.midtop = component.rect.midbottom
+            labels[component.id] = (text, rect)
+    return labels
+
+
+# Draw the progress of a build running in the background and the 'Cancel' button
+def draw_progress(job):
+    pygame.draw.rect(screen, WHITE, progress_box)
+    bar = progress_box.inflate(-10, -10)
+    pygame.draw.rect(screen, GREY, (bar.x, bar.y, int(bar.width * job.progress()), bar.height))
+    label = render_text('Solving {:.1f} s'.format(job.seconds()), 32)
+    screen.blit(label, label.get_rect(center=progress_box.center))
+    cancel_rect = cancel_button_rect()
+    pygame.draw.rect(screen, WHITE, cancel_rect)
+    label = render_text('Cancel', 50)
+    screen.blit(label, label.get_rect(center=cancel_rect.center))
+
+
+# Areas of the screen which changed between the last frame's items and this frame's items
+def dirty_rects(last_items, items):
+    rects = []
+    for key, (state, rect) in items.items():
+        last = last_items.get(key)
+        if last is None or last[0] != state:
+            rects.append(rect)
+            if last is not None:
+                rects.append(last[1])
+    # Items which are no longer drawn
+    rects += [rect for key, (state, rect) in last_items.items() if key not in items]
+    return rects
+
+
+# Grow areas of the screen to be drawn again so every line touching an area is inside it
+# pygame draws a thick line cut by the clipping area with slightly different pixels than the whole line
+def whole_lines(rects, line_rects):
+    grown = []
+    for rect in rects:
+        while True:
+            touching = [line_rects[position] for position in rect.collidelistall(line_rects)]
+            whole = rect.unionall(touching) if touching else rect
+            if whole == rect:
+                break
+            rect = whole
+        grown.append(rect)
+    return grown
+
+
+# Draw the background and every item touching the given areas of the screen
+# Items are drawn in the same order as when the whole screen is drawn: components, wires, results,
+# characteristics of the selected components and progress of the build
+def draw(rects, grid, selected, lines, line_rects, labels, job):
+    for rect in rects:
+        # Nothing is drawn outside the area, parts of other items there are already right
+        screen.set_clip(rect)
+        screen.blit(background, rect, rect)
+        for component in grid.area(rect):
+            screen.blit(component.image, component.rect)
+        for position in rect.collidelistall(line_rects):
+            # Dray a line connecting two components
+            pygame.draw.line(screen, BLACK, lines[position][0], lines[position][1], 7)
+        for text, label_rect in labels.values():
+            if rect.colliderect(label_rect):
+                screen.blit(render_text(text, 24), label_rect)
+        if rect.colliderect(characteristics_box):
+            for component in selected:
+                # Display component's name, value, unit, unit prefix and short description
+                component.display_characteristics()
+        if job is not None and rect.colliderect(progress_box.union(cancel_button_rect())):
+            draw_progress(job)
+    screen.set_clip(None)
+
+
+
+# Only start the simulator when this file is run, importing it does not initialise pygame
+if __name__ == '__main__':
+    # Initialise pygame
+    pygame.init()
+
+    # Define constants
+    # Get screen width and screen height
+    infoObject = pygame.display.Info()
+    # Width of the screen
+    WIDTH = infoObject.current_w - 380
+    # Height of the screen
+    HEIGHT = infoObject.current_h - 280
+
+    # Used to manage how fast the screen updates
+    clock = pygame.time.Clock()
+    # Opening the program's window
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), RESIZABLE)
+    # Title of the program's window
+    pygame.display.set_caption('DC Circuit Simulator')
+
+    # Load component's images
+    independent_voltage_source = pygame.image.load("images/independent_voltage_source.png").convert_alpha()
+    independent_voltage_source_selected = pygame.image.load(
+        "images/independent_voltage_source_selected.png").convert_alpha()
+    independent_voltage_source_left_side = pygame.image.load(
+        "images/independent_voltage_source_left_side.png").convert_alpha()
+    independent_voltage_source_right_side = pygame.image.load(
+        "images/independent_voltage_source_right_side.png").convert_alpha()
+    independent_current_source = pygame.image.load("images/independent_current_source.png").convert_alpha()
+    independent_current_source_selected = pygame.image.load(
+        "images/independent_current_source_selected.png").convert_alpha()
+    independent_current_source_left_side = pygame.image.load(
+        "images/independent_current_source_left_side.png").convert_alpha()
+    independent_current_source_right_side = pygame.image.load(
+        "images/independent_current_source_right_side.png").convert_alpha()
+    resistor = pygame.image.load("images/resistor.png").convert_alpha()
+    resistor_selected = pygame.image.load("images/resistor_selected.png").convert_alpha()
+    resistor_left_side = pygame.image.load("images/resistor_left_side.png").convert_alpha()
+    resistor_right_side = pygame.image.load("images/resistor_right_side.png").convert_alpha()
+
+    # Create buttons in the toolbar
+    clear_button = button(0, 5, 120, 50, WHITE, screen)
+    undo_button = button(125, 5, 120, 50, WHITE, screen)
+    help_button = button(250, 5, 120, 50, WHITE, screen)
+    build_button = button(375, 5, 120, 50, WHITE, screen)
+    # Shown only while a build is running
+    cancel_button = button(*cancel_button_rect(), WHITE, screen)
+
+    # List containing all components which are currently in the main tab
+    component_list = pygame.sprite.Group()
+    # Wires between components
+    wires = Wires()
+    # Components by their position on the screen
+    grid = SpatialGrid()
+    # Selected components, clicked components being dragged and components with a side clicked for connecting,
+    # in the order they were clicked
+    selected_components = []
+    dragged_components = []
+    pending_components = []
+
+    # Background of the GUI and items drawn in the last frame, everything is drawn in the first frame
+    background = draw_background(screen.get_size())
+    last_items = {}
+    redraw = True
+
+    # Circuit from the last build and its components and connections (without values)
+    # When only values change between builds, the circuit is solved again incrementally
+    circuit = None
+    circuit_topology = None
+    # Build running in the background, labels with results of the last build by component name
+    # and whether to ask about saving the netlist once the results are drawn
+    job = None
+    results = {}
+    ask_save = False
+
+    # Main program loop
+    while not done:
+        # Main event loop
+        events = pygame.event.get()
+        # Anything but the progress of a build can only change after events other than moving the mouse,
+        # while dragging or when a build is done
+        changed = any(event.type != pygame.MOUSEMOTION for event in events)
+        for event in events:
+            # If the user presses down a key on the keyboard
+            if event.type == pygame.KEYDOWN:
+                # Escape key
+                if event.key == pygame.K_ESCAPE:
+                    # Exit the loop
+                    done = True
+
+                # Loop through selected components (components whose characteristics are displayed)
+                # to check for value or unit prefix input from the user
+                for component in selected_components:
+                    if component.selected:
+                        # Value ready for input
+                        if value_box_active:
+
+                            # Return key
+                            if event.key == pygame.K_RETURN:
+                                # Validation
+                                # Presence check
+                                if len(component.value) == 0 or component.value == '.':
+                                    # Display warning message to the user with tkinter messagebox
+                                    text = "No value entered. Please enter component's value."
+                                    message_type = 'warning'
+                                    message_box()
+                                # Range check
+                                elif float(component.value) == 0:
+                                    # Display warning tkinter message
+                                    text = "Component's value cannot be zero. Please enter a valid value."
+                                    message_type = 'warning'
+                                    message_box()
+                                # Value is valid
+                                else:
+                                    # Close value box for user input
+                                    value_box_active = False
+                                    # Format value to 3 decimal places and store it
+                                    component.value = str('{:.3f}'.format(float(component.value)))
+                                    # Results of the last build no longer match the circuit
+                                    results = {}
+
+                            # Backspace key
+                            elif event.key == pygame.K_BACKSPACE:
+                                # Delete last digit
+                                component.value = component.value[:-1]
+
+                            # Any other key
                             else:
-                                # Close value box for user input
-                                value_box_active = False
-                                # Format value to 3 decimal places and store it
-                                component.value = str('{:.3f}'.format(float(component.value)))
-
-                        # Backspace key
-                        elif event.key == pygame.K_BACKSPACE:
-                            # Delete last digit
-                            component.value = component.value[:-1]
-
-                        # Any other key
-                        else:
-                            # Validation
-                            valid = False
-                            # Cross-reference check
-                            for key in component.allowed_values:
-                                # Compare user's input to allowed values
-                                if key == event.unicode:
-                                    valid = True
-                            # User input is valid
-                            if valid:
-                                # Add user input to component's value
-                                component.value += event.unicode
+                                # Validation
+                                valid = False
+                                # Cross-reference check
+                                for key in component.allowed_values:
+                                    # Compare user's input to allowed values
+                                    if key == event.unicode:
+                                        valid = True
+                                # User input is valid
+                                if valid:
+                                    # Add user input to component's value
+                                    component.value += event.unicode
+                                else:
+                                    # Display warning tkinter message
+                                    text = "Only numbers can be entered as a component's value."
+                                    message_type = 'warning'
+                                    message_box()
+
+                        # Unit prefix ready for input
+                        elif unit_prefix_box_active:
+
+                            # Return key
+                            if event.key == pygame.K_RETURN:
+                                # Close unit prefix box for user input
+                                unit_prefix_box_active = False
+                                results = {}
+
+                            # Backspace key
+                            elif event.key == pygame.K_BACKSPACE:
+                                # Delete last digit
+                                component.unit_prefix = component.unit_prefix[:-1]
+
+                            # Any other key
                             else:
-                                # Display warning tkinter message
-                                text = "Only numbers can be entered as a component's value."
-                                message_type = 'warning'
-                                message_box()
-
-                    # Unit prefix ready for input
-                    elif unit_prefix_box_active:
-
-                        # Return key
-                        if event.key == pygame.K_RETURN:
-                            # Close unit prefix box for user input
-                            unit_prefix_box_active = False
+                                # Validation
+                                valid_length = False
+                                valid_prefix = False
+                                # Cross-reference check
+                                for key in component.allowed_unit_prefixes:
+                                    # Compare user input to allowed unit prefixes
+                                    if key == event.unicode:
+                                        valid_prefix = True
+
+                                # Length check
+                                if len(component.unit_prefix) < 1:
+                                    # Unit prefix can be made up of only one letter
+                                    # Or component does not need to have a unit prefix
+                                    valid_length = True
+
+                                # User input is valid
+                                if valid_length and valid_prefix:
+                                    # Add user input
+                                    component.unit_prefix += event.unicode
+
+                                # Invalid user input
+                                elif not valid_prefix:
+                                    # Display warning tkinter message
+                                    text = "Unknown unit prefix entered. Please enter a valid unit prefix.\n" \
+                                           "Valid unit prefixes: 'f', 'p', 'n', 'u', 'm', '', 'k', 'M', 'G', 'T'."
+                                    message_type = 'warning'
+                                    message_box()
+
+                                # Invalid length
+                                elif not valid_length:
+                                    # Display warning tkinter message
+                                    text = "Unit prefix can be only one character."
+                                    message_type = 'warning'
+                                    message_box()
+
+            # Quit button
+            if event.type == pygame.QUIT:
+                # Exit the loop
+                done = True
 
-                        # Backspace key
-                        elif event.key == pygame.K_BACKSPACE:
-                            # Delete last digit
-                            component.unit_prefix = component.unit_prefix[:-1]
+            # Window is resized, the background is drawn again for the new size
+            if event.type == pygame.VIDEORESIZE:
+                WIDTH, HEIGHT = event.w, event.h
+                background = draw_background((WIDTH, HEIGHT))
+                redraw = True
+            # Window was covered and has to be drawn again
+            elif event.type == pygame.VIDEOEXPOSE:
+                redraw = True
+
+            # 'Clear' button gets pressed
+            if clear_button.is_pressed():
+                # Check is there are any components in the main tab
+                if len(component_list) != 0:
+                    # Delete all components and wires
+                    component_list.empty()
+                    wires.clear()
+                    grid.clear()
+                    selected_components.clear()
+                    dragged_components.clear()
+                    pending_components.clear()
+                    results = {}
+                    # Set component type counts to 0
+                    independent_voltage_source_count = 0
+                    independent_current_source_count = 0
+                    resistor_count = 0
+
+            # 'Undo' button gets pressed
+            if undo_button.is_pressed():
+                for component in component_list:
+                    # Find last component added to the main tab
+                    if len(component_list) == component.id:
+                        # Loop through all components again
+                        for component2 in component_list:
+                            # Check if deleted component id is in any links lists
+                            if component.id in component2.right_links:
+                                # Delete component id from every links list
+                                component2.right_links.remove(component.id)
+                            if component.id in component2.left_links:
+                                component2.left_links.remove(component.id)
+                        # Delete wires connected to the component
+                        wires.remove_component(component.id)
+                        # Delete the component
+                        grid.remove(component)
+                        for components in selected_components, dragged_components, pending_components:
+                            if component in components:
+                                components.remove(component)
+                        component.kill()
+                        results = {}
+
+            # 'Help' button gets pressed
+            if help_button.is_pressed():
+                # Display program's instructions
+                message_type = 'instructions'
+                text = "Add components to the main tab:\n" \
+                       "   - left mouse click on component's image\n\n" \
+                       "Connect two components together:\n" \
+                       "   - right mouse click on left or right side of first the component\n" \
+                       "   - another right mouse click on left or right side of the second component\n\n" \
+                       "Change component's value:\n" \
+                       "   - left mouse click on the component\n" \
+                       "   - left mouse click on component's value\n" \
+                       "   - type in new value\n" \
+                       "   - click the 'ENTER' key to save the new value\n\n" \
+                       "Change component's unit prefix:\n" \
+                       "   - left mouse click on the component\n" \
+                       "   - left mouse click on component's unit prefix (in front of component's unit)\n" \
+                       "   - type in the new unit prefix\n" \
+                       "   - click the 'ENTER' key to save the new unit prefix\n\n" \
+                       "Clear button:\n" \
+                       "   - deletes all components in the main tab\n\n" \
+                       "Undo button:\n" \
+                       "   - deletes the last component added to the main tab\n\n" \
+                       "Build button:\n" \
+                       "   - initialize MNA to calculate the results\n\n" \
+                       "'Esc' key or 'x' symbol:\n" \
+                       "   - press to close the simulator"
 
-                        # Any other key
-                        else:
-                            # Validation
-                            valid_length = False
-                            valid_prefix = False
-                            # Cross-reference check
-                            for key in component.allowed_unit_prefixes:
-                                # Compare user input to allowed unit prefixes
-                                if key == event.unicode:
-                                    valid_prefix = True
-
-                            # Length check
-                            if len(component.unit_prefix) < 1:
-                                # Unit prefix can be made up of only one letter
-                                # Or component does not need to have a unit prefix
-                                valid_length = True
-
-                            # User input is valid
-                            if valid_length and valid_prefix:
-                                # Add user input
-                                component.unit_prefix += event.unicode
-
-                            # Invalid user input
-                            elif not valid_prefix:
-                                # Display warning tkinter message
-                                text = "Unknown unit prefix entered. Please enter a valid unit prefix.\n" \
-                                       "Valid unit prefixes: 'f', 'p', 'n', 'u', 'm', '', 'k', 'M', 'G', 'T'."
-                                message_type = 'warning'
-                                message_box()
-
-                            # Invalid length
-                            elif not valid_length:
-                                # Display warning tkinter message
-                                text = "Unit prefix can be only one character."
-                                message_type = 'warning'
-                                message_box()
-
-        # Quit button
-        if event.type == pygame.QUIT:
-            # Exit the loop
-            done = True
-
-        # 'Clear' button gets pressed
-        if clear_button.is_pressed():
-            # Check is there are any components in the main tab
-            if len(component_list) != 0:
-                # Delete all components
-                component_list.empty()
-                # Set component type counts to 0
-                independent_voltage_source_count = 0
-                independent_current_source_count = 0
-                resistor_count = 0
-
-        # 'Undo' button gets pressed
-        if undo_button.is_pressed():
-            for component in component_list:
-                # Find last component added to the main tab
-                if len(component_list) == component.id:
-                    # Loop through all components again
-                    for component2 in component_list:
-                        # Check if deleted component id is in any links lists
-                        if component.id in component2.right_links:
-                            # Delete component id from every links list
-                            component2.right_links.remove(component.id)
-                        if component.id in component2.left_links:
-                            component2.left_links.remove(component.id)
-                    # Delete the component
-                    component.kill()
-
-        # 'Help' button gets pressed
-        if help_button.is_pressed():
-            # Display program's instructions
-            message_type = 'instructions'
-            text = "Add components to the main tab:\n" \
-                   "   - left mouse click on component's image\n\n" \
-                   "Connect two components together:\n" \
-                   "   - right mouse click on left or right side of first the component\n" \
-                   "   - another right mouse click on left or right side of the second component\n\n" \
-                   "Change component's value:\n" \
-                   "   - left mouse click on the component\n" \
-                   "   - left mouse click on component's value\n" \
-                   "   - type in new value\n" \
-                   "   - click the 'ENTER' key to save the new value\n\n" \
-                   "Change component's unit prefix:\n" \
-                   "   - left mouse click on the component\n" \
-                   "   - left mouse click on component's unit prefix (in front of component's unit)\n" \
-                   "   - type in the new unit prefix\n" \
-                   "   - click the 'ENTER' key to save the new unit prefix\n\n" \
-                   "Clear button:\n" \
-                   "   - deletes all components in the main tab\n\n" \
-                   "Undo button:\n" \
-                   "   - deletes the last component added to the main tab\n\n" \
-                   "Build button:\n" \
-                   "   - initialize MNA to calculate the results\n\n" \
-                   "'Esc' key or 'x' symbol:\n" \
-                   "   - press to close the simulator"
-
-            message_box()
-
-        # 'Build'  button gets pressed
-        if build_button.is_pressed():
-            # Variable which will contain all lists of links
-            nodes = []
-            # Variable indicating whether to initialise MNA or not
-            error = False
-
-            # Validation
-            # Only one component is in the main tab
-            if len(component_list) < 2:
-                # Error detected so MNA won't be initialised
-                error = True
-                # Display warning tkinter message
-                message_type = 'warning'
-                text = "Not enough components to construct a circuit.\nPlease add more components."
                 message_box()
-                break
 
-            for component in component_list:
-                # Not all components are connected in a circuit
-                if len(component.right_links) == 0 or len(component.left_links) == 0:
+            # 'Build'  button gets pressed, unless a build is already running
+            if job is None and build_button.is_pressed():
+                # Variable indicating whether to initialise MNA or not
+                error = False
+
+                # Validation
+                # Only one component is in the main tab
+                if len(component_list) < 2:
                     # Error detected so MNA won't be initialised
                     error = True
                     # Display warning tkinter message
                     message_type = 'warning'
-                    text = "Not all components are connected in a circuit.\nPlease connect all components."
-                    message_box()
-                    break
-
-            if not error:
-                # Try creating a netlist
-                try:
-                    # Loop through components
-                    for component in component_list:
-                        # Add all links lists to nodes
-                        nodes.append(component.right_links)
-                        nodes.append(component.left_links)
-
-                    # Remove any redundant nodes
-                    for node in nodes:
-                        while nodes.count(node) != 1:
-                            nodes.remove(node)
-
-                    # Remove nodes which can be made from other nodes
-                    # Example: nodes = [[1,2], [1,2,3]]
-                    # Node [1,2] can be made from node [1,2,3], but Node [1,2,3] can be made from node [1,2]
-                    # Therefore, node [1,2] needs to be removed from the nodes list
-                    nodes_to_remove = []  # List of nodes which need to be removed
-                    # Loop through modes
-                    for node1 in nodes:
-                        # Loop through nodes again
-                        for node2 in nodes:
-                            # Variable which will temporarily hold component ids
-                            node_hold = []
-                            # Makes sure two nodes are not the same node
-                            if node1 != node2:
-                                # Loop though ids in the first node
-                                for link1 in node1:
-                                    # Loop through ids in the second node
-                                    for link2 in node2:
-                                        # Compare two ids
-                                        if link1 == link2:
-                                            # Append to the hold variable and eventually create a new node
-                                            node_hold.append(link1)
-                            # Compare second node to newly created node
-                            if node2 == node_hold:
-                                # If two nodes are the same, second node needs to be removed from the nodes list
-                                nodes_to_remove.append(node2)
-
-                    # After loop through nodes list, remove unwanted nodes
-                    for node in nodes_to_remove:
-                        nodes.remove(node)
-
-                    # Determine which nodes each component is connected to
-                    # Determine which node is high component's node and which is low component's node
-                    for component in component_list:
-                        # Loop through components and nodes
-                        for node in nodes:
-                            # Variable which will hold component ids
-                            node_hold = []
-                            # Loop through ids in nodes
-                            for link1 in node:
-                                # Loop through ids in component's right links list
-                                for link2 in component.right_links:
-                                    # Compare two component ids
-                                    if link1 == link2:
-                                        # Two ids are same, so id gets added to the hold variable to create a new node
-                                        node_hold.append(link1)
-                            # Compare component's right links list to newly created node
-                            if component.right_links == node_hold:
-                                # Two nodes are same so node becomes component's low node
-                                component.low_node = nodes.index(node)
-                            # Repeat the procedure for components left links list
-                            # This will create component's high node
-                            node_hold = []
-                            for link1 in node:
-                                for link2 in component.left_links:
-                                    if link1 == link2:
-                                        node_hold.append(link1)
-                            if component.left_links == node_hold:
-                                component.high_node = nodes.index(node)
-
-
-                # Components are connected in such way that a short circuit was created
-                except ValueError:
-                    # Display warning tkinter message
-                    message_type = 'warning'
-                    text = "Circuit was not built properly.\nPlease try again."
+                    text = "Not enough components to construct a circuit.\nPlease add more components."
                     message_box()
                     break
 
-                # Create a netlist text file
-                f = open('dc_circuit.txt', 'w')
-                # Loop through components
                 for component in component_list:
-                    # Add needed information of every component to the file
-                    component.netlist = [str(component.type) + str(component.name_id) + ' ',
-                                         str(component.high_node) + ' ',
-                                         str(component.low_node) + ' ',
-                                         str(component.value) + str(component.unit_prefix)]
-                    # In each line write information of one component
-                    f.writelines(component.netlist)
-                    f.write('\n')
-                # Close the file
-                f.close()
-
-                # MNA
-                netlist_file = 'dc_circuit.txt'
-                # Initialise MNA
-
-                circuit = MNA(netlist_file, False)
-                # Parse file
-                circuit.Parse_netlist()
-
-                # Try filling the matrices and solving the matrix equation
-                try:
-                    # Solve matrix equation for unknown nodal voltages and current going through voltage sources
-                    x_matrix = circuit.x_matrix()
-                    # Print results of the MNA equation
-                    circuit.print_results(x_matrix)
-
-
-                # There is an error in the circuit so it cannot results cannot be calculated properly
-                except numpy.linalg.LinAlgError:
-                    # Display warning tkinter message
-                    message_type = 'warning'
-                    text = "Circuit was not built properly.\nPlease try again"
-                    message_box()
-                    break
+                    # Not all components are connected in a circuit
+                    if len(component.right_links) == 0 or len(component.left_links) == 0:
+                        # Error detected so MNA won't be initialised
+                        error = True
+                        # Display warning tkinter message
+                        message_type = 'warning'
+                        text = "Not all components are connected in a circuit.\nPlease connect all components."
+                        message_box()
+                        break
+
+                if not error:
+                    # Determine which nodes each component is connected to
+                    find_nodes(component_list, wires)
 
-                # Ask the user if they would like to save the netlist file
-                message_type = 'yesno'
-                text = "Would you like to save the netlist to a text file?"
-                save = message_box()
-
-                # User wants to save the file
-                if save:
-                    # Create file name
-                    number = 1
-                    path = 'dc_circuit' + str(number) + '.txt'
-                    # Check if a file with that name exists
-                    file_exists = os.path.isfile(path)
-                    if file_exists:
-                        # Create new file name
-                        while file_exists:
-                            number += 1
-                            path = 'dc_circuit' + str(number) + '.txt'
-                            file_exists = os.path.isfile(path)
+                    # Lines of the netlist text file
+                    netlist = []
+                    # Loop through components
+                    for component in component_list:
+                        # Add needed information of every component to the file
+                        component.netlist = [str(component.type) + str(component.name_id) + ' ',
+                                             str(component.high_node) + ' ',
+                                             str(component.low_node) + ' ',
+                                             str(component.value) + str(component.unit_prefix)]
+                        # In each line write information of one component
+                        netlist.append(''.join(component.netlist))
+
+                    # MNA
+                    netlist_file = 'dc_circuit.txt'
+                    # Components and how they are connected, without their values
+                    topology = [(component.type + str(component.name_id), component.high_node, component.low_node)
+                                for component in component_list]
+
+                    # Results of the last build are no longer shown
+                    results = {}
+                    # Same circuit as the last build with only values changed
+                    if circuit is not None and topology == circuit_topology:
+                        # New values of all components, only changed ones affect the solution
+                        changes = {component.type + str(component.name_id): component.value + component.unit_prefix
+                                   for component in component_list}
+                        # Solve again using the factorisation from the last build
+                        job = SolveJob(netlist_file, netlist, circuit, changes)
                     else:
-                        pass
-
-                    # Open new file and netlist file
-                    with open('dc_circuit.txt', 'r') as first_file, open(path, 'a') as second_file:
-                        # Read content from netlist file
-                        for line in first_file:
-                            # Append content to new file
-                            second_file.write(line)
-                    # Close both files
-                    first_file.close()
-                    second_file.close()
-
-                    # Inform the user that the file is saved
-                    message_type = 'info'
-                    text = "File is saved under the name '" + str(path) + "'"
-                    message_box()
-
-                #  Pass if user does not want to save the file
-                else:
-                    pass
-
+                        job = SolveJob(netlist_file, netlist)
+                    circuit_topology = topology
+                    # Circuit is used by the job until it is done
+                    circuit = None
+
+            # 'Cancel' button gets pressed while a build is running
+            if job is not None and cancel_button.is_pressed():
+                # Job is left to stop on its own, circuit is built again from the netlist next time
+                job.cancel()
+                job = None
+
+            # When the user presses a button a mouse
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                # Get mouse position
+                pos = pygame.mouse.get_pos()
+                x = pos[0]
+                y = pos[1]
+
+                # Left mouse click
+                if event.button == 1:
+                    # Boxes for displaying component values
+                    if value_box.collidepoint(event.pos):
+                        # Ready for user input
+                        value_box_active = True
+                    else:
+                        value_box_active = False
 
-        # When the user presses a button a mouse
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            # Get mouse position
-            pos = pygame.mouse.get_pos()
-            x = pos[0]
-            y = pos[1]
-
-            # Left mouse click
-            if event.button == 1:
-                # Boxes for displaying component values
-                if value_box.collidepoint(event.pos):
-                    # Ready for user input
-                    value_box_active = True
-                else:
-                    value_box_active = False
+                    #  Boxes for displaying unit prefixes
+                    if unit_prefix_box.collidepoint(event.pos):
+                        # Ready for user input
+                        unit_prefix_box_active = True
+                    else:
+                        unit_prefix_box_active = False
+
+                    # When image of a component in the component tab gets clicked, a new component is added to the main tab.
+                    # Position of independent voltage source image
+                    if 10 < x < 160 and 70 < y < 180:
+                        # Define component's characteristics specific for each component
+                        independent_voltage_source_count += 1
+                        name_id = independent_voltage_source_count
+                        # Define component's characteristics specific for component's type
+                        image = independent_voltage_source
+                        component_type = 'V'
+                        # Value and unit prefix are predefined but they can be changed later
+                        value = '9.00'
+                        unit_prefix = ''
+                        unit = 'V'
+                        # Create a component using Component class
+                        # Component appears in the fixed position in the main tab
+                        # Create new id
+                        component = Component(200, 70, len(component_list) + 1)
+                        component_list.add(component)
+                        grid.add(component)
+
+                    # Same procedure is repeated for adding independent current sources and resistors
+                    # Position of independent current source image
+                    elif 10 < x < 160 and 190 < y < 300:
+                        independent_current_source_count += 1
+                        name_id = independent_current_source_count
+                        image = independent_current_source
+                        component_type = 'I'
+                        value = '1.00'
+                        unit_prefix = ''
+                        unit = 'A'
+                        component = Component(200, 190, len(component_list) + 1)
+                        component_list.add(component)
+                        grid.add(component)
+
+                    # Position of resistor image
+                    elif 10 < x < 160 and 310 < y < 420:
+                        resistor_count += 1
+                        name_id = resistor_count
+                        image = resistor
+                        component_type = 'R'
+                        value = '10.00'
+                        unit_prefix = ''
+                        unit = 'Ω'
+                        component = Component(200, 310, len(component_list) + 1)
+                        component_list.add(component)
+                        grid.add(component)
+
+                    # Components whose position collides with mouse position
+                    clicked_components = grid.point(pos)
+                    # User clicks anywhere in the main tab
+                    if 185 < x < WIDTH and 60 < y < HEIGHT:
+                        for component in selected_components[:]:
+                            # Component is no longer selected and its characteristics are no longer displayed
+                            if component not in clicked_components:
+                                component.selected = False
+                                selected_components.remove(component)
 
-                #  Boxes for displaying unit prefixes
-                if unit_prefix_box.collidepoint(event.pos):
-                    # Ready for user input
-                    unit_prefix_box_active = True
-                else:
-                    unit_prefix_box_active = False
-
-                # When image of a component in the component tab gets clicked, a new component is added to the main tab.
-                # Position of independent voltage source image
-                if 10 < x < 160 and 70 < y < 180:
-                    # Define component's characteristics specific for each component
-                    independent_voltage_source_count += 1
-                    name_id = independent_voltage_source_count
-                    # Define component's characteristics specific for component's type
-                    image = independent_voltage_source
-                    component_type = 'V'
-                    # Value and unit prefix are predefined but they can be changed later
-                    value = '9.00'
-                    unit_prefix = ''
-                    unit = 'V'
-                    # Create a component using Component class
-                    # Component appears in the fixed position in the main tab
-                    # Create new id
-                    component_list.add(Component(200, 70, len(component_list) + 1))
-
-                # Same procedure is repeated for adding independent current sources and resistors
-                # Position of independent current source image
-                elif 10 < x < 160 and 190 < y < 300:
-                    independent_current_source_count += 1
-                    name_id = independent_current_source_count
-                    image = independent_current_source
-                    component_type = 'I'
-                    value = '1.00'
-                    unit_prefix = ''
-                    unit = 'A'
-                    component_list.add(Component(200, 190, len(component_list) + 1))
-
-                # Position of resistor image
-                elif 10 < x < 160 and 310 < y < 420:
-                    resistor_count += 1
-                    name_id = resistor_count
-                    image = resistor
-                    component_type = 'R'
-                    value = '10.00'
-                    unit_prefix = ''
-                    unit = 'Ω'
-                    component_list.add(Component(200, 310, len(component_list) + 1))
-
-                # Loop through all component to check if a component was clicked
-                for component in component_list:
-                    # Compare component's position to mouse position.
-                    # If collision detected
-                    if component.rect.collidepoint(pos):
+                    for component in clicked_components:
                         # Component gets clicked
                         component.clicked = True
                         component.clicked_count += 1
+                        dragged_components.append(component)
                         # If component was clicked odd number of times
                         if component.clicked_count % 2 != 0:
                             # Component gets selected and its characteristics get displayed in component tab
                             component.selected = True
+                            selected_components.append(component)
                         # If component is clicked on again (now even number of times)
                         else:
                             # Component is no longer selected and its characteristics are no longer displayed
                             component.selected = False
-                    # If there is no collision
-                    else:
-                        # User clicks anywhere in the main tab
-                        if 185 < x < WIDTH and 60 < y < HEIGHT:
-                            # # Component is no longer selected and its characteristics are no longer displayed
-                            component.selected = False
+                            if component in selected_components:
+                                selected_components.remove(component)
 
-            # Right mouse click
-            elif event.button == 3:
+                # Right mouse click
+                elif event.button == 3:
 
-                # Loop through components to check if any were clicked
-                for component in component_list:
-                    # If mouse position collides with component's position
-                    if component.rect.collidepoint(pos):
+                    # Components whose position collides with mouse position
+                    for component in grid.point(pos):
                         # Component is ready for connecting
                         component.ready = True
-                        # Define variables
-                        # Count components which are ready
-                        count = 0
-                        # List of component's ids which are ready
-                        links = []
+                        if component not in pending_components:
+                            pending_components.append(component)
 
                         # Check which side of the component has been clicked
                         if component.rect.x < x < (component.rect.x + component.rect.width // 2):
@@ -871,115 +1288,96 @@ while not done:
                         elif component.image == resistor and component.RightSide:
                             component.image = resistor_right_side
 
-                        # Loop through components
-                        for component in component_list:
-                            if component.ready:
-                                count += 1
-                                links.append(component.id)
-
-                            # Connect two components which are ready for connecting
-                            if count == 2:
-                                for component in component_list:
-                                    if component.ready:
-                                        # Component is no longer ready for connecting
-                                        component.ready = False
-                                        # Component's right side was clicked
-                                        if component.RightSide:
-                                            # Add components id to the links list
-                                            component.right_links += links
-                                            # Right side is no longer ready for connecting
-                                            component.RightSide = False
-                                        # Component's left side was clicked
-                                        elif component.LeftSide:
-                                            # Add components id to the links list
-                                            component.left_links += links
-                                            # Left side is no longer ready for connecting
-                                            component.LeftSide = False
-
-                                        # Two new component ids are now added to the links lists.
-                                        # A components id might be stored in its own links lists more than once.
-                                        # Remove any redundant component ids in links lists.
-                                        # Loop through right links list
-                                        for link_id in component.right_links:
-                                            # Loop until there is no more than one same component id in the list
-                                            while component.right_links.count(link_id) != 1:
-                                                # Delete redundant id
-                                                component.right_links.remove(link_id)
-                                        # Repeat for left links list
-                                        for link_id in component.left_links:
-                                            while component.left_links.count(link_id) != 1:
-                                                component.left_links.remove(link_id)
-
-                                        # Sort the link list containing component ids in ascending order
-                                        component.right_links = sorted(component.right_links)
-                                        component.left_links = sorted(component.left_links)
-
-                                        # Change component's image back to normal
-                                        if component.image == independent_voltage_source_right_side \
-                                                or component.image == independent_voltage_source_left_side:
-                                            component.image = independent_voltage_source
-                                        elif component.image == independent_current_source_right_side \
-                                                or component.image == independent_current_source_left_side:
-                                            component.image = independent_current_source
-                                        elif component.image == resistor_right_side \
-                                                or component.image == resistor_left_side:
-                                            component.image = resistor
-
-        #  Mouse button is no longer pressed
-        if event.type == pygame.MOUSEBUTTONUP:
-            for component in component_list:
-                # Every component is no longer clicked
-                component.clicked = False
-
-    # Drawing code
-    # Draw all parts of GUI
-    toolbar()
-    main_tab()
-    component_tab()
-    # Draw components
-    component_list.draw(screen)
-
-    # Program logic
-    for component in component_list:
-        # Line position variables which will connect two components  together
-        start_pos = (0, 0)
-        end_pos = (0, 0)
-
-        # Create circuit network
-        # Check if link lists are not empty
-        if len(component.right_links) != 0 or len(component.left_links) != 0:
-            # Another loop going through all components
-            for component2 in component_list:
-                # Check if component id is in other components links lists
-                # Right - Right link
-                if component2.id in component.right_links and component.id in component2.right_links:
-                    # Define line's start and end positions
-                    start_pos = (
-                        component.rect.x + component.rect.width, component.rect.y + (component.rect.height // 2))
-                    end_pos = (component2.rect.x + component2.rect.width, component2.rect.y
-                               + (component2.rect.height // 2))
-                # Repeat for all possible link sides combinations
-                # Left - Left link
-                elif component2.id in component.left_links and component.id in component2.left_links:
-                    start_pos = (component.rect.x, component.rect.y + (component.rect.height // 2))
-                    end_pos = (component2.rect.x, component2.rect.y + (component2.rect.height // 2))
-                # Right - Left link
-                elif component2.id in component.right_links and component.id in component2.left_links:
-                    start_pos = (
-                        component.rect.x + component.rect.width, component.rect.y + (component.rect.height // 2))
-                    end_pos = (component2.rect.x, component2.rect.y + (component2.rect.height // 2))
-                # Left - Right link
-                elif component2.id in component.left_links and component.id in component2.right_links:
-                    start_pos = (component.rect.x, component.rect.y + (component.rect.height // 2))
-                    end_pos = (component2.rect.x + component2.rect.width, component2.rect.y
-                               + (component2.rect.height // 2))
-
-                # Dray a line connecting two components
-                pygame.draw.line(screen, BLACK, start_pos, end_pos, 7)
-
+                        # Connect two components which are ready for connecting
+                        if len(pending_components) == 2:
+                            # List of component's ids which are ready
+                            links = [ready_component.id for ready_component in pending_components]
+                            # Sides joined by the new wire
+                            wire = []
+                            for ready_component in pending_components:
+                                # Component is no longer ready for connecting
+                                ready_component.ready = False
+                                # Component's right side was clicked
+                                if ready_component.RightSide:
+                                    # Add components id to the links list
+                                    ready_component.right_links += links
+                                    wire.append((ready_component.id, 'right'))
+                                    # Right side is no longer ready for connecting
+                                    ready_component.RightSide = False
+                                # Component's left side was clicked
+                                elif ready_component.LeftSide:
+                                    # Add components id to the links list
+                                    ready_component.left_links += links
+                                    wire.append((ready_component.id, 'left'))
+                                    # Left side is no longer ready for connecting
+                                    ready_component.LeftSide = False
+
+                                # Two new component ids are now added to the links lists.
+                                # A components id might be stored in its own links lists more than once.
+                                # Remove any redundant component ids in links lists.
+                                # Loop through right links list
+                                for link_id in ready_component.right_links:
+                                    # Loop until there is no more than one same component id in the list
+                                    while ready_component.right_links.count(link_id) != 1:
+                                        # Delete redundant id
+                                        ready_component.right_links.remove(link_id)
+                                # Repeat for left links list
+                                for link_id in ready_component.left_links:
+                                    while ready_component.left_links.count(link_id) != 1:
+                                        ready_component.left_links.remove(link_id)
+
+                                # Sort the link list containing component ids in ascending order
+                                ready_component.right_links = sorted(ready_component.right_links)
+                                ready_component.left_links = sorted(ready_component.left_links)
+
+                                # Change component's image back to normal
+                                if ready_component.image == independent_voltage_source_right_side \
+                                        or ready_component.image == independent_voltage_source_left_side:
+                                    ready_component.image = independent_voltage_source
+                                elif ready_component.image == independent_current_source_right_side \
+                                        or ready_component.image == independent_current_source_left_side:
+                                    ready_component.image = independent_current_source
+                                elif ready_component.image == resistor_right_side \
+                                        or ready_component.image == resistor_left_side:
+                                    ready_component.image = resistor
+
+                            pending_components.clear()
+
+                            # Remember the wire when both components had a side selected
+                            if len(wire) == 2:
+                                wires.add(*wire)
+                                results = {}
+
+            #  Mouse button is no longer pressed
+            if event.type == pygame.MOUSEBUTTONUP:
+                for component in dragged_components:
+                    # Every component is no longer clicked
+                    component.clicked = False
+                dragged_components.clear()
+
+        # Build running in the background is done
+        if job is not None and job.done():
+            if job.problems:
+                # Display warning tkinter message with the components causing each problem
+                message_type = 'warning'
+                text = "Circuit cannot be solved.\n" + topology_text(job.problems)
+                message_box()
+            elif job.solution is None:
+                # Solve failed, display warning tkinter message
+                message_type = 'warning'
+                text = "Circuit was not built properly.\nPlease try again"
+                message_box()
+            else:
+                # Results are drawn under the components and the circuit is kept for the next build
+                circuit = job.circuit
+                results = result_labels(job.solution)
+                ask_save = True
+            job = None
+            changed = True
+
+        # Program logic
         # Drag and drop system
-        # Check if component is clicked
-        if component.clicked:
+        for component in dragged_components:
             # Get mouse position
             pos = pygame.mouse.get_pos()
             # While users moves a mouse inside the main tab
@@ -989,33 +1387,97 @@ while not done:
                 # Mouse is always positioned in the center of component
                 component.rect.x = pos[0] - (component.rect.width // 2)
                 component.rect.y = pos[1] - (component.rect.height // 2)
-
-        # Selected components
-        if component.selected:
-            # Display component's name, value, unit, unit prefix and short description
-            component.display_characteristics()
-
-            # Change component's image that tells the user which component is selected
-            if component.image == independent_voltage_source:
-                component.image = independent_voltage_source_selected
-            elif component.image == independent_current_source:
-                component.image = independent_current_source_selected
-            elif component.image == resistor:
-                component.image = resistor_selected
-        # If component is not selected
+                grid.move(component)
+                changed = True
+
+        for component in component_list if changed else ():
+            # Selected components
+            if component.selected:
+                # Change component's image that tells the user which component is selected
+                if component.image == independent_voltage_source:
+                    component.image = independent_voltage_source_selected
+                elif component.image == independent_current_source:
+                    component.image = independent_current_source_selected
+                elif component.image == resistor:
+                    component.image = resistor_selected
+            # If component is not selected
+            else:
+                # Display normal component image
+                if component.image == independent_voltage_source_selected:
+                    component.image = independent_voltage_source
+                elif component.image == independent_current_source_selected:
+                    component.image = independent_current_source
+                elif component.image == resistor_selected:
+                    component.image = resistor
+
+        # Drawing code
+        # Only parts of the screen where something moved, appeared, disappeared or changed are drawn again
+        if changed or redraw:
+            # Create circuit network
+            lines = wire_lines(component_list, wires)
+            line_rects = [line_rect(*line) for line in lines]
+            labels = result_positions(component_list, results)
+            items = scene(component_list, selected_components, lines, line_rects, labels, job)
+            if redraw:
+                rects = [screen.get_rect()]
+                redraw = False
+            else:
+                rects = whole_lines(dirty_rects(last_items, items), line_rects)
+                if len(rects) > dirty_rect_limit:
+                    rects = [screen.get_rect()]
+            last_items = items
+            draw(rects, grid, selected_components, lines, line_rects, labels, job)
+        # Only the progress of a running build is drawn again, nothing else is in its area
+        elif job is not None and progress_item(job) != last_items.get('progress'):
+            last_items['progress'] = progress_item(job)
+            rects = [last_items['progress'][1]]
+            draw(rects, grid, selected_components, [], [], {}, job)
         else:
-            # Display normal component image
-            if component.image == independent_voltage_source_selected:
-                component.image = independent_voltage_source
-            elif component.image == independent_current_source_selected:
-                component.image = independent_current_source
-            elif component.image == resistor_selected:
-                component.image = resistor
-
-    # Update the screen
-    pygame.display.update()
-    # Repeat update 60 times each second
-    clock.tick(fps)
-
-# Close pygame
-pygame.quit()
+            rects = []
+
+        # Update the changed parts of the screen
+        pygame.display.update(rects)
+
+        # Ask the user if they would like to save the netlist file, after the results are shown
+        if ask_save:
+            ask_save = False
+            message_type = 'yesno'
+            text = "Would you like to save the netlist to a text file?"
+            save = message_box()
+
+            # User wants to save the file
+            if save:
+                # Create file name
+                number = 1
+                path = 'dc_circuit' + str(number) + '.txt'
+                # Check if a file with that name exists
+                file_exists = os.path.isfile(path)
+                if file_exists:
+                    # Create new file name
+                    while file_exists:
+                        number += 1
+                        path = 'dc_circuit' + str(number) + '.txt'
+                        file_exists = os.path.isfile(path)
+                else:
+                    pass
+
+                # Open new file and netlist file
+                with open('dc_circuit.txt', 'r') as first_file, open(path, 'a') as second_file:
+                    # Read content from netlist file
+                    for line in first_file:
+                        # Append content to new file
+                        second_file.write(line)
+                # Close both files
+                first_file.close()
+                second_file.close()
+
+                # Inform the user that the file is saved
+                message_type = 'info'
+                text = "File is saved under the name '" + str(path) + "'"
+                message_box()
+
+        # Repeat update 60 times each second
+        clock.tick(fps)
+
+    # Close pygame
+    pygame.quit()
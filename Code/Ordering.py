@@ -0,0 +1,64 @@
+import numpy
+
+# Orderings of circuit nodes which reduce fill when the A matrix is factorised
+# Every ordering takes the node graph (symmetric sparse matrix, one row per node without ground)
+# and returns the nodes in their new order, or None when the solver should order them itself
+# scipy is only imported when an ordering is made
+
+
+def reverse_cuthill_mckee(graph):
+    # Breadth-first ordering which keeps connected nodes close together, so A has a narrow band
+    # Fill of LU is the whole band, on meshes this is more than with the other orderings
+    from scipy.sparse.csgraph import reverse_cuthill_mckee as rcm
+
+    return rcm(graph.tocsr(), symmetric_mode=True).astype(numpy.int64)
+
+
+def nested_dissection(graph, leaf_size=128):
+    from scipy.sparse.csgraph import dijkstra
+
+    # Split the graph with a separator into two parts which are not connected, order both parts
+    # the same way and put the separator last, so eliminating one part never fills the other one
+    # Separators are middle levels of a breadth-first search from a node far from the rest of the graph
+    def dissect(nodes, subgraph):
+        if len(nodes) <= leaf_size:
+            return [nodes]
+
+        # Distance of every node from a node at the edge of the graph
+        distance = dijkstra(subgraph, directed=False, indices=0, unweighted=True)
+        reached = numpy.isfinite(distance)
+        if not numpy.all(reached):
+            # Parts which are not connected are ordered one after another
+            return part(nodes, subgraph, reached) + part(nodes, subgraph, ~reached)
+        distance = dijkstra(subgraph, directed=False, indices=int(numpy.argmax(distance)), unweighted=True)
+        middle = int(distance.max()) // 2
+        if middle == 0:
+            return [nodes]
+        return part(nodes, subgraph, distance < middle) + part(nodes, subgraph, distance > middle) + \
+            [nodes[distance == middle]]
+
+    def part(nodes, subgraph, selected):
+        # Order the selected nodes of a subgraph
+        positions = numpy.flatnonzero(selected)
+        return dissect(nodes[positions], subgraph[positions][:, positions])
+
+    graph = graph.tocsr()
+    return numpy.concatenate(dissect(numpy.arange(graph.shape[0]), graph)).astype(numpy.int64)
+
+
+def minimum_degree(graph):
+    # scipy has no approximate minimum degree ordering of its own, SuperLU orders columns by
+    # multiple minimum degree on A.T + A instead, with rows ordered the same way
+    return None
+
+
+# Orderings by name
+orderings = {'rcm': reverse_cuthill_mckee,
+             'nd': nested_dissection,
+             'amd': minimum_degree}
+
+
+def bandwidth(A):
+    # Largest distance of a non-zero entry from the diagonal
+    A = A.tocoo()
+    return int(numpy.abs(A.row.astype(numpy.int64) - A.col).max()) if A.nnz else 0
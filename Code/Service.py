@@ -0,0 +1,232 @@
+import argparse
+import collections
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+from MNA import MNA, topology_text, factorisation_cache
+
+
+# Long running solver which keeps modules imported and factorisations cached between netlists
+# Requests and responses are JSON objects sent as frames: 4 byte big-endian length followed by UTF-8 JSON,
+# over a Unix socket or over standard input and output
+# Request: {"id": any value, "netlist": "text of the netlist"} with optional "solver", "ordering",
+#          "reduce", "check" (check topology first, default true) and "results" ("voltages" (default) or "all")
+# Response: {"id": same value, "nodes": {...}, "sources": {...}, "seconds": ...} or {"id": same value, "error": "..."}
+# Requests are solved by a pool of threads, responses can come back in a different order than requests
+# {"command": "statistics"} returns counts and latencies of solved requests
+
+frame_header = struct.Struct('>I')
+# Frames larger than this are not read, the stream is treated as broken
+frame_size_limit = 1 << 30
+
+
+class FrameTooLarge(ValueError):
+    # Payload of the frame is left unread, so the next frame cannot be found and the stream has to be closed
+    pass
+
+
+def read_frame(stream):
+    # Read one message, returns None at the end of the stream
+    header = stream.read(frame_header.size)
+    if len(header) < frame_header.size:
+        return None
+    size, = frame_header.unpack(header)
+    if size > frame_size_limit:
+        raise FrameTooLarge('Frame of {} bytes is too large'.format(size))
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return json.loads(data.decode())
+
+
+def write_frame(stream, message):
+    data = json.dumps(message).encode()
+    stream.write(frame_header.pack(len(data)) + data)
+    stream.flush()
+
+
+class SolverService:
+    def __init__(self, workers=None, queue_size=64):
+        # Threads solving requests, numpy and scipy release the GIL while factorising and solving
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(self.workers)
+        # Requests waiting or being solved, requests are not read while all slots are taken,
+        # so clients sending too fast are slowed down by the full socket or pipe
+        self.slots = threading.BoundedSemaphore(self.workers + queue_size)
+        # Counts and latencies (seconds) of the last solved requests
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=10000)
+
+    def Solve(self, request):
+        # Solve one netlist and return its results
+        circuit = MNA(None, solver=request.get('solver'), ordering=request.get('ordering'),
+                      reduce=bool(request.get('reduce', False)))
+        # Stages are not recorded, the time of the whole request is
+        circuit.instrumentation = None
+        circuit.Parse_text(request['netlist'])
+        if request.get('check', True):
+            problems = circuit.Check_topology()
+            if problems:
+                return {'error': 'Topology: ' + topology_text(problems).replace('\n', '; '),
+                        'topology': [{'problem': problem, 'components': names} for problem, names in problems]}
+        solution = circuit.Solution()
+        if request.get('results', 'voltages') == 'all':
+            return solution.as_dict()
+        return {'nodes': solution.node_voltages, 'sources': solution.source_currents}
+
+    def Statistics(self):
+        with self.lock:
+            latencies = numpy.array(self.latencies)
+            statistics = {'requests': self.requests, 'errors': self.errors, 'workers': self.workers,
+                          'cached_factorisations': len(factorisation_cache)}
+        if len(latencies):
+            statistics['latency'] = {'median': float(numpy.median(latencies)),
+                                     'p99': float(numpy.percentile(latencies, 99)),
+                                     'max': float(latencies.max())}
+        return statistics
+
+    def Handle(self, request):
+        # Response to one request, errors are sent back instead of stopping the service
+        start_time = time.perf_counter()
+        if not isinstance(request, dict):
+            return {'id': None, 'error': 'Request must be a JSON object'}
+        if request.get('command') == 'statistics':
+            return dict(self.Statistics(), id=request.get('id'))
+        try:
+            if 'netlist' not in request:
+                raise ValueError('Request has no netlist')
+            response = self.Solve(request)
+        except (ValueError, IndexError, KeyError, numpy.linalg.LinAlgError) as error:
+            response = {'error': type(error).__name__ + ': ' + str(error)}
+        seconds = time.perf_counter() - start_time
+        response['id'] = request.get('id')
+        response['seconds'] = seconds
+        with self.lock:
+            self.requests += 1
+            self.errors += 'error' in response
+            self.latencies.append(seconds)
+        return response
+
+    def Respond(self, request, writer, write_lock):
+        try:
+            response = self.Handle(request)
+        except Exception as error:
+            response = {'id': request.get('id') if isinstance(request, dict) else None,
+                        'error': type(error).__name__ + ': ' + str(error)}
+        finally:
+            self.slots.release()
+        with write_lock:
+            try:
+                write_frame(writer, response)
+            except (OSError, ValueError):
+                # Client went away before its response was ready
+                pass
+
+    def Serve_stream(self, reader, writer):
+        # Read requests until the end of the stream, responses are written as soon as each one is solved
+        write_lock = threading.Lock()
+        futures = []
+        while True:
+            try:
+                request = read_frame(reader)
+            except FrameTooLarge as error:
+                # Error is sent back and nothing more is read from the stream
+                with write_lock:
+                    write_frame(writer, {'id': None, 'error': 'FrameTooLarge: ' + str(error)})
+                break
+            except ValueError as error:
+                # Message which is not JSON, the stream can still be read
+                with write_lock:
+                    write_frame(writer, {'id': None, 'error': 'ValueError: ' + str(error)})
+                continue
+            except OSError:
+                break
+            if request is None:
+                break
+            self.slots.acquire()
+            futures = [future for future in futures if not future.done()]
+            futures.append(self.pool.submit(self.Respond, request, writer, write_lock))
+        # Responses to all requests of the stream are sent before it is closed
+        for future in futures:
+            future.result()
+
+    def Serve_connection(self, connection):
+        with connection, connection.makefile('rb') as reader, connection.makefile('wb') as writer:
+            self.Serve_stream(reader, writer)
+
+    def Serve_unix(self, path):
+        # Accept clients on a Unix socket, every client is read by its own thread
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        try:
+            while True:
+                connection, _ = server.accept()
+                threading.Thread(target=self.Serve_connection, args=(connection,), daemon=True).start()
+        finally:
+            server.close()
+            os.unlink(path)
+
+    def Close(self):
+        self.pool.shutdown()
+
+
+class SolverClient:
+    # Client of a service listening on a Unix socket, sends one request at a time
+    def __init__(self, path):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(path)
+        self.reader = self.connection.makefile('rb')
+        self.writer = self.connection.makefile('wb')
+        self.count = 0
+
+    def Request(self, message):
+        self.count += 1
+        write_frame(self.writer, dict(message, id=self.count))
+        return read_frame(self.reader)
+
+    def Solve(self, netlist, **options):
+        return self.Request(dict(options, netlist=netlist))
+
+    def Close(self):
+        self.reader.close()
+        self.writer.close()
+        self.connection.close()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Solve netlists sent as framed JSON requests.')
+    parser.add_argument('-u', '--socket', default=None,
+                        help='Unix socket to listen on (default: standard input and output)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of worker threads')
+    parser.add_argument('-q', '--queue', type=int, default=64,
+                        help='requests waiting for a worker before reading stops (default: 64)')
+    arguments = parser.parse_args(arguments)
+
+    service = SolverService(arguments.workers, arguments.queue)
+    # Modules used when solving are imported before the first request
+    service.Solve({'netlist': 'V1 1 0 1\nR1 1 0 1\n'})
+    try:
+        if arguments.socket:
+            service.Serve_unix(arguments.socket)
+        else:
+            service.Serve_stream(sys.stdin.buffer, sys.stdout.buffer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.Close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import warnings
+from abc import ABC, abstractmethod
+import numpy
+from Decomposition import DecompositionSolver
+
+# Linear solvers for the MNA matrix equation A x = z
+# Every solver is made from the A matrix and has a solve method taking one z matrix, or several z matrices
+# as columns of a 2D array, the same way as scipy's SuperLU factorisations
+# Solvers raise numpy.linalg.LinAlgError when A is singular or no solution is found
+# scipy is only imported when a solver is made
+
+# Limits used when a solver is chosen automatically
+# Circuits up to this size are solved with dense matrices
+dense_size_limit = 400
+# Larger circuits are still solved with dense matrices when at least this fraction of A is filled
+dense_fill_limit = 0.05
+dense_fill_size_limit = 4000
+# Sparse LU is faster than iterative solvers on circuits (1000 x 1000 resistor grid: SuperLU 21 s,
+# conjugate gradients 129 s), but its fill uses too much memory for the largest circuits
+# From this size circuits are solved iteratively, with conjugate gradients when there are no voltage sources
+# and GMRES when there are
+iterative_size_limit = 4000000
+
+
+class DenseSolver:
+    # LU factorisation of a dense A matrix with LAPACK
+    dense = True
+
+    def __init__(self, A, options):
+        from scipy.linalg import lu_factor, LinAlgWarning
+
+        with warnings.catch_warnings():
+            # Singular matrices are reported with an error instead of a warning
+            warnings.simplefilter('ignore', LinAlgWarning)
+            self.factorisation = lu_factor(A, check_finite=False)
+        if not numpy.all(numpy.diag(self.factorisation[0])):
+            raise numpy.linalg.LinAlgError('Singular matrix')
+        # Number of stored entries of the factors
+        self.nonzeros = A.shape[0] * A.shape[0]
+
+    def solve(self, z):
+        from scipy.linalg import lu_solve
+
+        return lu_solve(self.factorisation, z, check_finite=False)
+
+
+class SuperLUSolver:
+    # Sparse LU factorisation with SuperLU
+    # Options:
+    #  - 'permc_spec' chooses the column ordering: 'COLAMD' (default), 'MMD_AT_PLUS_A', 'MMD_ATA' or 'NATURAL'
+    #  - 'symmetric' orders rows the same way as columns, for A with a symmetric structure
+    #  - 'diag_pivot_thresh' how much smaller than the largest entry of its column a diagonal pivot can be
+    #    (default 1, partial pivoting), smaller values keep more of the ordering
+    dense = False
+
+    def __init__(self, A, options):
+        from scipy.sparse.linalg import splu
+
+        try:
+            self.factorisation = splu(A, permc_spec=options.get('permc_spec', 'COLAMD'),
+                                      diag_pivot_thresh=options.get('diag_pivot_thresh'),
+                                      options={'SymmetricMode': bool(options.get('symmetric', False))})
+        except RuntimeError as error:
+            # Singular matrix, raised the same way as numpy does for the dense matrix
+            raise numpy.linalg.LinAlgError(str(error))
+        # Number of stored entries of the factors, unit diagonal of L is not stored
+        self.nonzeros = self.factorisation.L.nnz + self.factorisation.U.nnz - A.shape[0]
+
+    def solve(self, z):
+        return self.factorisation.solve(z)
+
+
+class IterativeSolver(ABC):
+    # Preconditioned Krylov method, every z matrix is solved on its own
+    # Subclasses give the scipy function of the method with Method
+    # Options: 'rtol' (relative tolerance of the residual, default 1e-10) and 'maxiter'
+    dense = False
+
+    def __init__(self, A, options):
+        self.A = A
+        self.rtol = options.get('rtol', 1e-10)
+        self.maxiter = options.get('maxiter')
+        self.preconditioner = self.Preconditioner(A, options)
+
+    def Preconditioner(self, A, options):
+        return None
+
+    @abstractmethod
+    def Method(self):
+        pass
+
+    def solve(self, z):
+        z = numpy.asarray(z, dtype=float)
+        if z.ndim == 2:
+            return numpy.column_stack([self.solve(column) for column in z.T]) if z.shape[1] else z.copy()
+
+        x, info = self.Method()(self.A, z, rtol=self.rtol, atol=0.0, maxiter=self.maxiter, M=self.preconditioner)
+        if info != 0 or not numpy.all(numpy.isfinite(x)):
+            raise numpy.linalg.LinAlgError(type(self).__name__ + ' did not converge')
+        return x
+
+
+class ConjugateGradientSolver(IterativeSolver):
+    # Conjugate gradients with a diagonal (Jacobi) preconditioner
+    # Only for symmetric positive definite A, which circuits without voltage sources have
+    def Preconditioner(self, A, options):
+        from scipy.sparse import diags
+
+        diagonal = A.diagonal()
+        if numpy.any(diagonal <= 0):
+            raise numpy.linalg.LinAlgError('A matrix is not positive definite')
+        return diags(1 / diagonal)
+
+    def Method(self):
+        from scipy.sparse.linalg import cg
+        return cg
+
+
+class ILUSolver(IterativeSolver):
+    # Incomplete LU factorisation as the preconditioner, for any A
+    # Options: 'drop_tol' (default 1e-4), 'fill_factor' (default 10) and 'permc_spec' of the incomplete factorisation
+    # A of a circuit has a symmetric structure, ordering columns by A.T + A keeps much less fill than COLAMD,
+    # so far fewer entries are dropped and the preconditioner is much closer to A
+    def Preconditioner(self, A, options):
+        from scipy.sparse.linalg import spilu, LinearOperator
+
+        try:
+            factorisation = spilu(A.tocsc(), drop_tol=options.get('drop_tol', 1e-4),
+                                  fill_factor=options.get('fill_factor', 10),
+                                  permc_spec=options.get('permc_spec', 'MMD_AT_PLUS_A'))
+        except RuntimeError as error:
+            raise numpy.linalg.LinAlgError(str(error))
+        return LinearOperator(A.shape, factorisation.solve)
+
+
+class GMRESSolver(ILUSolver):
+    def Method(self):
+        from scipy.sparse.linalg import gmres
+        return gmres
+
+
+class BiCGSTABSolver(ILUSolver):
+    # Breaks down on most circuits with voltage sources, whose rows have zeros on the diagonal of A
+    # (grids and random circuits with one voltage source), it is only used when chosen by name
+    def Method(self):
+        from scipy.sparse.linalg import bicgstab
+        return bicgstab
+
+
+class ReorderedSolver:
+    # Solver made from A with rows and columns permuted, z and x are in the original order
+    def __init__(self, solver, permutation):
+        self.solver = solver
+        self.permutation = permutation
+        self.nonzeros = getattr(solver, 'nonzeros', None)
+
+    def solve(self, z):
+        z = numpy.asarray(z, dtype=float)
+        y = self.solver.solve(z[self.permutation])
+        x = numpy.empty_like(y)
+        x[self.permutation] = y
+        return x
+
+
+# Solvers by name, new solvers can be added with register_solver
+solvers = {'dense': DenseSolver,
+           'superlu': SuperLUSolver,
+           'cg': ConjugateGradientSolver,
+           'gmres': GMRESSolver,
+           'bicgstab': BiCGSTABSolver,
+           'decomposition': DecompositionSolver}
+
+
+def register_solver(name, solver):
+    # Add a solver class, it is made with (A, options) and needs a solve method and a dense attribute
+    solvers[name] = solver
+
+
+def choose_solver(size, nonzeros, voltage_count):
+    # Name of the solver best suited to the size and fill of the A matrix
+    if size <= dense_size_limit:
+        return 'dense'
+    if size <= dense_fill_size_limit and nonzeros >= dense_fill_limit * size * size:
+        return 'dense'
+    if size >= iterative_size_limit:
+        # Without voltage sources A is symmetric positive definite
+        return 'cg' if voltage_count == 0 else 'gmres'
+    return 'superlu'
@@ -0,0 +1,63 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Measure how long a fresh Python process takes to import the solver
+# Uses the same numbers as 'python -X importtime', taken from several cold starts
+def import_times(module, runs):
+    # Cumulative import time of the module (in milliseconds) for each run
+    # and self import times of every module from the last run
+    directory = os.path.dirname(os.path.abspath(__file__))
+    # Modules which must not be imported with the solver
+    check = "import sys; print(','.join(m for m in ('scipy', 'tkinter', 'pygame') if m in sys.modules))"
+    totals = []
+    modules = {}
+    for run in range(runs):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module + '; ' + check],
+                                 cwd=directory, capture_output=True, text=True, check=True)
+        modules = {}
+        for line in process.stderr.splitlines():
+            # Lines look like 'import time:  self [us] | cumulative | imported package'
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_time, cumulative, name = line[len('import time:'):].split('|')
+            modules[name.strip()] = (int(self_time) / 1000, int(cumulative) / 1000)
+        totals.append(modules[module][1])
+        heavy = process.stdout.strip()
+
+    return totals, modules, heavy
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Measure cold import time of the solver.')
+    parser.add_argument('module', nargs='?', default='MNA', help='module to import (default: MNA)')
+    parser.add_argument('-n', '--runs', type=int, default=10, help='number of fresh processes (default: 10)')
+    parser.add_argument('-t', '--target', type=float, default=200.0,
+                        help='maximum median import time in milliseconds (default: 200)')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest modules to show (default: 10)')
+    arguments = parser.parse_args(arguments)
+
+    totals, modules, heavy = import_times(arguments.module, arguments.runs)
+    median = statistics.median(totals)
+
+    print('import {}: median {:.1f} ms, min {:.1f} ms, max {:.1f} ms over {} runs'.format(
+        arguments.module, median, min(totals), max(totals), len(totals)))
+    print('slowest modules (self time):')
+    for name, (self_time, cumulative) in sorted(modules.items(), key=lambda item: -item[1][0])[:arguments.top]:
+        print('  {:8.2f} ms  {:8.2f} ms  {}'.format(self_time, cumulative, name))
+
+    failed = False
+    if heavy:
+        print('FAIL: importing {} also imported {}'.format(arguments.module, heavy))
+        failed = True
+    if median > arguments.target:
+        print('FAIL: median import time {:.1f} ms is over the target of {:.1f} ms'.format(median, arguments.target))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
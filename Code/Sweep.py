@@ -0,0 +1,80 @@
+import numpy
+from scipy.sparse.linalg import splu
+from MNA import MNA
+
+
+# Parameter sweeps and Monte Carlo tolerance analysis over component values
+# Variations are given as a dictionary from component name to a description of how its value changes:
+#  - ('linear', start, stop)      values evenly spaced from start to stop
+#  - ('list', values)             one value per sample
+#  - ('uniform', low, high)       random values between low and high
+#  - ('normal', mean, deviation)  random values from a normal distribution, mean None uses netlist value
+#  - ('tolerance', fraction)      random values within +/- fraction of the netlist value
+class Sweep:
+    def __init__(self, file_name, variations, seed=None):
+        # Circuit is parsed and its nodes are mapped only once for all samples
+        self.circuit = MNA(file_name, True)
+        self.circuit.Parse_netlist()
+        # How values of components change
+        self.variations = variations
+        # Random number generator, same seed gives the same samples
+        self.random = numpy.random.default_rng(seed)
+
+    def Samples(self, count):
+        # Values of all components for every sample, one row per sample
+        values = numpy.tile(self.circuit.components.values, (count, 1))
+        names = self.circuit.components.names.mapping()
+
+        for name, variation in self.variations.items():
+            if name not in names:
+                raise KeyError('Component ' + name + ' is not in the netlist')
+            position = names[name]
+            kind = variation[0]
+
+            if kind == 'linear':
+                values[:, position] = numpy.linspace(variation[1], variation[2], count)
+            elif kind == 'list':
+                if len(variation[1]) != count:
+                    raise ValueError('Component ' + name + ' needs ' + str(count) + ' values')
+                values[:, position] = variation[1]
+            elif kind == 'uniform':
+                values[:, position] = self.random.uniform(variation[1], variation[2], count)
+            elif kind == 'normal':
+                mean = values[0, position] if variation[1] is None else variation[1]
+                values[:, position] = self.random.normal(mean, variation[2], count)
+            elif kind == 'tolerance':
+                values[:, position] *= 1 + self.random.uniform(-variation[1], variation[1], count)
+            else:
+                raise ValueError('Unknown variation ' + str(kind) + ' for component ' + name)
+
+        return values
+
+    def Run(self, count):
+        # Solve the circuit for every sample
+        # Returns node voltages and currents through voltage sources, one row per sample
+        values = self.Samples(count)
+        circuit = self.circuit
+
+        # z matrices of all samples
+        z = circuit.z_matrix(values)
+
+        # Only sources change, so A is factorised once and every sample is a pair of triangular solves
+        resistors = circuit.components.select('R')
+        if numpy.all(values[:, resistors] == circuit.components.values[resistors]):
+            return circuit.Solve(z)
+
+        # Resistor values change, A is refilled for every sample using the same sparsity pattern
+        x = numpy.empty((count, circuit.matrix_size))
+        circuit.Pattern()
+        for sample in range(count):
+            x[sample] = splu(circuit.Restamp(values[sample])).solve(z[sample])
+
+        return x
+
+    def Labels(self):
+        # Name of the value in each column of the results
+        # Node voltages are in order of node numbers, followed by currents through voltage sources
+        components = self.circuit.components
+        nodes = [components.nodes[node] for node in range(1, self.circuit.node_count)]
+        sources = [components.names[position] for position in numpy.flatnonzero(components.select('V'))]
+        return nodes + sources
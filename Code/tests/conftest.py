@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the simulator are imported by name, same as they import each other
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,22 @@
+import json
+import pytest
+
+pytest.importorskip('scipy')
+import Benchmark
+
+
+def test_every_stage_is_timed_once(tmp_path):
+    result = Benchmark.benchmark('grid2d', 400, 'sparse', str(tmp_path), repeats=1)
+    assert set(result['seconds']) == set(Benchmark.stages) | {'total'}
+    assert result['seconds']['total'] == pytest.approx(sum(result['seconds'][stage] for stage in Benchmark.stages))
+    assert set(result['peak_bytes']) == set(Benchmark.stages)
+
+
+def test_compare(tmp_path):
+    output = str(tmp_path / 'benchmark.json')
+    arguments = ['-t', 'chain', '-s', '200', '-r', '1', '--no-memory', '-o', output]
+    assert Benchmark.main(arguments) == 0
+    with open(output) as f:
+        report = json.load(f)
+    assert [result['path'] for result in report['results']] == ['dense', 'sparse']
+    assert len(Benchmark.compare(report, report)) == 2
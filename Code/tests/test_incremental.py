@@ -0,0 +1,73 @@
+import numpy
+import pytest
+
+pytest.importorskip('scipy')
+import Benchmark
+import MNA as solver
+from MNA import MNA
+
+
+@pytest.fixture
+def netlist(tmp_path):
+    file_name = str(tmp_path / 'sources.txt')
+    Benchmark.many_sources(file_name, 400, numpy.random.default_rng(0))
+    with open(file_name) as f:
+        return f.read()
+
+
+def circuit(netlist):
+    result = MNA(None)
+    result.Parse_text(netlist)
+    return result
+
+
+def fresh_solve(netlist, changes):
+    # Solution of the circuit with new values parsed from the start
+    expected = circuit(netlist)
+    names = expected.components.names.mapping()
+    for name, value in changes.items():
+        expected.components.values[names[name]] = value
+    solver.factorisation_cache.clear()
+    return expected.x_matrix()
+
+
+def test_updates_match_fresh_solves(netlist):
+    generator = numpy.random.default_rng(1)
+    updated = circuit(netlist)
+    updated.x_matrix()
+    resistors = [name for name in updated.components.names.names() if name.startswith('R')]
+    changes = {}
+    # Edits of new resistors and of resistors edited before, Y columns are reused for the second ones
+    for _ in range(10):
+        for name in generator.choice(resistors, 3, replace=False):
+            changes[str(name)] = float(generator.uniform(1, 100))
+        x = updated.Update_values(changes)
+        assert numpy.allclose(x, fresh_solve(netlist, changes), rtol=1e-8, atol=1e-10)
+
+
+def test_source_values_change_z(netlist):
+    updated = circuit(netlist)
+    updated.x_matrix()
+    changes = {'V1': 7.5, 'R1': 12.0}
+    assert numpy.allclose(updated.Update_values(changes), fresh_solve(netlist, changes), rtol=1e-8, atol=1e-10)
+
+
+def test_many_changes_factorise_again(netlist, monkeypatch):
+    monkeypatch.setattr(solver, 'incremental_rank_limit', 4)
+    updated = circuit(netlist)
+    updated.x_matrix()
+    changes = {'R' + str(count): 50.0 for count in range(1, 11)}
+    assert numpy.allclose(updated.Update_values(changes), fresh_solve(netlist, changes), rtol=1e-8, atol=1e-10)
+
+
+def test_values_with_unit_prefixes():
+    netlist = 'V1 1 0 10\nR1 1 2 10\nR2 2 0 10\nR3 2 0 10\n'
+    updated = circuit(netlist)
+    updated.x_matrix()
+    assert numpy.allclose(updated.Update_values({'R3': '1k'}), fresh_solve(netlist, {'R3': 1000.0}))
+
+
+def test_unknown_component():
+    updated = circuit('V1 1 0 10\nR1 1 0 10\n')
+    with pytest.raises(KeyError):
+        updated.Update_values({'R9': 1.0})
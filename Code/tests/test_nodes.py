@@ -0,0 +1,163 @@
+import itertools
+import random
+import pytest
+
+pytest.importorskip('pygame')
+pytest.importorskip('tkinter')
+from Main import find_nodes
+
+
+class Side:
+    def __init__(self, id):
+        self.id = id
+        self.right_links = []
+        self.left_links = []
+
+
+def circuit(count, wires):
+    # Components with links lists made the way the GUI makes them when two sides are wired
+    components = [Side(id) for id in range(1, count + 1)]
+    for (first, first_side), (second, second_side) in wires:
+        for id, side in ((first, first_side), (second, second_side)):
+            component = components[id - 1]
+            links = getattr(component, side + '_links')
+            setattr(component, side + '_links', sorted(set(links) | {first, second}))
+    return components
+
+
+def old_find_nodes(components):
+    # Numbering of the netlist before nodes were found with a disjoint-set, kept as it was
+    nodes = []
+    for component in components:
+        nodes.append(component.right_links)
+        nodes.append(component.left_links)
+    for node in nodes:
+        while nodes.count(node) != 1:
+            nodes.remove(node)
+    nodes_to_remove = []
+    for node1 in nodes:
+        for node2 in nodes:
+            node_hold = []
+            if node1 != node2:
+                for link1 in node1:
+                    for link2 in node2:
+                        if link1 == link2:
+                            node_hold.append(link1)
+            if node2 == node_hold:
+                nodes_to_remove.append(node2)
+    for node in nodes_to_remove:
+        nodes.remove(node)
+    numbers = []
+    for component in components:
+        low = high = None
+        for node in nodes:
+            if all(link in node for link in component.right_links):
+                low = nodes.index(node)
+            if all(link in node for link in component.left_links):
+                high = nodes.index(node)
+        numbers.append((high, low))
+    return numbers
+
+
+def new_numbers(count, wires):
+    components = circuit(count, wires)
+    find_nodes(components, [tuple(sorted(wire)) for wire in wires])
+    return [(component.high_node, component.low_node) for component in components]
+
+
+def old_numbers(count, wires):
+    try:
+        return old_find_nodes(circuit(count, wires))
+    except ValueError:
+        return None
+
+
+def nets(count, wires):
+    # Sides joined by wires, the nodes a correct numbering has to give
+    groups = {(id, side): {(id, side)} for id in range(1, count + 1) for side in ('right', 'left')}
+    for first, second in wires:
+        if groups[first] is not groups[second]:
+            joined = groups[first] | groups[second]
+            for side in joined:
+                groups[side] = joined
+    return groups
+
+
+def old_is_valid(count, wires, numbers):
+    # Old numbering gave every side a node and the same node to exactly the sides joined by wires
+    if numbers is None or any(None in pair for pair in numbers):
+        return False
+    groups = nets(count, wires)
+    node_of = {}
+    for id, (high, low) in enumerate(numbers, 1):
+        node_of[(id, 'left')] = high
+        node_of[(id, 'right')] = low
+    return all((node_of[first] == node_of[second]) == (groups[first] is groups[second])
+               for first, second in itertools.combinations(node_of, 2))
+
+
+def test_series_loop():
+    wires = [((1, 'left'), (2, 'left')), ((2, 'right'), (3, 'left')), ((3, 'right'), (1, 'right'))]
+    assert old_numbers(3, wires) == [(0, 2), (0, 3), (3, 2)]
+    assert new_numbers(3, wires) == [(0, 2), (0, 3), (3, 2)]
+
+
+def test_series_chains():
+    # Two components in a loop are one node in the old numbering, they are left out
+    for count in range(3, 9):
+        wires = [((id, 'right'), (id % count + 1, 'left')) for id in range(1, count + 1)]
+        numbers = old_numbers(count, wires)
+        assert old_is_valid(count, wires, numbers)
+        assert new_numbers(count, wires) == numbers
+
+
+def test_cliques():
+    # Every side of a node wired to every other side of the node
+    generator = random.Random(1)
+    for _ in range(200):
+        count = generator.randint(2, 7)
+        sides = [(id, side) for id in range(1, count + 1) for side in ('right', 'left')]
+        generator.shuffle(sides)
+        cuts = sorted(generator.sample(range(1, len(sides)), generator.randint(1, len(sides) - 1)))
+        groups = [sides[start:end] for start, end in zip([0] + cuts, cuts + [len(sides)])]
+        wires = [wire for group in groups for wire in itertools.combinations(group, 2)]
+        generator.shuffle(wires)
+        numbers = old_numbers(count, wires)
+        if old_is_valid(count, wires, numbers):
+            assert new_numbers(count, wires) == numbers
+
+
+def test_random_loops():
+    # Loops of components with random sides wired, and random wires added between them
+    generator = random.Random(2)
+    checked = 0
+    for _ in range(3000):
+        count = generator.randint(2, 8)
+        order = list(range(1, count + 1))
+        generator.shuffle(order)
+        wires = []
+        for first, second in zip(order, order[1:] + order[:1]):
+            wires.append(((first, generator.choice(('right', 'left'))), (second, generator.choice(('right', 'left')))))
+        for _ in range(generator.randint(0, count)):
+            wires.append(((generator.randint(1, count), generator.choice(('right', 'left'))),
+                          (generator.randint(1, count), generator.choice(('right', 'left')))))
+        wires = [wire for wire in wires if wire[0] != wire[1]]
+        numbers = old_numbers(count, wires)
+        if old_is_valid(count, wires, numbers):
+            checked += 1
+            assert new_numbers(count, wires) == numbers
+    assert checked > 100
+
+
+def test_nodes_match_wires():
+    # Sides are in the same node exactly when they are joined by wires, also where the old numbering split nodes
+    wires = [((1, 'right'), (2, 'left')), ((2, 'left'), (3, 'left')), ((3, 'left'), (4, 'left')),
+             ((4, 'right'), (1, 'left')), ((2, 'right'), (3, 'right')), ((3, 'right'), (1, 'left'))]
+    numbers = new_numbers(4, wires)
+    groups = nets(4, wires)
+    node_of = {}
+    for id, (high, low) in enumerate(numbers, 1):
+        node_of[(id, 'left')] = high
+        node_of[(id, 'right')] = low
+    for first, second in itertools.combinations(node_of, 2):
+        assert (node_of[first] == node_of[second]) == (groups[first] is groups[second])
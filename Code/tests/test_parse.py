@@ -0,0 +1,31 @@
+import pytest
+
+from MNA import MNA
+
+
+def parse(text):
+    circuit = MNA(None)
+    circuit.Parse_text(text)
+    return circuit
+
+
+def test_components():
+    circuit = parse('V1 1 0 9\nr1 1 2 2.2k\n\nI1 0 2 1m\n')
+    assert circuit.components.names.names() == ['V1', 'r1', 'I1']
+    assert bytes(circuit.components.types).decode() == 'VRI'
+    assert circuit.components.values.tolist() == pytest.approx([9, 2200, 0.001])
+    assert circuit.voltage_count == 1
+
+
+@pytest.mark.parametrize('text', ['V1 1 0 9\nR1 1 2\n',
+                                  'V1 1 0 9\nR1 1 2 10 extra\n',
+                                  # Lines with too many and too few words, the total number of words is right
+                                  'V1 1 0 9\nR1 1 2 10 extra\nR2 2 0\n'])
+def test_lines_without_four_parts(text):
+    with pytest.raises(ValueError, match='four parts'):
+        parse(text)
+
+
+def test_unknown_component_type():
+    with pytest.raises(ValueError, match='Unknown component type: E1 1 0 2'):
+        parse('V1 1 0 9\nR1 1 0 10\nE1 1 0 2\n')
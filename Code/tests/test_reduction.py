@@ -0,0 +1,72 @@
+import random
+import numpy
+import pytest
+
+pytest.importorskip('scipy')
+from MNA import MNA, Solution
+
+
+def solve(netlist, reduce):
+    circuit = MNA(None, reduce=reduce)
+    circuit.Parse_text(netlist)
+    return Solution(circuit, circuit.x_matrix())
+
+
+def assert_same(netlist):
+    expected = solve(netlist, False)
+    reduced = solve(netlist, True)
+    assert numpy.allclose(reduced.voltages, expected.voltages, rtol=1e-9, atol=1e-12)
+    assert numpy.allclose(reduced.currents, expected.currents, rtol=1e-9, atol=1e-12)
+
+
+def test_series_chain():
+    lines = ['V1 1 0 9'] + ['R{} {} {} {}'.format(count, count, count + 1, count) for count in range(1, 24)]
+    lines.append('R24 24 0 10')
+    assert_same('\n'.join(lines) + '\n')
+
+
+def test_ladder_and_dead_ends():
+    lines = ['V1 1 0 5', 'I1 0 3 0.5']
+    for rung in range(1, 10):
+        lines += ['R{} {} {} 2'.format(3 * rung, rung, rung + 1),
+                  'R{} {} 0 3'.format(3 * rung + 1, rung + 1),
+                  'R{} {} d{} 4'.format(3 * rung + 2, rung, rung)]
+    assert_same('\n'.join(lines) + '\n')
+
+
+def test_random_circuits():
+    generator = random.Random(0)
+    checked = 0
+    for _ in range(100):
+        nodes = [str(node) for node in range(generator.randint(2, 12))]
+        lines = ['V1 {} 0 5'.format(generator.choice(nodes[1:]))]
+        for count in range(generator.randint(1, 20)):
+            lines.append('R{} {} {} {}'.format(count + 1, *generator.sample(nodes, 2), generator.randint(1, 9)))
+        for chain in range(generator.randint(0, 4)):
+            previous = generator.choice(nodes)
+            for link in range(generator.randint(1, 5)):
+                node = 'c{}_{}'.format(chain, link)
+                lines.append('R{}_{} {} {} {}'.format(chain, link, previous, node, generator.randint(1, 9)))
+                previous = node
+            if generator.random() < 0.5:
+                lines.append('R{}_end {} {} 1'.format(chain, previous, generator.choice(nodes)))
+        netlist = '\n'.join(lines) + '\n'
+        circuit = MNA(None)
+        circuit.Parse_text(netlist)
+        if circuit.Check_topology():
+            continue
+        assert_same(netlist)
+        checked += 1
+    assert checked > 20
+
+
+@pytest.mark.parametrize('floating', ['R2 2 3 1\nR3 3 4 1\n', 'R2 2 3 1\nR3 3 4 1\nR4 4 2 1\n'])
+def test_floating_chain(floating):
+    # Floating part has no node which is kept, it is left for the solver, same as without the reduction
+    netlist = 'V1 1 0 1\nR1 1 0 1\n' + floating
+    circuit = MNA(None)
+    circuit.Parse_text(netlist)
+    assert [problem for problem, names in circuit.Check_topology()] == ['floating']
+    for reduce in (False, True):
+        with pytest.raises(numpy.linalg.LinAlgError):
+            solve(netlist, reduce)
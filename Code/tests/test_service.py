@@ -0,0 +1,89 @@
+import io
+import json
+import pytest
+
+pytest.importorskip('scipy')
+import Service
+from Service import SolverService, frame_header, read_frame, write_frame
+
+netlist = 'V1 1 0 9\nR1 1 2 10\nR2 2 0 10\n'
+
+
+def frames(*messages):
+    stream = io.BytesIO()
+    for message in messages:
+        if isinstance(message, bytes):
+            stream.write(frame_header.pack(len(message)) + message)
+        else:
+            write_frame(stream, message)
+    stream.seek(0)
+    return stream
+
+
+def serve(reader):
+    service = SolverService(workers=2, queue_size=2)
+    writer = io.BytesIO()
+    try:
+        service.Serve_stream(reader, writer)
+    finally:
+        service.Close()
+    writer.seek(0)
+    responses = []
+    while True:
+        response = read_frame(writer)
+        if response is None:
+            return responses
+        responses.append(response)
+
+
+def test_frames_round_trip():
+    stream = frames({'id': 1, 'netlist': netlist}, {'id': 2})
+    assert read_frame(stream) == {'id': 1, 'netlist': netlist}
+    assert read_frame(stream) == {'id': 2}
+    assert read_frame(stream) is None
+
+
+def test_truncated_frame_ends_stream():
+    stream = io.BytesIO(frame_header.pack(10) + b'{}')
+    assert read_frame(stream) is None
+
+
+def test_solve_requests():
+    responses = serve(frames(*({'id': number, 'netlist': netlist} for number in range(10))))
+    assert sorted(response['id'] for response in responses) == list(range(10))
+    for response in responses:
+        assert response['nodes'] == pytest.approx({'1': 9.0, '2': 4.5})
+        assert response['sources'] == pytest.approx({'V1': -0.45})
+
+
+def test_errors_are_sent_back():
+    responses = serve(frames(b'not json', {'id': 1}, {'id': 2, 'netlist': 'R1 1 0 x\n'},
+                             {'id': 3, 'netlist': 'V1 1 0 1\nR1 1 0 1\nR2 2 3 1\n'}, {'id': 4, 'netlist': netlist}))
+    by_id = {response['id']: response for response in responses}
+    assert 'ValueError' in by_id[None]['error']
+    assert all('error' in by_id[number] for number in (1, 2, 3))
+    assert 'nodes' in by_id[4]
+
+
+def test_frame_too_large_closes_stream(monkeypatch):
+    # Payload of a frame which is too large is not read, so nothing after it can be read as frames
+    monkeypatch.setattr(Service, 'frame_size_limit', 200)
+    payload = json.dumps({'id': 1, 'netlist': netlist * 20}).encode()
+    responses = serve(frames(payload, {'id': 2, 'netlist': netlist}))
+    assert len(responses) == 1
+    assert responses[0]['id'] is None
+    assert 'FrameTooLarge' in responses[0]['error']
+
+
+def test_statistics():
+    responses = serve(frames({'id': 1, 'netlist': netlist}))
+    assert responses[0]['id'] == 1
+    service = SolverService(workers=1)
+    try:
+        service.Handle({'id': 1, 'netlist': netlist})
+        statistics = service.Handle({'id': 2, 'command': 'statistics'})
+    finally:
+        service.Close()
+    assert statistics['id'] == 2
+    assert statistics['requests'] == 1
+    assert statistics['errors'] == 0
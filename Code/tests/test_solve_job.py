@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip('pygame')
+pytest.importorskip('tkinter')
+pytest.importorskip('scipy')
+import MNA
+from Main import SolveJob
+
+netlist = ['V1 1 0 9.00', 'R1 1 2 10.00', 'R2 2 0 10.00']
+
+
+def finished(job):
+    job.thread.join(10)
+    assert job.done()
+    return job
+
+
+def test_solve(tmp_path):
+    job = finished(SolveJob(str(tmp_path / 'circuit.txt'), netlist))
+    assert job.error is None and not job.problems
+    assert job.solution.node_voltages == pytest.approx({'1': 9.0, '2': 4.5})
+    assert 'solve' in job.finished_stages
+
+    # Values changed in the same circuit are solved with its factorisation
+    job = finished(SolveJob(str(tmp_path / 'circuit.txt'), netlist, job.circuit, {'R2': 30.0}))
+    assert job.solution.node_voltages == pytest.approx({'1': 9.0, '2': 6.75})
+
+
+def test_topology_problems(tmp_path):
+    job = finished(SolveJob(str(tmp_path / 'circuit.txt'), netlist + ['V2 1 0 5.00']))
+    assert job.problems and job.solution is None
+
+
+def test_unexpected_error_is_kept(tmp_path, monkeypatch):
+    # Errors other than the ones expected from a circuit end the solve the same way
+    def fail(circuit):
+        raise IndexError('index out of range')
+
+    monkeypatch.setattr(MNA.MNA, 'x_matrix', fail)
+    job = finished(SolveJob(str(tmp_path / 'circuit.txt'), netlist))
+    assert isinstance(job.error, IndexError)
+    assert job.solution is None
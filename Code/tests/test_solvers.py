@@ -0,0 +1,63 @@
+import numpy
+import pytest
+
+pytest.importorskip('scipy')
+import Benchmark
+import Solvers
+from MNA import MNA
+
+
+def grid_netlist(tmp_path, size, generator=Benchmark.grid_2d):
+    file_name = str(tmp_path / 'grid.txt')
+    generator(file_name, size, numpy.random.default_rng(0))
+    with open(file_name) as f:
+        return f.read()
+
+
+def solve(netlist, solver=None):
+    circuit = MNA(None, solver=solver)
+    circuit.Parse_text(netlist)
+    return circuit, circuit.x_matrix()
+
+
+def test_choose_solver():
+    assert Solvers.choose_solver(100, 400, 1) == 'dense'
+    assert Solvers.choose_solver(3000, 1000000, 1) == 'dense'
+    assert Solvers.choose_solver(10000, 40000, 1) == 'superlu'
+    size = Solvers.iterative_size_limit
+    assert Solvers.choose_solver(size, 4 * size, 0) == 'cg'
+    assert Solvers.choose_solver(size, 4 * size, 1) == 'gmres'
+
+
+@pytest.mark.parametrize('generator', [Benchmark.grid_2d, Benchmark.grid_3d, Benchmark.random_graph])
+def test_automatic_iterative_solver_with_voltage_source(tmp_path, monkeypatch, generator):
+    # Circuits with one voltage source which BiCGSTAB does not solve
+    netlist = grid_netlist(tmp_path, 500, generator)
+    _, expected = solve(netlist, 'superlu')
+    monkeypatch.setattr(Solvers, 'iterative_size_limit', 100)
+    circuit, x = solve(netlist)
+    assert circuit.solver_name == 'gmres'
+    assert numpy.allclose(x, expected, rtol=1e-6, atol=1e-9)
+
+
+def test_automatic_iterative_solver_without_voltage_source(tmp_path, monkeypatch):
+    netlist = grid_netlist(tmp_path, 500).replace('V1 1 0 1', 'I1 0 1 1')
+    _, expected = solve(netlist, 'superlu')
+    monkeypatch.setattr(Solvers, 'iterative_size_limit', 100)
+    circuit, x = solve(netlist)
+    assert circuit.solver_name == 'cg'
+    assert numpy.allclose(x, expected, rtol=1e-6, atol=1e-9)
+
+
+# Conjugate gradients only solves circuits without voltage sources
+@pytest.mark.parametrize('name', sorted(set(Solvers.solvers) - {'cg'}))
+def test_solvers_agree(tmp_path, name):
+    netlist = grid_netlist(tmp_path, 200, Benchmark.many_sources)
+    _, expected = solve(netlist, 'dense')
+    _, x = solve(netlist, name)
+    assert numpy.allclose(x, expected, rtol=1e-6, atol=1e-9)
+
+
+def test_iterative_solver_needs_method():
+    with pytest.raises(TypeError):
+        Solvers.IterativeSolver(None, {})
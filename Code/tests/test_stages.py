@@ -0,0 +1,74 @@
+import threading
+import pytest
+
+pytest.importorskip('scipy')
+from MNA import MNA, add_stage_hook, remove_stage_hook
+
+netlist = 'V1 1 0 9\nR1 1 2 10\nR2 2 0 10\n'
+
+
+def solve():
+    circuit = MNA(None)
+    circuit.Parse_text(netlist)
+    circuit.x_matrix()
+    return circuit
+
+
+def test_hook_sees_every_stage():
+    names = []
+
+    def hook(circuit, name, record):
+        names.append(name)
+        assert record['seconds'] >= 0
+
+    add_stage_hook(hook)
+    try:
+        solve()
+    finally:
+        remove_stage_hook(hook)
+    assert {'parse', 'A_matrix', 'z_matrix', 'factorise', 'solve'} <= set(names)
+    solve()
+    assert names.count('parse') == 1
+
+
+def test_hook_removed_while_called():
+    calls = []
+
+    def hook(circuit, name, record):
+        calls.append(name)
+        remove_stage_hook(hook)
+
+    add_stage_hook(hook)
+    solve()
+    assert len(calls) == 1
+
+
+def test_hooks_added_and_removed_from_other_threads():
+    errors = []
+    stop = threading.Event()
+
+    def hook(circuit, name, record):
+        pass
+
+    def churn():
+        while not stop.is_set():
+            add_stage_hook(hook)
+            remove_stage_hook(hook)
+
+    def solve_many():
+        try:
+            for _ in range(200):
+                solve()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=churn) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    try:
+        solve_many()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert errors == []
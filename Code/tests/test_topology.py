@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip('scipy')
+import MNA as solver
+from MNA import MNA, topology_text
+
+
+def problems(netlist):
+    circuit = MNA(None)
+    circuit.Parse_text(netlist)
+    return circuit.Check_topology()
+
+
+@pytest.fixture(params=['disjoint-set', 'scipy'])
+def graph_path(request, monkeypatch):
+    # Small circuits are split into parts with a disjoint-set, large ones with scipy
+    if request.param == 'scipy':
+        monkeypatch.setattr(solver, 'small_graph_limit', 0)
+
+
+def test_valid_circuit(graph_path):
+    assert problems('V1 1 0 9\nR1 1 2 10\nR2 2 0 10\nI1 0 2 1\n') == []
+
+
+def test_floating(graph_path):
+    assert problems('V1 1 0 9\nR1 1 0 10\nR2 2 3 10\nR3 3 4 10\nR4 5 6 1\n') == \
+        [('floating', ['R2', 'R3']), ('floating', ['R4'])]
+
+
+def test_voltage_loop(graph_path):
+    found = problems('V1 1 0 9\nV2 2 1 1\nR1 2 0 10\nV3 2 0 5\n')
+    assert found == [('voltage loop', ['V3', 'V1', 'V2'])]
+    assert topology_text(found) == 'Voltage sources form a loop: V3, V1, V2'
+
+
+def test_parallel_voltage_sources(graph_path):
+    assert problems('V1 1 0 9\nV2 1 0 9\nR1 1 0 10\n') == [('voltage loop', ['V2', 'V1'])]
+
+
+def test_current_cut_set(graph_path):
+    assert problems('V1 1 0 9\nR1 1 0 10\nI1 1 2 1\nR2 2 3 10\nI2 3 0 1\n') == \
+        [('current cut-set', ['I1', 'I2'])]
+
+
+def test_problems_predict_singular_matrix(graph_path):
+    import numpy
+
+    for netlist in ('V1 1 0 9\nR1 1 0 10\nR2 2 3 10\n', 'V1 1 0 9\nV2 1 0 5\nR1 1 0 10\n',
+                    'V1 1 0 9\nR1 1 0 10\nI1 1 2 1\nR2 2 3 10\nI2 3 0 1\n'):
+        assert problems(netlist)
+        circuit = MNA(None, solver='dense')
+        circuit.Parse_text(netlist)
+        with pytest.raises(numpy.linalg.LinAlgError):
+            circuit.x_matrix()
+
+
+def test_topology_text_limit():
+    text = topology_text([('floating', ['R' + str(count) for count in range(15)])], limit=3)
+    assert text == 'Components not connected to ground: R0, R1, R2 and 12 more'